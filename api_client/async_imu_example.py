@@ -1,30 +1,48 @@
-import time
-from src.RemoteControl import RemoteControl
-from concurrent.futures import ThreadPoolExecutor
-
-HOST = '192.168.1.100'  # The smartphone's IP address
-
-
-def main():
-    remote = RemoteControl(HOST)
-
-    with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(remote.get_imu, 10000, True, False)
-        # Do something else
-        print("doing other stuff...")
-        time.sleep(10)
-        print("done doing other stuff")
+import asyncio
+import sys
+from src.AsyncRemoteControl import AsyncRemoteControl
+from src.imu_store import ImuColumnReader
+from src.discovery import READY, discover
+from src.rig import parse_host
+
+
+# The smartphone is the first argument ("host" or "host:port"), the fastest one found on the
+# local network without it. Without a phone, run against the simulator: python -m src.fake_phone
+def find_phone():
+    devices = [device for device in discover() if device.state == READY]
+    if not devices:
+        sys.exit("No smartphone found on the network")
+    return devices[0].host
+
+
+async def do_other_stuff():
+    print("doing other stuff...")
+    await asyncio.sleep(10)
+    print("done doing other stuff")
+
+
+async def main(host):
+    hostname, port = parse_host(host)
+    async with AsyncRemoteControl(hostname, port=port) as remote:
+        # IMU recording runs on the event loop while other coroutines keep going
+        imu_task = asyncio.ensure_future(remote.get_imu(10000, True, False, False))
+        await do_other_stuff()
         # Get result when needed
-        accel_data, gyro_data = future.result()
+        accel_data, gyro_data, magnetic_data = await imu_task
         # Process result somehow (here just file output)
         print("Accelerometer data length: %d" % len(accel_data))
         with open("accel.csv", "w+") as accel:
             accel.writelines(accel_data)
 
+        # Long recordings: rows go to binary column files while they arrive
+        # and are read back memory-mapped, without parsing
+        accel_path, _, _ = await remote.get_imu_to_store(10000, True, False, False, "imu_capture")
+        with ImuColumnReader(accel_path) as accel:
+            first_second = accel.range(accel["timestamp"][0], accel["timestamp"][0] + 10 ** 9)
+            print("Accelerometer samples in the first second: %d" % len(first_second["timestamp"]))
+
     print('EXITED')
-    remote.close()
 
 
 if __name__ == '__main__':
-    main()
-
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else find_phone()))
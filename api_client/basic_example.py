@@ -1,13 +1,24 @@
+import sys
 import time
 from src.RemoteControl import RemoteControl
+from src.discovery import READY, discover
+from src.rig import parse_host
 
-HOST = '192.168.4.245'  # The smartphone's IP address
 
+# The smartphone is the first argument ("host" or "host:port"), the fastest one found on the
+# local network without it. Without a phone, run against the simulator: python -m src.fake_phone
+def find_phone():
+    devices = [device for device in discover() if device.state == READY]
+    if not devices:
+        sys.exit("No smartphone found on the network")
+    return devices[0].host
 
-def main():
+
+def main(host):
     # example class usage
     # constructor starts the connection
-    remote = RemoteControl(HOST)
+    hostname, port = parse_host(host)
+    remote = RemoteControl(hostname, port=port)
     print("Connected")
     
     #print("Magnetometer data length: %d" % len(magnetic_data))
@@ -29,4 +40,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    main(sys.argv[1] if len(sys.argv) > 1 else find_phone())
@@ -0,0 +1,110 @@
+"""
+IMU to video frame alignment benchmark on synthetic recordings.
+
+Run from the api_client directory:
+    python -m benchmarks.alignment --minutes 60
+
+Generates jittered 500 Hz accel/gyro and 100 Hz magnetic data with dropouts
+plus 30 fps frame timestamps, then times the vectorized alignment, resampling
+and gap detection against a per-frame Python loop like the ones analysis
+scripts used to carry.
+"""
+import argparse
+import bisect
+import time
+
+import numpy as np
+
+from src.alignment import CUBIC, LINEAR, align_to_frames, find_gaps, interpolate, resample
+from src.imu_stream import IMU_DTYPE
+
+NS = 1000000000
+START_NS = 1600000000 * NS
+
+
+def synthetic_sensor(rate_hz, duration_s, rng, dropouts=10):
+    """
+    :return: numpy array of IMU_DTYPE with timing jitter and dropouts of 0.1 - 1 s
+    """
+    interval = NS // rate_hz
+    n = int(duration_s * rate_hz)
+    timestamps = START_NS + np.arange(n, dtype=np.int64) * interval
+    timestamps += rng.integers(-interval // 10, interval // 10, n)
+    keep = np.ones(n, dtype=bool)
+    for start in rng.integers(0, n, dropouts):
+        keep[start:start + int(rng.uniform(0.1, 1.0) * rate_hz)] = False
+    samples = np.empty(keep.sum(), dtype=IMU_DTYPE)
+    samples['timestamp'] = timestamps[keep]
+    t = (samples['timestamp'] - START_NS) / NS
+    samples['x'] = np.sin(t)
+    samples['y'] = np.cos(3 * t)
+    samples['z'] = 9.81 + 0.1 * np.sin(7 * t)
+    return samples
+
+
+def naive_align(frame_timestamps, samples):
+    """
+    Per-frame loop with bisect and linear interpolation, the baseline
+    """
+    timestamps = samples['timestamp'].tolist()
+    xs, ys, zs = samples['x'].tolist(), samples['y'].tolist(), samples['z'].tolist()
+    out = []
+    for t in frame_timestamps.tolist():
+        i = bisect.bisect_left(timestamps, t)
+        if i == 0 or i == len(timestamps):
+            out.append((float('nan'),) * 3)
+            continue
+        t0, t1 = timestamps[i - 1], timestamps[i]
+        s = (t - t0) / (t1 - t0)
+        out.append(tuple(v[i - 1] + s * (v[i] - v[i - 1]) for v in (xs, ys, zs)))
+    return out
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--minutes', type=float, default=60, help='recording length')
+    parser.add_argument('--fps', type=float, default=30, help='video frame rate')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    duration_s = args.minutes * 60
+    accel = synthetic_sensor(500, duration_s, rng)
+    gyro = synthetic_sensor(500, duration_s, rng)
+    magnetic = synthetic_sensor(100, duration_s, rng)
+    frame_interval = NS / args.fps
+    frames = START_NS + np.round(np.arange(int(duration_s * args.fps)) * frame_interval).astype(np.int64)
+    print('%d frames, %d accel, %d gyro, %d magnetic samples' % (len(frames), len(accel), len(gyro), len(magnetic)))
+
+    _, naive_s = timed(naive_align, frames, accel)
+    linear, linear_s = timed(interpolate, accel, frames, LINEAR, np.inf)
+    _, aligned_s = timed(align_to_frames, frames, accel, gyro, magnetic)
+    _, cubic_s = timed(align_to_frames, frames, accel, gyro, magnetic, kind=CUBIC)
+    _, resample_s = timed(resample, {'accel': accel, 'gyro': gyro, 'magnetic': magnetic}, NS // 200)
+    gaps, gaps_s = timed(find_gaps, accel['timestamp'])
+
+    sample = slice(None, None, max(len(frames) // 1000, 1))
+    expected = np.array(naive_align(frames[sample], accel))
+    assert np.allclose(linear[sample], expected, equal_nan=True)
+
+    print('%-40s %10s' % ('operation', 'seconds'))
+    for name, seconds in (
+        ('naive loop, accel -> frames (linear)', naive_s),
+        ('vectorized, accel -> frames (linear)', linear_s),
+        ('align_to_frames, 3 sensors (linear)', aligned_s),
+        ('align_to_frames, 3 sensors (cubic)', cubic_s),
+        ('resample, 3 sensors to 200 Hz (linear)', resample_s),
+        ('find_gaps, accel (%d gaps)' % len(gaps), gaps_s),
+    ):
+        print('%-40s %10.4f' % (name, seconds))
+    print('speedup over the naive loop: %.0fx' % (naive_s / linear_s))
+
+
+if __name__ == '__main__':
+    main()
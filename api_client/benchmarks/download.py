@@ -0,0 +1,74 @@
+"""
+Video download benchmark against a local fake phone server.
+
+Run from the api_client directory:
+    python -m benchmarks.download --size-mb 1024
+
+The server runs in a separate process, so the reported CPU time is the
+client's own cost of receiving and writing the video.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+from src.RemoteControl import BUFFER_SIZE, RemoteControl
+from src.fake_phone import FakePhoneServer
+
+MIB = 1024 * 1024
+DEFAULT_CHUNK_SIZES = [BUFFER_SIZE, MIB, 4 * MIB, 16 * MIB]
+
+
+def _serve(video_size, address_queue, stop_event):
+    with FakePhoneServer(video_size=video_size) as server:
+        address_queue.put(server.address)
+        stop_event.wait()
+
+
+def run_download(address, chunk_size):
+    """
+    Downloads one video from the server at address
+    :return: Tuple (MB/s, client CPU seconds per GB)
+    """
+    remote = RemoteControl(address[0], chunk_size=chunk_size, port=address[1])
+    try:
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        filename = remote.get_video(want_progress_bar=False)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+    finally:
+        remote.close()
+    size = os.path.getsize(filename)
+    os.remove(filename)
+    return size / MIB / wall, cpu / (size / 1024 ** 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size-mb', type=int, default=512, help='video size in MiB')
+    parser.add_argument('--repeat', type=int, default=3, help='downloads per chunk size')
+    parser.add_argument('--chunk-kb', type=int, nargs='*',
+                        help='chunk sizes in KiB (default: %s)' % [c // 1024 for c in DEFAULT_CHUNK_SIZES])
+    args = parser.parse_args()
+    chunk_sizes = [c * 1024 for c in args.chunk_kb] if args.chunk_kb else DEFAULT_CHUNK_SIZES
+
+    address_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(args.size_mb * MIB, address_queue, stop_event))
+    server.start()
+    try:
+        address = address_queue.get(timeout=10)
+        print('%12s %10s %12s' % ('chunk', 'MB/s', 'CPU s/GB'))
+        for chunk_size in chunk_sizes:
+            results = [run_download(address, chunk_size) for _ in range(args.repeat)]
+            rate = max(r[0] for r in results)
+            cpu = min(r[1] for r in results)
+            print('%10d K %10.1f %12.3f' % (chunk_size // 1024, rate, cpu))
+    finally:
+        stop_event.set()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+RPC framing benchmark: line protocol against binary frames, sequential against pipelined requests.
+
+Run from the api_client directory:
+    python -m benchmarks.framing --seconds 60
+
+The fake phone server runs in a separate process. Reports the client CPU time
+spent receiving and decoding an IMU recording of the given length in both
+framings, and the time of a series of small requests sent one by one and
+pipelined.
+"""
+import argparse
+import multiprocessing
+import time
+
+from src.RemoteControl import RemoteControl
+from src.fake_phone import FakePhoneServer
+from src.framing import BINARY, TEXT
+
+IMU_RATE_HZ = 500
+
+
+def _serve(address_queue, stop_event):
+    with FakePhoneServer(imu_rate_hz=IMU_RATE_HZ, binary_framing=True) as server:
+        address_queue.put(server.address)
+        stop_event.wait()
+
+
+def time_imu(address, framing, seconds, repeat):
+    """
+    :return: Tuple (best wall seconds, best client CPU seconds, rows per sensor)
+    """
+    remote = RemoteControl(address[0], port=address[1], framing=framing)
+    try:
+        walls, cpus = [], []
+        for _ in range(repeat):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            accel, gyro, _ = remote.get_imu_arrays(int(seconds * 1000), True, True, False)
+            cpus.append(time.process_time() - cpu_start)
+            walls.append(time.perf_counter() - wall_start)
+        return min(walls), min(cpus), len(accel)
+    finally:
+        remote.close()
+
+
+def time_requests(address, framing, n_requests, pipelined):
+    """
+    :return: (float) seconds for n_requests start/stop video pairs
+    """
+    remote = RemoteControl(address[0], port=address[1], framing=framing)
+    try:
+        start = time.perf_counter()
+        if pipelined:
+            pipeline = remote.pipeline()
+            for _ in range(n_requests):
+                pipeline.start_video().stop_video()
+            pipeline.execute()
+        else:
+            for _ in range(n_requests):
+                remote.start_video()
+                remote.stop_video()
+        return time.perf_counter() - start
+    finally:
+        remote.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=60, help='IMU recording length')
+    parser.add_argument('--requests', type=int, default=500, help='start/stop pairs')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    address_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(address_queue, stop_event))
+    server.start()
+    try:
+        address = address_queue.get(timeout=10)
+        print('%-28s %10s %12s' % ('IMU, 2 sensors', 'wall s', 'client CPU s'))
+        for name, framing in (('line protocol', TEXT), ('binary frames', BINARY)):
+            wall, cpu, rows = time_imu(address, framing, args.seconds, args.repeat)
+            print('%-28s %10.3f %12.3f' % ('%s (%d rows)' % (name, rows), wall, cpu))
+
+        print('%-28s %10s %12s' % ('%d start/stop pairs' % args.requests, 'wall s', 'requests/s'))
+        for name, framing, pipelined in (
+            ('line protocol, sequential', TEXT, False),
+            ('line protocol, pipelined', TEXT, True),
+            ('binary frames, sequential', BINARY, False),
+            ('binary frames, pipelined', BINARY, True),
+        ):
+            seconds = min(time_requests(address, framing, args.requests, pipelined) for _ in range(args.repeat))
+            print('%-28s %10.3f %12.0f' % (name, seconds, 2 * args.requests / seconds))
+    finally:
+        stop_event.set()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
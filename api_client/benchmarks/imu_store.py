@@ -0,0 +1,103 @@
+"""
+IMU capture reload benchmark: csv text against the column store.
+
+Run from the api_client directory:
+    python -m benchmarks.imu_store --minutes 60
+
+Writes an hour of synthetic 500 Hz accelerometer data as a RawSensorInfo csv
+and as a column store, then times loading everything and a one-second
+time-range query from each.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.imu_store import ImuColumnReader, ImuColumnWriter
+from src.imu_stream import IMU_DTYPE, parse_imu_csv
+
+NS = 1000000000
+START_NS = 1600000000 * NS
+RATE_HZ = 500
+
+
+def synthetic_rows(duration_s, rng):
+    rows = np.empty(int(duration_s * RATE_HZ), dtype=IMU_DTYPE)
+    rows['timestamp'] = START_NS + np.arange(len(rows), dtype=np.int64) * (NS // RATE_HZ)
+    for axis in 'xyz':
+        rows[axis] = rng.normal(0, 1, len(rows)).round(4)
+    return rows
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def write_store(path, rows):
+    with ImuColumnWriter(path) as writer:
+        # appended in network-sized blocks, as while receiving a recording
+        for start in range(0, len(rows), 4096):
+            writer.append(rows[start:start + 4096])
+
+
+def load_csv(path):
+    with open(path, 'rb') as f:
+        return parse_imu_csv(f.read())
+
+
+def query_csv(path, start_ns, end_ns):
+    rows = load_csv(path)
+    return rows[(rows['timestamp'] >= start_ns) & (rows['timestamp'] < end_ns)]
+
+
+def load_store(path):
+    with ImuColumnReader(path) as reader:
+        return reader.to_array()
+
+
+def query_store(path, start_ns, end_ns):
+    with ImuColumnReader(path) as reader:
+        return reader.to_array(start_ns, end_ns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--minutes', type=float, default=60, help='recording length')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.minutes * 60, np.random.default_rng(args.seed))
+    directory = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(directory, 'accel.csv')
+        with open(csv_path, 'w') as f:
+            for x, y, z, timestamp in rows.tolist():
+                f.write('%s,%s,%s,%d\n' % (x, y, z, timestamp))
+        store_path = os.path.join(directory, 'accel')
+        _, write_s = timed(write_store, store_path, rows)
+
+        middle = int(rows['timestamp'][len(rows) // 2])
+        loaded_csv, load_csv_s = timed(load_csv, csv_path)
+        loaded_store, load_store_s = timed(load_store, store_path)
+        queried_csv, query_csv_s = timed(query_csv, csv_path, middle, middle + NS)
+        queried_store, query_store_s = timed(query_store, store_path, middle, middle + NS)
+        assert np.array_equal(loaded_csv, loaded_store) and np.array_equal(queried_csv, queried_store)
+
+        print('%d rows, csv %.1f MB, store %.1f MB (written in %.3f s)' % (
+            len(rows), os.path.getsize(csv_path) / 1e6,
+            sum(e.stat().st_size for e in os.scandir(store_path)) / 1e6, write_s,
+        ))
+        print('%-28s %10s %10s' % ('operation', 'csv s', 'store s'))
+        print('%-28s %10.4f %10.4f' % ('load everything', load_csv_s, load_store_s))
+        print('%-28s %10.4f %10.4f' % ('one second time range', query_csv_s, query_store_s))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
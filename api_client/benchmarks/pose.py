@@ -0,0 +1,102 @@
+"""
+Pose estimation speed/accuracy benchmark: fast modes against full mode.
+
+Run from the api_client directory (needs opencv-python and mediapipe):
+    python -m benchmarks.pose path/to/video.mp4 [more videos]
+
+Runs every video through the pipeline in full mode (every frame at full
+resolution), which is the reference, then through each fast configuration.
+Reports throughput, and for each configuration the landmark error against
+the reference: mean distance of visible landmarks in normalized image
+coordinates, the share of frames with all visible landmarks within
+PCK_THRESHOLD, and how often both modes agree on whether a pose is present.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from src.pose_pipeline import FAST_MAX_SIDE, FAST_TARGET_FPS, PoseSettings, load_landmarks, process_video
+
+# landmarks the reference model sees with at least this visibility are compared
+VISIBILITY_THRESHOLD = 0.5
+PCK_THRESHOLD = 0.02
+
+
+def configurations(model_complexity):
+    return (
+        ('full', PoseSettings(model_complexity)),
+        ('downscaled to %d' % FAST_MAX_SIDE, PoseSettings(model_complexity, max_side=FAST_MAX_SIDE)),
+        ('%g fps' % FAST_TARGET_FPS, PoseSettings(model_complexity, target_fps=FAST_TARGET_FPS)),
+        ('%g fps, ROI, %d' % (FAST_TARGET_FPS, FAST_MAX_SIDE), PoseSettings.fast(model_complexity)),
+        ('%g fps, ROI, %d, lite model' % (FAST_TARGET_FPS, FAST_MAX_SIDE), PoseSettings.fast(0)),
+    )
+
+
+def compare(reference, candidate):
+    """
+    :return: Tuple (distances of the compared landmarks, per-frame PCK hits, per-frame detection agreement)
+    """
+    ref, cand = reference['landmarks'], candidate['landmarks']
+    n = min(len(ref), len(cand))
+    ref, cand = ref[:n], cand[:n]
+    ref_found = ~np.isnan(ref).any(axis=(1, 2))
+    cand_found = ~np.isnan(cand).any(axis=(1, 2))
+    both = ref_found & cand_found
+    distances = np.hypot(cand[both, :, 0] - ref[both, :, 0], cand[both, :, 1] - ref[both, :, 1])
+    visible = ref[both, :, 3] >= VISIBILITY_THRESHOLD
+    masked = np.where(visible, distances, 0.0)
+    return distances[visible], (masked <= PCK_THRESHOLD).all(axis=1), ref_found == cand_found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('videos', nargs='+', help='sample videos')
+    parser.add_argument('--model-complexity', type=int, default=2, choices=(0, 1, 2), help='reference model')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='pose-bench-')
+    try:
+        rows = []
+        outputs = {}
+        for name, settings in configurations(args.model_complexity):
+            frames = analyzed = 0
+            wall_s = 0.0
+            for i, video in enumerate(args.videos):
+                output = os.path.join(work_dir, '%s-%d.npz' % (len(rows), i))
+                result = process_video(video, output, settings, force=True)
+                frames += result['frames']
+                analyzed += result['analyzed']
+                wall_s += result['wall_s']
+                outputs[name, i] = load_landmarks(output)
+            rows.append((name, frames, analyzed, wall_s))
+
+        reference_name, _, _, reference_s = rows[0]
+        print('%-32s %8s %9s %8s %10s %8s %8s' % (
+            'mode', 'fps', 'analysed', 'speedup', 'mean err', 'PCK', 'agree'))
+        for name, frames, analyzed, wall_s in rows:
+            distances, hits, agreement = [], [], []
+            for i in range(len(args.videos)):
+                d, h, a = compare(outputs[reference_name, i], outputs[name, i])
+                distances.append(d)
+                hits.append(h)
+                agreement.append(a)
+            distances = np.concatenate(distances)
+            hits = np.concatenate(hits)
+            agreement = np.concatenate(agreement)
+            print('%-32s %8.1f %8.0f%% %7.1fx %10.4f %7.1f%% %7.1f%%' % (
+                name, frames / wall_s if wall_s else 0.0, 100.0 * analyzed / max(frames, 1),
+                reference_s / wall_s if wall_s else 0.0,
+                distances.mean() if len(distances) else float('nan'),
+                100.0 * hits.mean() if len(hits) else float('nan'),
+                100.0 * agreement.mean() if len(agreement) else float('nan'),
+            ))
+        print('error in normalized coordinates, PCK at %g, agree: pose found by both or neither' % PCK_THRESHOLD)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
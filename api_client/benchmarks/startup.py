@@ -0,0 +1,110 @@
+"""
+Startup benchmark: import time and memory of the backend, the client and the vision stack.
+
+Run from the api_client directory:
+    python -m benchmarks.startup --repeat 5
+
+Every module is imported in a fresh interpreter. Reports the best import wall
+time, the peak RSS of the interpreter afterwards, which heavy packages the
+import pulled in, and its slowest direct imports in one run (python -X importtime).
+Modules that can't be imported here (e.g. cv2 or mediapipe not installed)
+are reported as such. main.py is imported with VIDEO_DIR set to a temporary
+directory, since the static file mount needs it to exist.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Capture only: backend and client. Vision: what pose estimation and the preview load on first use
+MODULES = ('main', 'src.RemoteControl', 'src.pose_pipeline', 'cv2', 'mediapipe')
+HEAVY_PACKAGES = ('cv2', 'mediapipe', 'jax', 'tensorflow', 'matplotlib', 'numpy', 'requests')
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    peak_mb = peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+except ImportError:
+    peak_mb = None
+print(json.dumps({
+    'seconds': seconds,
+    'peak_rss_mb': peak_mb,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def run_child(module, env, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD % (module, HEAVY_PACKAGES)]
+    return subprocess.run(command, capture_output=True, text=True, env=env)
+
+
+def slowest_imports(stderr, module, count):
+    """
+    :return: list of Tuple (cumulative seconds, name) of the direct imports of module in -X importtime output
+    """
+    # children are listed before their parent, one indentation level deeper
+    entries = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            entries.append((len(name) - len(name.lstrip()), int(cumulative) / 1e6, name.strip()))
+    parent = max(i for i, entry in enumerate(entries) if entry[0] == 1 and entry[2] == module)
+    children = []
+    for depth, seconds, name in reversed(entries[:parent]):
+        if depth == 1:
+            break
+        if depth == 3:
+            children.append((seconds, name))
+    return sorted(children, reverse=True)[:count]
+
+
+def measure(module, env, repeat, top):
+    runs = []
+    for _ in range(repeat):
+        result = run_child(module, env)
+        if result.returncode:
+            error = result.stderr.strip().splitlines()
+            return {'module': module, 'error': error[-1] if error else 'exit code %d' % result.returncode}
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['seconds'])
+    profile = run_child(module, env, importtime=True)
+    return dict(best, module=module, slowest=slowest_imports(profile.stderr, module, top))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('modules', nargs='*', default=MODULES, help='modules to import')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per module, the best is kept')
+    parser.add_argument('--top', type=int, default=5, help='slowest imports listed per module')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as video_dir:
+        env = dict(os.environ, VIDEO_DIR=video_dir)
+        results = [measure(module, env, args.repeat, args.top) for module in args.modules]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%-20s %10s %12s  %s' % ('module', 'import s', 'peak RSS MB', 'heavy packages loaded'))
+    for result in results:
+        if 'error' in result:
+            print('%-20s %s' % (result['module'], result['error']))
+            continue
+        rss = '%12.0f' % result['peak_rss_mb'] if result['peak_rss_mb'] is not None else '%12s' % '-'
+        print('%-20s %10.3f %s  %s' % (result['module'], result['seconds'], rss, ', '.join(result['loaded']) or '-'))
+        for seconds, name in result['slowest']:
+            print('%-20s %10.3f   %s' % ('', seconds, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+"""
+Client and backend benchmark suite against simulated phones, with JSON output.
+
+Run from the api_client directory:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --only download imu
+
+Every simulated phone is a src/fake_phone.py server with a LinkProfile, all
+of them run in one separate process so the client's CPU time is its own.
+Benchmarks:
+  download - RemoteControl video download MB/s on an unshaped and a Wi-Fi-like link
+  imu      - IMU rows decoded per second, offline and received from a phone
+  rig      - start/stop skew and latency across N phones with jittered latency
+  api      - FastAPI endpoint latency under concurrent requests (needs the backend's
+             dependencies; imports main.py with SMARTPHONE_HOST/PORT and VIDEO_DIR
+             pointed at a simulated phone and a temporary directory)
+Results are printed as one JSON document (or written to --output), so runs
+can be compared to track regressions.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from src.RemoteControl import PROPS_PATH, RemoteControl, load_properties
+from src.fake_phone import FakePhoneServer, LinkProfile
+from src.imu_stream import ImuStreamParser
+from src.rig import Rig
+
+MB = 1000000
+BENCHMARKS = ('download', 'imu', 'rig', 'api')
+WIFI = LinkProfile(bandwidth_mb_s=25.0, latency_ms=3.0, latency_jitter_ms=2.0, stall_probability=0.002,
+                   stall_ms=50.0, seed=0)
+
+
+def _serve(configs, address_queue, stop_event):
+    servers = [FakePhoneServer(**config).start() for config in configs]
+    try:
+        address_queue.put([server.address for server in servers])
+        stop_event.wait()
+    finally:
+        for server in servers:
+            server.stop()
+
+
+class SimulatedPhones:
+    """
+    Fake phone servers in a child process, one per config dict (FakePhoneServer arguments)
+    """
+
+    def __init__(self, *configs):
+        self.configs = configs
+        self.addresses = None
+        self._stop = multiprocessing.Event()
+        self._process = None
+
+    def __enter__(self):
+        address_queue = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_serve, args=(self.configs, address_queue, self._stop))
+        self._process.start()
+        self.addresses = address_queue.get(timeout=10)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._process.join()
+
+
+def percentiles(values):
+    """
+    :return: dict with count, mean, p50, p95, p99 and max of values
+    """
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def at(q):
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': at(0.50),
+        'p95': at(0.95),
+        'p99': at(0.99),
+        'max': ordered[-1],
+    }
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def bench_download(args):
+    results = []
+    size = int(args.video_mb * MB)
+    for name, link in (('unshaped', None), ('wifi', WIFI)):
+        with SimulatedPhones({'video_size': size, 'link': link}) as phones:
+            host, port = phones.addresses[0]
+            runs = []
+            for _ in range(args.repeat):
+                with tempfile.TemporaryDirectory() as directory:
+                    remote = RemoteControl(host, port=port)
+                    try:
+                        wall_start = time.perf_counter()
+                        cpu_start = time.process_time()
+                        remote.get_video(False, dest=directory)
+                        runs.append((time.perf_counter() - wall_start, time.process_time() - cpu_start))
+                    finally:
+                        remote.close()
+            wall, cpu = min(runs)
+            results.append({
+                'link': name,
+                'profile': link.as_dict() if link else None,
+                'bytes': size,
+                'mb_s': size / MB / wall,
+                'client_cpu_s_per_gb': cpu / (size / 1e9),
+            })
+            log('download %-8s %8.1f MB/s' % (name, results[-1]['mb_s']))
+    return results
+
+
+def _imu_payload(rows, rate_hz=500):
+    period_ns = 1000000000 // rate_hz
+    lines = ['%s,%s,%s,%d\n' % (0.01 * (i % 100), -0.02 * (i % 50), 9.81, i * period_ns) for i in range(rows)]
+    text = ''.join(lines)
+    return ('accel.csv\n%ssensor_end\ngyro.csv\n%ssensor_end\nend\n' % (text, text)).encode()
+
+
+def bench_imu(args):
+    props = load_properties(PROPS_PATH)
+    payload = _imu_payload(args.imu_rows)
+    runs = []
+    for _ in range(args.repeat):
+        parser = ImuStreamParser(props['SENSOR_END_MARKER'], props['CHUNK_END_DELIMITER'])
+        start = time.perf_counter()
+        for offset in range(0, len(payload), 256 * 1024):
+            parser.feed(payload[offset:offset + 256 * 1024])
+        runs.append(time.perf_counter() - start)
+    parse_s = min(runs)
+
+    rate_hz = 500
+    duration_ms = args.imu_rows * 1000 // rate_hz
+    results = {'rows_per_sensor': args.imu_rows, 'parse_rows_s': 2 * args.imu_rows / parse_s, 'receive': {}}
+    with SimulatedPhones({'imu_rate_hz': rate_hz, 'binary_framing': True}) as phones:
+        host, port = phones.addresses[0]
+        for framing in ('text', 'binary'):
+            remote = RemoteControl(host, port=port, framing=framing)
+            try:
+                runs = []
+                for _ in range(args.repeat):
+                    wall_start = time.perf_counter()
+                    cpu_start = time.process_time()
+                    remote.get_imu_arrays(duration_ms, True, True, False)
+                    runs.append((time.perf_counter() - wall_start, time.process_time() - cpu_start))
+                wall, cpu = min(runs)
+                results['receive'][remote.framing.name] = {
+                    'rows_s': 2 * args.imu_rows / wall,
+                    'rows_per_client_cpu_s': 2 * args.imu_rows / cpu if cpu else None,
+                }
+            finally:
+                remote.close()
+    log('imu parse %.0f rows/s' % results['parse_rows_s'])
+    return results
+
+
+def bench_rig(args):
+    configs = [
+        {'link': LinkProfile(latency_ms=2.0, latency_jitter_ms=args.jitter_ms, seed=i)} for i in range(args.devices)
+    ]
+
+    async def rounds(hosts):
+        start_skew, stop_skew, start_spread, latency = [], [], [], []
+        async with Rig(hosts) as rig:
+            for _ in range(args.rounds):
+                await rig.start_video()
+                await rig.stop_video()
+                start_skew.append(rig.metrics['start']['skew_ns'] / 1e6)
+                start_spread.append(rig.metrics['start']['response_spread_ns'] / 1e6)
+                stop_skew.append(rig.metrics['stop']['skew_ns'] / 1e6)
+                latency.extend(ns / 1e6 for ns in rig.metrics['start']['latency_ns'].values())
+        return {
+            'devices': len(hosts),
+            'rounds': args.rounds,
+            'latency_jitter_ms': args.jitter_ms,
+            'start_skew_ms': percentiles(start_skew),
+            'start_response_spread_ms': percentiles(start_spread),
+            'stop_skew_ms': percentiles(stop_skew),
+            'start_latency_ms': percentiles(latency),
+        }
+
+    with SimulatedPhones(*configs) as phones:
+        result = asyncio.run(rounds(['%s:%d' % address for address in phones.addresses]))
+    log('rig start skew p95 %.3f ms over %d devices' % (result['start_skew_ms']['p95'], args.devices))
+    return result
+
+
+def bench_api(args):
+    work_dir = tempfile.mkdtemp(prefix='bench-api-')
+    try:
+        with SimulatedPhones({'video_size': MB}) as phones:
+            host, port = phones.addresses[0]
+            os.environ['SMARTPHONE_HOST'] = host
+            os.environ['SMARTPHONE_PORT'] = str(port)
+            os.environ['VIDEO_DIR'] = work_dir
+            import main
+            from fastapi.testclient import TestClient
+
+            client = TestClient(main.app)
+            save_path = os.path.join(work_dir, 'data')
+            session_dir = os.path.join(save_path, 'bench')
+            os.makedirs(session_dir)
+            with open(os.path.join(session_dir, 'p1_walk.mp4'), 'wb') as f:
+                f.write(os.urandom(4 * MB))
+            video_query = {'root_path': save_path, 'session_id': 'bench', 'video_name': 'p1_walk.mp4'}
+            requests = (
+                ('GET /config', lambda: client.get('/config')),
+                ('GET /list-videos', lambda: client.get('/list-videos', params={
+                    'session_id': 'bench', 'save_path': save_path})),
+                ('GET /video-info', lambda: client.get('/video-info', params=video_query)),
+                ('GET /videos range', lambda: client.get('/videos', params=video_query, headers={
+                    'range': 'bytes=1000000-1999999'})),
+            )
+            latencies = dict((name, []) for name, _ in requests)
+            errors = dict((name, 0) for name, _ in requests)
+            lock = threading.Lock()
+
+            def worker():
+                for _ in range(args.api_requests):
+                    for name, request in requests:
+                        start = time.perf_counter()
+                        response = request()
+                        elapsed = (time.perf_counter() - start) * 1000
+                        with lock:
+                            latencies[name].append(elapsed)
+                            errors[name] += response.status_code >= 400
+
+            start = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall_s = time.perf_counter() - start
+
+            # recording round trips go through the phone, which serves one request at a time
+            recording = []
+            for i in range(args.rounds):
+                start = time.perf_counter()
+                client.post('/start-recording', json={'session_id': 'rec%d' % i})
+                client.post('/stop-recording', json={'session_id': 'rec%d' % i, 'name': 'p1_walk.mp4',
+                                                     'save_path': save_path})
+                recording.append((time.perf_counter() - start) * 1000)
+            main.jobs.shutdown(wait=True)
+            main.pool.close()
+
+        total = sum(len(values) for values in latencies.values())
+        result = {
+            'concurrency': args.concurrency,
+            'requests': total,
+            'requests_s': total / wall_s,
+            'endpoints': dict(
+                (name, dict(percentiles(values), errors=errors[name])) for name, values in latencies.items()
+            ),
+            'start_stop_recording_ms': percentiles(recording),
+        }
+        log('api %.0f requests/s with %d clients' % (result['requests_s'], args.concurrency))
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def metadata():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, help='benchmarks to run, all by default')
+    parser.add_argument('--output', help='JSON results file, stdout by default')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, the best is kept')
+    parser.add_argument('--video-mb', type=float, default=256, help='downloaded video size')
+    parser.add_argument('--imu-rows', type=int, default=100000, help='IMU rows per sensor')
+    parser.add_argument('--devices', type=int, default=8, help='simulated phones of the rig benchmark')
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help='random response delay of each phone')
+    parser.add_argument('--rounds', type=int, default=20, help='start/stop rounds')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent API clients')
+    parser.add_argument('--api-requests', type=int, default=50, help='request mixes per API client')
+    args = parser.parse_args()
+
+    results = {'meta': metadata(), 'config': vars(args)}
+    for name in args.only or BENCHMARKS:
+        results[name] = globals()['bench_' + name](args)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
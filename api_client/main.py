@@ -1,19 +1,35 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from src.catalog import Catalog, participant_id
+from src.connection_pool import ConnectionPool, DeviceBusyError
+from src.discovery import DeviceRegistry
+from src.jobs import DONE, FAILED, JobManager, QueueFullError
+from src.media import MediaCache, ffmpeg_available
+from src.metrics import DURATION_BUCKETS, THROUGHPUT_BUCKETS, Registry, trace
+from src.preview import LivePreview
 from src.RemoteControl import RemoteControl
+from src.resilience import CircuitOpenError
+from src.resumable_download import JOURNAL_SUFFIX, PART_SUFFIX
+from src.sinks import atomic_file, reserve_path, reserved_tmp_path
+from src.video_meta import VideoMetadataCache
+from src.zip_stream import ZipEntry, ZipStream
 from typing import Optional
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import threading
+import time
 import urllib.parse
-import requests
 import os
-import shutil
 from datetime import datetime
-import uuid
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 import csv
-import cv2
 
 app = FastAPI()
 
@@ -25,10 +41,125 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-HOST = os.getenv("SMARTPHONE_HOST", "192.168.4.240")
+# Smartphone to record with. Unset: the fastest phone found on the network (see src/discovery.py)
+HOST = os.getenv("SMARTPHONE_HOST") or None
+# RPC port of the smartphones, RPC_PORT of the server properties if unset (e.g. set for src/fake_phone.py)
+PORT = int(os.getenv("SMARTPHONE_PORT", "0")) or None
+# Network scanned for smartphones, e.g. 192.168.4.0/24. Unset: the /24 of the interface reaching the LAN
+DISCOVERY_SUBNET = os.getenv("DISCOVERY_SUBNET") or None
+# Seconds between network scans
+DISCOVERY_INTERVAL_S = 60
+# Directory served under /videos. Save and root paths given by clients have to be inside it or SAVE_ROOTS
+VIDEO_DIR = os.getenv("VIDEO_DIR", "C:/Videos/Test Video Data")
+# Other directories clients may save to, e.g. a NAS share, separated by os.pathsep (";" on Windows)
+SAVE_ROOTS = [VIDEO_DIR] + [root for root in os.getenv("EXTRA_SAVE_ROOTS", "").split(os.pathsep) if root]
+# Save paths whose catalog and media cache are kept open, least recently used are closed first
+MAX_OPEN_SAVE_PATHS = 16
+# Seconds between sweeps closing idle smartphone connections
+POOL_EVICT_INTERVAL_S = 30
 
-# In‐memory store for active sessions
-sessions: dict[str, RemoteControl] = {}
+# Seconds /start-recording waits for a smartphone that is busy with a download
+DEVICE_BUSY_WAIT_S = 2
+# Seconds between progress checks of a job's event stream
+JOB_EVENTS_INTERVAL_S = 0.5
+# Read size of video responses, large blocks keep per-chunk overhead low while seeking
+VIDEO_RESPONSE_CHUNK_SIZE = 1024 * 1024
+# Video file, stream URL or camera index shown by the live preview. The phone
+# doesn't stream its camera yet, so this is a stand-in until it does
+PREVIEW_SOURCE = os.getenv("PREVIEW_SOURCE")
+# Seconds a preview viewer waits for a frame before checking the preview is still running
+PREVIEW_FRAME_TIMEOUT_S = 2.0
+# ffmpeg processes generating review proxies, posters and sprites at a time, kept low so capture isn't starved
+MEDIA_WORKERS = 1
+# Videos waiting for media processing, more are processed on their first request instead
+MEDIA_MAX_QUEUED = 256
+# Left out of session exports: the grouped view and index /end-session writes, unfinished downloads
+EXPORT_SKIPPED_NAMES = ("grouped_by_participant", "file_index.csv")
+EXPORT_SKIPPED_SUFFIXES = (PART_SUFFIX, JOURNAL_SUFFIX)
+# Requests slower than this many seconds are passed to on_slow_request with their timed spans, unset disables it
+SLOW_REQUEST_S = float(os.getenv("SLOW_REQUEST_S", "0")) or None
+
+# Timings and counters served at /metrics
+metrics = Registry()
+http_request_seconds = metrics.histogram(
+    "http_request_seconds", "Time to the response headers of backend requests", ("method", "route", "status")
+)
+connect_seconds = metrics.histogram("smartphone_connect_seconds", "Time to open a connection to a smartphone")
+rpc_seconds = metrics.histogram(
+    "smartphone_rpc_seconds", "Round trip of a smartphone request, from the request to its response", ("operation",)
+)
+rpc_errors = metrics.counter("smartphone_rpc_errors_total", "Failed smartphone requests", ("operation",))
+rpc_retries = metrics.counter(
+    "smartphone_rpc_retries_total", "Smartphone requests repeated after a link failure", ("operation",)
+)
+download_seconds = metrics.histogram(
+    "video_download_seconds", "Time to receive a video from a smartphone", buckets=DURATION_BUCKETS
+)
+download_bytes = metrics.counter("video_download_bytes_total", "Video bytes received from smartphones")
+download_throughput = metrics.histogram(
+    "video_download_bytes_per_second", "Throughput of completed video downloads", buckets=THROUGHPUT_BUCKETS
+)
+download_errors = metrics.counter("video_download_errors_total", "Failed video downloads")
+finalize_seconds = metrics.histogram(
+    "video_finalize_seconds", "Time to close a received video and move it to its final path"
+)
+media_seconds = metrics.histogram(
+    "media_processing_seconds", "Time to generate the proxy, poster and sprite of a video", buckets=DURATION_BUCKETS
+)
+grouping_seconds = metrics.histogram(
+    "session_grouping_seconds", "Time to group a session's videos by participant and write its index",
+    buckets=DURATION_BUCKETS,
+)
+
+def connect(hostname, timeout=None, port=None):
+    with connect_seconds.time():
+        return RemoteControl(hostname, timeout=timeout, port=port)
+
+@contextlib.contextmanager
+def rpc(operation):
+    """
+    Times a smartphone request and counts it as failed if the block raises
+    """
+    try:
+        with rpc_seconds.time(operation=operation):
+            yield
+    except Exception:
+        rpc_errors.inc(operation=operation)
+        raise
+
+def on_slow_request(request: Request, seconds: float, spans: list):
+    """
+    Called with the requests slower than SLOW_REQUEST_S and the spans (name, seconds)
+    timed while serving them. Replace it to send slow requests somewhere else
+    """
+    print(json.dumps({
+        "slow_request": f"{request.method} {request.url.path}",
+        "seconds": round(seconds, 6),
+        "spans": [[name, round(span_seconds, 6)] for name, span_seconds in spans],
+    }))
+
+# Persistent connections to the smartphones, shared by all requests
+pool = ConnectionPool(factory=connect)
+# Background video downloads
+jobs = JobManager()
+# Background proxy/poster/sprite generation, see src/media.py. Disabled without ffmpeg
+media_jobs = JobManager(max_workers=MEDIA_WORKERS, max_queued=MEDIA_MAX_QUEUED) if ffmpeg_available() else None
+# Video path -> its media job. Failed jobs stay, so a broken video isn't retried until restart
+media_pending = {}
+media_lock = threading.Lock()
+# Smartphones whose last video is being stopped or downloaded: a new recording would replace it
+downloading_hosts = set()
+downloads_lock = threading.Lock()
+
+# Smartphones found on the network, served by /config
+devices = DeviceRegistry()
+
+# In‐memory store for active sessions: session_id -> smartphone host
+sessions: dict[str, str] = {}
+# Size, mtime, duration and codec of served videos
+video_metadata = VideoMetadataCache()
+# Shared by all preview viewers, frames are encoded once whoever watches
+preview = LivePreview(PREVIEW_SOURCE) if PREVIEW_SOURCE else None
 
 class StartRequest(BaseModel):
     session_id: str
@@ -51,11 +182,87 @@ class EndSessionRequest(BaseModel):
     save_path: str
     session_id: str
 
-app.mount("/videos", StaticFiles(directory="C:/Videos/Test Video Data"), name="videos")
+app.mount("/videos", StaticFiles(directory=VIDEO_DIR), name="videos")
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    # streamed responses are timed to their headers, their body may take as long as the client wants
+    with trace() as spans:
+        start = time.perf_counter()
+        response = await call_next(request)
+        seconds = time.perf_counter() - start
+    route = request.scope.get("route")
+    http_request_seconds.observe(
+        seconds, method=request.method, route=route.path if route else "unmatched", status=response.status_code
+    )
+    if SLOW_REQUEST_S is not None and seconds > SLOW_REQUEST_S:
+        on_slow_request(request, seconds, spans.spans)
+    return response
+
+async def evict_idle_connections():
+    while True:
+        await asyncio.sleep(POOL_EVICT_INTERVAL_S)
+        await asyncio.get_running_loop().run_in_executor(None, pool.evict_idle)
+
+def held_hosts():
+    """
+    Smartphones the pool is connected to or leases: they serve no other client, a scan would find them busy
+    """
+    return {device["host"] for device in pool.status() if device["connected"] or device["in_use"]}
+
+async def discover_devices():
+    while True:
+        try:
+            await devices.refresh(DISCOVERY_SUBNET, PORT, held=held_hosts)
+        except Exception as e:
+            print(f"Device discovery failed: {e}")
+        await asyncio.sleep(DISCOVERY_INTERVAL_S)
+
+@app.on_event("startup")
+async def start_pool_eviction():
+    asyncio.get_running_loop().create_task(evict_idle_connections())
+
+@app.on_event("startup")
+async def start_discovery():
+    asyncio.get_running_loop().create_task(discover_devices())
+
+@app.on_event("shutdown")
+def close_pool():
+    # running downloads are abandoned, their .mp4 stays in the working directory
+    jobs.shutdown(wait=False)
+    pool.close()
+    if media_jobs is not None:
+        media_jobs.shutdown(wait=False)
+    if preview is not None:
+        preview.close()
+
+def current_host():
+    """
+    :return: SMARTPHONE_HOST, or the fastest ready phone of the registry
+    """
+    if HOST is not None:
+        return HOST
+    device = devices.best()
+    if device is None:
+        raise HTTPException(status_code=503, detail=f"No smartphone found on {devices.subnet or 'the network'} yet")
+    return device.hostname
 
 @app.get("/config")
 def get_config():
-    return {"host": HOST}
+    # host is the phone recordings use, devices the phones found by the last scans
+    best = devices.best()
+    return dict(devices.status(), host=HOST or (best.hostname if best else None))
+
+@app.post("/discover")
+async def discover():
+    # scans now instead of waiting for the next periodic scan
+    await devices.refresh(DISCOVERY_SUBNET, PORT, held=held_hosts)
+    return get_config()
+
+@app.get("/devices")
+def get_devices():
+    # circuit state, response times and timeouts of the smartphones contacted so far
+    return {"devices": pool.status()}
 
 @app.post("/start-recording", response_model=StartResponse)
 def start_recording(req: StartRequest):
@@ -65,48 +272,219 @@ def start_recording(req: StartRequest):
     duration = req.duration or 10.0
     exposure = req.exposure or 100
 
+    host = current_host()
+    with downloads_lock:
+        if host in downloading_hosts:
+            raise HTTPException(status_code=409, detail="Smartphone is busy transferring the previous video")
     try:
-        rc = RemoteControl(HOST)
-        phase, duration, exp_time = rc.start_video()
-        sessions[req.session_id] = rc
+        # a failed request closes the pooled connection, the next one reconnects.
+        # While a download job holds the phone it can't start recording anyway
+        with pool.connection(host, PORT, wait_timeout=DEVICE_BUSY_WAIT_S) as rc, rpc("start_video"):
+            phase, duration, exp_time = rc.start_video()
+        sessions[req.session_id] = host
         return StartResponse(
             session_id=req.session_id,
             duration=duration,
             exposure=exposure,
         )
+    except DeviceBusyError:
+        raise HTTPException(status_code=409, detail="Smartphone is busy transferring the previous video")
+    except CircuitOpenError as e:
+        raise unreachable(e)
     except Exception as e:
-        # ensure no half‐open socket remains
-        rc.close()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/stop-recording")
+def unreachable(error: CircuitOpenError):
+    """
+    503 for a smartphone whose circuit is open, with the seconds until it is tried again
+    """
+    return HTTPException(status_code=503, detail=str(error), headers={"retry-after": str(int(error.retry_in_s) + 1)})
+
+def storage_path(path) -> str:
+    """
+    Resolves a path given by a client, which has to be one of SAVE_ROOTS or inside it:
+    save paths are created, indexed and served, so they can't point anywhere on the disk
+    """
+    resolved = os.path.normcase(os.path.realpath(path))
+    for root in SAVE_ROOTS:
+        root = os.path.normcase(os.path.realpath(root))
+        try:
+            if os.path.commonpath([root, resolved]) == root:
+                return resolved
+        except ValueError:
+            # another drive or share on Windows
+            continue
+    raise HTTPException(status_code=403, detail=f"Path outside of the save roots: {path}")
+
+def get_catalog(save_path):
+    """
+    Video catalog of a save path, see storage_path
+    """
+    return open_catalog(storage_path(save_path))
+
+@functools.lru_cache(maxsize=MAX_OPEN_SAVE_PATHS)
+def open_catalog(save_path):
+    return Catalog(save_path)
+
+def release_download(host):
+    with downloads_lock:
+        downloading_hosts.discard(host)
+
+def download_video(job, host, final_path, save_path, session_id, recorded_at):
+    """
+    Background job: streams the last video from the smartphone straight into final_path,
+    reserved by reserve_path(). The file only appears there once complete, a failed transfer
+    leaves nothing behind and releases the name.
+    Asking for the last video again is safe, so a transfer broken by the link is restarted.
+    The saved video is added to the catalog of save_path.
+    Recording on the smartphone is refused until the job ends, see stop_recording
+    """
+    try:
+        return save_video(job, host, final_path, save_path, session_id, recorded_at)
+    finally:
+        release_download(host)
+
+def save_video(job, host, final_path, save_path, session_id, recorded_at):
+    def receive(rc):
+        job.reset_progress()
+        with rpc("get_video"):
+            data_length, _ = rc.request_video()
+        job.set_total(data_length)
+        start = time.perf_counter()
+        with atomic_file(final_path, reserved_tmp_path(final_path)) as video_file:
+            rc.recv_video(video_file, data_length, job.add_progress)
+            received = time.perf_counter()
+        return data_length, start, received, time.perf_counter()
+
+    try:
+        data_length, start, received, finalized = pool.call(
+            host, receive, PORT, idempotent=True, on_retry=lambda error, delay: rpc_retries.inc(operation="get_video")
+        )
+    except Exception:
+        download_errors.inc()
+        with contextlib.suppress(OSError):
+            os.remove(reserved_tmp_path(final_path))
+        raise
+    download_seconds.observe(received - start)
+    devices.observe_transfer(host, PORT, data_length, received - start)
+    download_bytes.inc(data_length)
+    if received > start:
+        download_throughput.observe(data_length / (received - start))
+    finalize_seconds.observe(finalized - received)
+    get_catalog(save_path).add(session_id, str(final_path), recorded_at)
+    queue_media(str(final_path), save_path)
+    return str(final_path)
+
+def get_media_cache(save_path):
+    """
+    Media cache of a save path, see storage_path
+    """
+    return open_media_cache(storage_path(save_path))
+
+@functools.lru_cache(maxsize=MAX_OPEN_SAVE_PATHS)
+def open_media_cache(save_path):
+    return MediaCache(save_path)
+
+def process_media(job, video_path, save_path):
+    """
+    Background job: generates the proxy, poster and sprite of a saved video
+    """
+    with media_seconds.time():
+        return get_media_cache(save_path).generate(video_path).manifest
+
+def queue_media(video_path, save_path):
+    """
+    Queues media processing of a video unless it is queued, running or failed already
+    :return: the video's media Job, None if media processing is disabled or the queue is full
+    """
+    if media_jobs is None:
+        return None
+    key = os.path.realpath(video_path)
+    with media_lock:
+        job = media_pending.get(key)
+        if job is None or job.state == DONE:
+            try:
+                job = media_jobs.submit(process_media, key, save_path)
+            except QueueFullError:
+                return None
+            media_pending[key] = job
+    return job
+
+@app.post("/stop-recording", status_code=202)
 def stop_recording(req: StopRecordingRequest):
     if req.session_id not in sessions:
         raise HTTPException(status_code=400, detail="Invalid session ID")
 
-    rc = sessions.pop(req.session_id)
+    storage_path(Path(req.save_path) / req.session_id)
+    host = sessions.pop(req.session_id)
+    # from now until the download job ends, so no recording can start in between and replace the video
+    with downloads_lock:
+        downloading_hosts.add(host)
     try:
-        rc.stop_video()
-        original_path = rc.get_video(want_progress_bar=False)
-    finally:
-        rc.close()
+        return queue_download(req, host)
+    except BaseException:
+        release_download(host)
+        raise
+
+def queue_download(req: StopRecordingRequest, host: str):
+    try:
+        with pool.connection(host, PORT) as rc, rpc("stop_video"):
+            rc.stop_video()
+    except CircuitOpenError as e:
+        raise unreachable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     # build unique filename
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    recorded_at = datetime.now()
+    timestamp = recorded_at.strftime("%Y-%m-%d_%H-%M-%S")
     base, _ = os.path.splitext(req.name)
     unique_name = f"{base}_{timestamp}.mp4"
-    # save_path = req.save_path.rstrip("\\/")
-    # final_save_path = os.path.join(save_path, req.session_id)
-    # os.makedirs(final_save_path, exist_ok=True)
-    # final_path = os.path.join(final_save_path, unique_name)
     final_save_path = Path(req.save_path) / req.session_id
     final_save_path.mkdir(parents=True, exist_ok=True)
-    # print(f"Moving video to {final_path}")
-    # shutil.move(original_path, final_path)
-    final_path = final_save_path / unique_name
-    shutil.move(original_path, str(final_path))
+    # reserved now, two stops in the same second would otherwise both pick the free name
+    final_path = reserve_path(final_save_path / unique_name)
+
+    # the download runs in the background, progress is served by /jobs/{job_id}
+    try:
+        job = jobs.submit(download_video, host, final_path, req.save_path, req.session_id, recorded_at)
+    except QueueFullError as e:
+        os.remove(reserved_tmp_path(final_path))
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "path": final_path}
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": [job.status() for job in jobs.list()]}
 
-    return {"path": final_path}
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.status()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events stream of the job status, one event per change until the job finishes
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+
+    async def generate():
+        version = None
+        while True:
+            status = job.status()
+            if status["version"] != version:
+                version = status["version"]
+                yield f"data: {json.dumps(status)}\n\n"
+            if job.finished:
+                break
+            await asyncio.sleep(JOB_EVENTS_INTERVAL_S)
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
 
 # @app.delete("/delete_video/{filename}")
 # def delete_video(filename: str):
@@ -119,6 +497,7 @@ def stop_recording(req: StopRecordingRequest):
 
 @app.post("/end-session")
 async def end_session(req: EndSessionRequest):
+    storage_path(Path(req.save_path) / req.session_id)
     final_save_path = Path(req.save_path) / req.session_id
     print(f"[DEBUG] Final save path: {final_save_path}")
         
@@ -129,40 +508,123 @@ async def end_session(req: EndSessionRequest):
     if not save_path.exists():
         raise HTTPException(status_code=400, detail=f"Save path not found: {save_path}")
     
-    # Find all files under save_path recursively
-    all_files = list(save_path.rglob("*.mp4"))
-    if not all_files:
-        return {"message": "No video files found."}
-    print(f"Found {len(all_files)} video files in {save_path}")
-    grouped = {}
-    for f in all_files:
-        # Assume filenames like: "subjectID_activity_2025-07-24_15-43-00.mp4"
-        participant_id = f.stem.split("_")[0]
-        grouped.setdefault(participant_id, []).append(f)
-
-    # Create CSV
-    csv_path =  Path(save_path) / "file_index.csv"
-    with open(csv_path, mode="w", newline="") as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["participant_id", "file_path"])
-        for pid, files in grouped.items():
-            for file in files:
-                writer.writerow([pid, str(file)])
-
-    # Move files into folders by participant
+    # Group the session's videos by participant from the catalog,
+    # the grouped view links to the videos instead of copying them
     grouped_dir =  Path(save_path) / "grouped_by_participant"
-    grouped_dir.mkdir(exist_ok=True)
+    with grouping_seconds.time():
+        grouped = get_catalog(req.save_path).link_grouped(req.session_id, grouped_dir)
+        if not grouped:
+            return {"message": "No video files found."}
+        print(f"Found {sum(len(videos) for videos in grouped.values())} video files in {save_path}")
 
-    for pid, files in grouped.items():
-        participant_folder = grouped_dir / pid
-        participant_folder.mkdir(exist_ok=True)
-        for file in files:
-            dest = participant_folder / file.name
-            if not dest.exists():  # avoid overwriting
-                shutil.copy2(file, dest)
+        # Create CSV
+        csv_path =  Path(save_path) / "file_index.csv"
+        with open(csv_path, mode="w", newline="") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(["participant_id", "file_path"])
+            for pid, videos in grouped.items():
+                for video in videos:
+                    writer.writerow([pid, video["path"]])
 
     return {"message": "Session ended. Files grouped and CSV created.", "csv_path": str(csv_path)}
 
+def export_entries(save_path: str, session_id: str, participants=None):
+    """
+    Files of a session directory as archive entries, under <session_id>/<participant_id>/
+    (the grouping /end-session builds), plus a file_index.csv listing them. Hidden files are skipped
+    :param participants: optional, only files of these participant IDs
+    """
+    session_dir = Path(save_path) / session_id
+    entries = []
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(["participant_id", "file_path"])
+
+    def exported(name):
+        return not name.startswith(".") and not name.endswith(EXPORT_SKIPPED_SUFFIXES)
+
+    for top in sorted(os.scandir(session_dir), key=lambda entry: entry.name):
+        if not exported(top.name) or top.name in EXPORT_SKIPPED_NAMES:
+            continue
+        pid = participant_id(top.name)
+        if participants and pid not in participants:
+            continue
+        paths = [top.path]
+        if top.is_dir():
+            paths = []
+            for directory, dirnames, filenames in os.walk(top.path):
+                dirnames[:] = sorted(name for name in dirnames if exported(name))
+                paths.extend(os.path.join(directory, name) for name in sorted(filenames) if exported(name))
+        for path in paths:
+            name = f"{session_id}/{pid}/{Path(os.path.relpath(path, session_dir)).as_posix()}"
+            entries.append(ZipEntry(name, path))
+            writer.writerow([pid, name])
+
+    # dated like the newest file, so the same files always give the same archive
+    mtime = max((entry.mtime for entry in entries), default=0)
+    entries.append(ZipEntry(f"{session_id}/file_index.csv", data=index.getvalue().encode(), mtime=mtime))
+    return entries
+
+def parse_byte_range(header: str, size: int):
+    """
+    :return: Tuple (start, end) of a single "bytes=" range, end exclusive; None if unsatisfiable
+    :raises ValueError: if the header isn't a single byte range, it is then ignored
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    if start >= end:
+        return None
+    return start, end
+
+@app.get("/export")
+def export_session(
+    request: Request,
+    save_path: str = Query(...),
+    session_id: str = Query(...),
+    participant: Optional[list[str]] = Query(None)
+):
+    """
+    Streams a session as a ZIP archive built on the fly (see ZipStream): videos
+    stored, csv and IMU files deflated, optionally only some participants.
+    Byte ranges with If-Range are supported, so interrupted downloads can resume
+    """
+    session_dir = Path(storage_path(Path(save_path) / session_id))
+    if not session_dir.is_dir():
+        raise HTTPException(status_code=404, detail=f"Session path not found: {session_dir}")
+    archive = ZipStream(export_entries(save_path, session_id, set(participant or ())))
+    etag = f'"{archive.etag}"'
+    filename = urllib.parse.quote(f"{session_id}.zip")
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "content-disposition": f"attachment; filename*=UTF-8''{filename}",
+    }
+    status_code = 200
+    start, end = 0, archive.size
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_byte_range(range_header, archive.size)
+        except ValueError:
+            byte_range = (0, archive.size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"content-range": f"bytes */{archive.size}"})
+        start, end = byte_range
+        if (start, end) != (0, archive.size):
+            status_code = 206
+            headers["content-range"] = f"bytes {start}-{end - 1}/{archive.size}"
+    headers["content-length"] = str(end - start)
+    return StreamingResponse(
+        archive.iter_bytes(start, end), status_code=status_code, media_type="application/zip", headers=headers
+    )
+
 @app.get("/list-videos")
 def list_videos(
     session_id: str = Query(...),
@@ -172,40 +634,210 @@ def list_videos(
     if not session_path.exists() or not session_path.is_dir():
         raise HTTPException(status_code=404, detail=f"Session path not found: {session_path}")
 
-    # List only .mp4 files (case-insensitive)
-    video_names = [f.name for f in session_path.glob("*.mp4")]
+    video_names = [video["name"] for video in get_catalog(save_path).videos(session_id)]
     return {"videos": video_names}
 
 
+class VideoFileResponse(FileResponse):
+    chunk_size = VIDEO_RESPONSE_CHUNK_SIZE
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """
+    Evaluates the conditional request headers against the current ETag and mtime.
+    If-None-Match takes precedence over If-Modified-Since
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cached_video_metadata(root_path: str, session_id: str, video_name: str):
+    video_path = storage_path(Path(root_path) / session_id / video_name)
+    try:
+        return video_metadata.get(video_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Video not found: {video_path}")
+    except IsADirectoryError:
+        raise HTTPException(status_code=400, detail=f"Requested path is not a file: {video_path}")
+
+def video_media(root_path: str, meta):
+    """
+    :return: Tuple (MediaOutputs or None, media Job or None) of a video. Videos
+    that weren't processed yet are queued
+    """
+    if media_jobs is None:
+        return None, None
+    with media_lock:
+        job = media_pending.get(meta.path)
+    if job is not None and not job.finished:
+        return None, job
+    outputs = get_media_cache(root_path).outputs(meta.path, meta.stat_result)
+    if outputs is None and (job is None or job.state != FAILED):
+        job = queue_media(meta.path, root_path)
+    return outputs, job
+
 @app.get("/videos")
 def get_video(
+    request: Request,
+    root_path: str = Query(...),
+    session_id: str = Query(...),
+    video_name: str = Query(...),
+    variant: str = Query("original", pattern="^(proxy|original)$")
+):
+    """
+    Serves a video with byte-range support (206 Partial Content, If-Range) and
+    ETag/Last-Modified validation. File metadata comes from the cache, so seeking
+    doesn't touch the filesystem before the read itself.
+    variant=proxy serves the low-bitrate proxy, 404 until /media-info reports it ready.
+    A URL always serves the same file, so a player's range requests never mix the two
+    """
+    meta = cached_video_metadata(root_path, session_id, video_name)
+    if variant == "proxy":
+        outputs, _ = video_media(root_path, meta)
+        if outputs is None:
+            raise HTTPException(status_code=404, detail=f"No proxy yet for {video_name}")
+        meta = video_metadata.get(outputs.proxy_path)
+    response = VideoFileResponse(
+        path=meta.path, media_type="video/mp4", stat_result=meta.stat_result, headers={"x-video-variant": variant}
+    )
+    if not_modified(request, response.headers["etag"], meta.mtime):
+        return Response(
+            status_code=304,
+            headers={
+                key: response.headers[key] for key in ("etag", "last-modified", "accept-ranges", "x-video-variant")
+            },
+        )
+    return response
+
+@app.get("/video-info")
+def get_video_info(
     root_path: str = Query(...),
     session_id: str = Query(...),
     video_name: str = Query(...)
 ):
-    video_path = Path(root_path) / session_id / video_name
+    """
+    Size, modification time, duration and codec of a video
+    """
+    return cached_video_metadata(root_path, session_id, video_name).as_dict()
+
+@app.get("/media-info")
+def get_media_info(
+    root_path: str = Query(...),
+    session_id: str = Query(...),
+    video_name: str = Query(...)
+):
+    """
+    Processing state of a video's proxy, poster and sprite, and their manifest once ready
+    (the sprite layout in particular). Requesting it queues unprocessed videos
+    """
+    meta = cached_video_metadata(root_path, session_id, video_name)
+    outputs, job = video_media(root_path, meta)
+    if media_jobs is None:
+        state = "disabled"
+    elif outputs is not None:
+        state = "ready"
+    else:
+        state = job.state if job is not None else "unavailable"
+    return {
+        "state": state,
+        "error": job.error if job is not None and outputs is None else None,
+        "manifest": outputs.manifest if outputs is not None else None,
+    }
+
+def media_file(root_path: str, session_id: str, video_name: str, kind: str):
+    meta = cached_video_metadata(root_path, session_id, video_name)
+    outputs, _ = video_media(root_path, meta)
+    if outputs is None:
+        raise HTTPException(status_code=404, detail=f"No {kind} yet for {video_name}")
+    path = outputs.poster_path if kind == "poster" else outputs.sprite_path
+    # the URL stays the same when a video is replaced, browsers revalidate with the ETag
+    return FileResponse(path, media_type="image/jpeg", headers={"cache-control": "no-cache"})
+
+@app.get("/poster")
+def get_poster(
+    root_path: str = Query(...),
+    session_id: str = Query(...),
+    video_name: str = Query(...)
+):
+    """
+    Poster image of a video, 404 until it is processed
+    """
+    return media_file(root_path, session_id, video_name, "poster")
+
+@app.get("/sprite")
+def get_sprite(
+    root_path: str = Query(...),
+    session_id: str = Query(...),
+    video_name: str = Query(...)
+):
+    """
+    Thumbnails of a video tiled in one image for scrubbing, the layout is in /media-info
+    """
+    return media_file(root_path, session_id, video_name, "sprite")
+
+def get_preview() -> LivePreview:
+    if preview is None:
+        raise HTTPException(status_code=503, detail="No preview source configured, set PREVIEW_SOURCE")
+    return preview
+
+@app.get("/video_feed")
+async def video_feed():
+    """
+    MJPEG live preview. Each part is the newest encoded frame: a viewer that
+    can't keep up skips frames instead of falling behind
+    """
+    live = get_preview()
+
+    async def generate():
+        live.attach()
+        try:
+            seq = 0
+            while True:
+                frame = await live.next_frame(seq, PREVIEW_FRAME_TIMEOUT_S)
+                if frame is None:
+                    live.ensure_running()
+                    continue
+                seq = frame.seq
+                yield (b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame.jpeg + b"\r\n")
+                live.record_sent(frame)
+        finally:
+            live.detach()
+
+    return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame")
+
+@app.get("/preview.jpg")
+async def preview_snapshot():
+    """
+    Newest preview frame as a single JPEG, for clients polling instead of streaming
+    """
+    live = get_preview()
+    live.attach()
     try:
-        video_path = video_path.resolve(strict=True)
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail=f"Video not found: {video_path}")
+        frame = live.latest() or await live.next_frame(0, PREVIEW_FRAME_TIMEOUT_S)
+    finally:
+        live.detach()
+    if frame is None:
+        raise HTTPException(status_code=504, detail=live.error or "No preview frame yet")
+    live.record_sent(frame)
+    return Response(content=frame.jpeg, media_type="image/jpeg", headers={"cache-control": "no-store"})
 
-    if not video_path.is_file():
-        raise HTTPException(status_code=400, detail=f"Requested path is not a file: {video_path}")
+@app.get("/preview/metrics")
+def preview_metrics():
+    """
+    Capture and encode fps, dropped frames, encode time and capture-to-send latency of the live preview
+    """
+    return get_preview().metrics()
 
-    return FileResponse(path=video_path, media_type="video/mp4")
-
-# @app.get("/video_feed") This works for recordings from the webcam,
-# not the smart phone but it is a good first step
-# def video_feed():
-#     def generate():
-#         cap = cv2.VideoCapture(0)  # Or path to smartphone stream
-#         while True:
-#             success, frame = cap.read()
-#             if not success:
-#                 break
-#             _, buffer = cv2.imencode('.jpg', frame)
-#             frame_bytes = buffer.tobytes()
-#             yield (b'--frame\r\n'
-#                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-#     return StreamingResponse(generate(), media_type='multipart/x-mixed-replace; boundary=frame')
\ No newline at end of file
+@app.get("/metrics")
+def get_metrics():
+    """
+    Timings and counters of the backend in the Prometheus text format
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,56 @@
+import argparse
+import os
+
+from src.pose_pipeline import FAST_MAX_SIDE, FAST_TARGET_FPS, MODEL_COMPLEXITY, PoseSettings, run_batch
+
+
+def print_result(result):
+    name = os.path.basename(result['video'])
+    if 'error' in result:
+        print("%s: %s (%s)" % (name, result['status'], result['error']))
+    elif 'frames' in result:
+        print("%s: %d frames (%d analysed), %.1f fps" % (
+            name, result['frames'], result['analyzed'], result['fps'] or 0.0
+        ))
+    else:
+        print("%s: %s" % (name, result['status']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract pose landmarks from all videos of a session")
+    parser.add_argument('session_dir', help="directory with the session's videos")
+    parser.add_argument('--output', help="landmark files directory, <session_dir>/pose by default")
+    parser.add_argument('--workers', type=int, help="worker processes, number of CPUs by default")
+    parser.add_argument('--model-complexity', type=int, default=MODEL_COMPLEXITY, choices=(0, 1, 2))
+    parser.add_argument('--fast', action='store_true',
+                        help="fast mode: --target-fps %g --max-side %d --roi" % (FAST_TARGET_FPS, FAST_MAX_SIDE))
+    parser.add_argument('--target-fps', type=float, help="analysed frames per second, the others are interpolated")
+    parser.add_argument('--max-side', type=int, help="downscale images to this longest side before inference")
+    parser.add_argument('--roi', action='store_true', help="crop images to the region of the previous pose")
+    parser.add_argument('--force', action='store_true', help="reprocess videos that are already done")
+    args = parser.parse_args()
+
+    if args.fast:
+        settings = PoseSettings.fast(args.model_complexity)
+    else:
+        settings = PoseSettings(args.model_complexity)
+    if args.target_fps:
+        settings.target_fps = args.target_fps
+    if args.max_side:
+        settings.max_side = args.max_side
+    settings.roi = settings.roi or args.roi
+
+    report = run_batch(
+        args.session_dir, args.output, args.workers, settings,
+        force=args.force, progress_callback=print_result,
+    )
+    print("processed %d, skipped %d, failed %d videos" % (report['processed'], report['skipped'], report['failed']))
+    if report['frames']:
+        print("%d frames in %.1f s: %.1f fps overall" % (report['frames'], report['wall_s'], report['fps']))
+        for stage, fps in report['stage_fps'].items():
+            if fps:
+                print("  %-10s %8.1f fps per worker" % (stage, fps))
+
+
+if __name__ == '__main__':
+    main()
@@ -283,8 +283,6 @@ import os
 import threading
 import tkinter as tk
 import subprocess
-import cv2
-import mediapipe as mp
 from tkinter import messagebox, scrolledtext, filedialog, ttk
 
 sys.path.append(os.path.abspath('.'))
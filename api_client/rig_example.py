@@ -0,0 +1,31 @@
+import asyncio
+import sys
+from src.discovery import READY, discover
+from src.rig import Rig
+
+
+# The smartphones are the arguments, "host" or "host:port", all phones found on the local network without them.
+# Without phones, run simulators: python -m src.fake_phone --port 7001 (and 7002, ...)
+def find_phones():
+    hosts = [device.host for device in discover() if device.state == READY]
+    if not hosts:
+        sys.exit("No smartphone found on the network")
+    return hosts
+
+
+async def main(hosts):
+    async with Rig(hosts) as rig:
+        for host, phase in (await rig.start_video()).items():
+            print("%s: %s" % (host, phase))
+        print("start skew: %.3f ms" % (rig.metrics['start']['skew_ns'] / 1e6))
+        await asyncio.sleep(5)
+        await rig.stop_video()
+        print("stop skew: %.3f ms" % (rig.metrics['stop']['skew_ns'] / 1e6))
+
+        for host, path in (await rig.download_videos('.')).items():
+            print("%s: %s" % (host, path))
+        print("aggregate throughput: %.1f MB/s" % rig.metrics['download']['aggregate_mb_s'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:] or find_phones()))
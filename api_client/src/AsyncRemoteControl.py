@@ -0,0 +1,302 @@
+import asyncio
+import functools
+import socket
+import time
+
+from .RemoteControl import (
+    CLOCK_REQUEST, PROGRESS_UPDATE_BYTES, PROPS_PATH, SOCKET_RCVBUF_SIZE, SUPPORTED_SERVER_VERSIONS, VIDEO_CHUNK_SIZE,
+    load_properties,
+)
+from .imu_store import ImuStoreBuilder
+from .imu_stream import CsvTextBuilder, ImuArrayBuilder, ImuStreamParser, SENSOR_NAMES
+from .sinks import video_sink
+
+# Default per-operation timeout in seconds
+DEFAULT_TIMEOUT = 30.0
+
+
+class AsyncRemoteControl:
+    """
+    asyncio counterpart of RemoteControl: same requests and protocol, but every
+    call is a coroutine, so one event loop can drive many smartphones at once.
+
+    Every operation is bounded by a timeout and can be cancelled. A request that
+    fails mid-response (timed out, cancelled, cut or garbled) leaves the stream
+    in an unknown state, so the connection is closed and a new one has to be opened.
+    """
+
+    def __init__(self, hostname, port=None, timeout=DEFAULT_TIMEOUT, chunk_size=VIDEO_CHUNK_SIZE,
+                 rcvbuf_size=SOCKET_RCVBUF_SIZE, health=None):
+        """
+        Args:
+            hostname (str): Smartphones hostname (IP address) in the current network
+            port (int): RPC port, defaults to RPC_PORT from the server properties
+            timeout (float): Seconds allowed for connecting and for each response, None waits forever.
+            For get_imu the recording duration is added, for get_video it bounds every read.
+            chunk_size (int): Size of video reads and file writes in bytes
+            rcvbuf_size (int): Requested SO_RCVBUF size in bytes, None keeps the OS default
+            health (DeviceHealth): Optional, response times are reported to it and responses get its
+            adaptive timeout() instead of timeout, which stays the upper bound
+        """
+        self.props = load_properties(PROPS_PATH)
+        self.hostname = hostname
+        self.port = int(port or self.props['RPC_PORT'])
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.rcvbuf_size = rcvbuf_size
+        self.health = health
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    @classmethod
+    async def open(cls, hostname, **kwargs):
+        """
+        Creates a client and connects it, see __init__ for arguments
+        """
+        remote = cls(hostname, **kwargs)
+        await remote.connect()
+        return remote
+
+    async def connect(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.rcvbuf_size:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf_size)
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(
+                asyncio.get_running_loop().sock_connect(sock, (self.hostname, self.port)), self.timeout
+            )
+        except BaseException:
+            sock.close()
+            raise
+        self._reader, self._writer = await asyncio.open_connection(sock=sock, limit=self.chunk_size)
+        # the protocol is strictly request/response, calls on one connection must not interleave.
+        # Created here so it belongs to the running loop
+        self._lock = asyncio.Lock()
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def __aenter__(self):
+        if not self.connected:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start_video(self):
+        """
+        Starts video recording and receives phase and duration info
+        :return: Tuple (phase, average duration, exposure time) - all in nanoseconds
+        """
+        async def start():
+            await self._send_and_get_response_status(self.props['VIDEO_START_REQUEST'])
+            phase_ns = int(await self._readline())
+            avg_duration_ns = float(await self._readline())
+            exposure_time = int(await self._readline())
+            await self._readline()
+            return phase_ns, avg_duration_ns, exposure_time
+
+        return await self._call(start(), self._response_timeout())
+
+    async def stop_video(self):
+        """
+        Stops video recording
+        """
+        async def stop():
+            await self._send_and_get_response_status(self.props['VIDEO_STOP_REQUEST'])
+            while await self._readline() != self.props['CHUNK_END_DELIMITER']:
+                pass
+
+        await self._call(stop(), self._response_timeout())
+
+    async def get_clock(self):
+        """
+        Reads the phone's SENSOR_TIMESTAMP clock, see RemoteControl.get_clock
+        :return: (int) phone time in ns, None if the server doesn't implement the request
+        """
+        async def clock():
+            sent_at = time.perf_counter()
+            self._writer.write((CLOCK_REQUEST + '\n').encode())
+            await self._writer.drain()
+            status = await self._readline()
+            self._observe_round_trip(sent_at)
+            version = await self._readline()
+            if version not in SUPPORTED_SERVER_VERSIONS:
+                await self.close()
+                raise RuntimeError('Unsupported app server version: %s' % version)
+            # the body is the error message if unsupported
+            lines = []
+            line = await self._readline()
+            while line != self.props['CHUNK_END_DELIMITER']:
+                lines.append(line)
+                line = await self._readline()
+            return int(lines[0]) if status == self.props['SUCCESS'] else None
+
+        return await self._call(clock(), self._response_timeout())
+
+    async def get_imu(self, duration_ms, want_accel, want_gyro, want_magnetic):
+        """
+        Request IMU data recording, see RemoteControl.get_imu
+        :return: Tuple (accel_data, gyro_data, magnetic_data) - csv data strings or None
+        """
+        return await self._call(
+            self._recv_imu(duration_ms, want_accel, want_gyro, want_magnetic, CsvTextBuilder),
+            self._imu_timeout(duration_ms)
+        )
+
+    async def get_imu_arrays(self, duration_ms, want_accel, want_gyro, want_magnetic):
+        """
+        Request IMU data recording, see RemoteControl.get_imu_arrays
+        :return: Tuple (accel_data, gyro_data, magnetic_data) - numpy arrays of IMU_DTYPE or None
+        """
+        return await self._call(
+            self._recv_imu(duration_ms, want_accel, want_gyro, want_magnetic, ImuArrayBuilder),
+            self._imu_timeout(duration_ms)
+        )
+
+    async def get_imu_to_store(self, duration_ms, want_accel, want_gyro, want_magnetic, directory):
+        """
+        Request IMU data recording, see RemoteControl.get_imu_to_store
+        :return: Tuple (accel_path, gyro_path, magnetic_path) - column store directories or None
+        """
+        return await self._call(
+            self._recv_imu(
+                duration_ms, want_accel, want_gyro, want_magnetic, functools.partial(ImuStoreBuilder, directory)
+            ),
+            self._imu_timeout(duration_ms)
+        )
+
+    async def get_video(self, progress_callback=None, dest=None):
+        """
+        Receives the last recorded video file and streams it to dest.
+        Writes run in the default executor so the event loop isn't blocked by disk I/O
+        :param progress_callback: (callable) optional, called with the number of bytes
+        received since the previous call, at most once per PROGRESS_UPDATE_BYTES
+        :param dest: where to save the video, see RemoteControl.get_video
+        :return: Saved video's path, or the phone's filename for file object and callable dests
+        """
+        # no overall deadline: the timeout applies to the response header and to each read
+        # of the video, so only stalls abort the transfer
+        return await self._call(self._recv_video(progress_callback, dest), None)
+
+    def _response_timeout(self):
+        """
+        :return: (float) seconds allowed for a response, the device's adaptive timeout if there is a health
+        """
+        if self.timeout is None or self.health is None:
+            return self.timeout
+        return min(self.timeout, self.health.timeout())
+
+    def _imu_timeout(self, duration_ms):
+        timeout = self._response_timeout()
+        return None if timeout is None else timeout + duration_ms / 1000.0
+
+    def _observe_round_trip(self, sent_at):
+        if self.health is not None:
+            self.health.observe_round_trip(time.perf_counter() - sent_at)
+
+    async def _call(self, coro, timeout):
+        if not self.connected:
+            coro.close()
+            raise ConnectionError('Not connected to %s:%d' % (self.hostname, self.port))
+        async with self._lock:
+            if not self.connected:
+                coro.close()
+                raise ConnectionError('Not connected to %s:%d' % (self.hostname, self.port))
+            try:
+                return await asyncio.wait_for(coro, timeout)
+            except BaseException:
+                # timed out, cancelled, cut or garbled: the response may be partially read and the
+                # stream can't be reused. Error responses closed it already
+                await self.close()
+                raise
+
+    async def _recv_imu(self, duration_ms, want_accel, want_gyro, want_magnetic, builder_factory):
+        # the phone answers once it has recorded, not a round trip
+        await self._send_and_get_response_status(
+            'imu?duration=%d&accel=%d&gyro=%d&magnetic=%d' % (
+                duration_ms, int(want_accel), int(want_gyro), int(want_magnetic)
+            ), timed=False
+        )
+        parser = ImuStreamParser(
+            self.props['SENSOR_END_MARKER'], self.props['CHUNK_END_DELIMITER'], builder_factory
+        )
+        while not parser.done:
+            data = await self._reader.read(self.chunk_size)
+            if not data:
+                raise EOFError()
+            parser.feed(data)
+
+        results = parser.results()
+        return tuple(results.get(name) for name in SENSOR_NAMES)
+
+    async def _recv_video(self, progress_callback, dest):
+        async def header():
+            await self._send_and_get_response_status(self.props['GET_VIDEO_REQUEST'])
+            data_length = int(await self._readline())
+            filename = await self._readline()
+            await self._readline()  # Read and discard end marker
+            return data_length, filename
+
+        read_timeout = self._response_timeout()
+        data_length, filename = await asyncio.wait_for(header(), read_timeout)
+
+        loop = asyncio.get_running_loop()
+        recv_len = 0
+        pending = 0
+        with video_sink(dest, filename) as (write, saved_as):
+            while recv_len < data_length:
+                batch = bytearray()
+                # gather up to chunk_size bytes so each executor round trip writes a large block
+                while len(batch) < self.chunk_size and recv_len + len(batch) < data_length:
+                    n_bytes = min(self.chunk_size - len(batch), data_length - recv_len - len(batch))
+                    data = await asyncio.wait_for(self._reader.read(n_bytes), read_timeout)
+                    if not data:
+                        raise EOFError()
+                    batch += data
+                await loop.run_in_executor(None, write, batch)
+                recv_len += len(batch)
+                pending += len(batch)
+                if progress_callback is not None and pending >= PROGRESS_UPDATE_BYTES:
+                    progress_callback(pending)
+                    pending = 0
+        if progress_callback is not None and pending:
+            progress_callback(pending)
+
+        return saved_as
+
+    async def _readline(self):
+        line = await self._reader.readline()
+        if not line:
+            raise EOFError()
+        return line.decode().strip('\n')
+
+    async def _send_and_get_response_status(self, msg, timed=True):
+        sent_at = time.perf_counter()
+        self._writer.write((msg + '\n').encode())
+        await self._writer.drain()
+        status = await self._readline()
+        if timed:
+            self._observe_round_trip(sent_at)
+        version = await self._readline()
+        if version not in SUPPORTED_SERVER_VERSIONS:
+            await self.close()
+            raise RuntimeError('Unsupported app server version: %s' % version)
+        if status == self.props['ERROR']:
+            msg = await self._readline()
+            await self.close()
+            raise RuntimeError(msg)
+        return status == self.props['SUCCESS']
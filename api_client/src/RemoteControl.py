@@ -1,14 +1,60 @@
+import functools
+import os
 import socket
-import sys
-from tqdm import tqdm  # <-- Use tqdm for progress bar
+import time
+
+from .framing import AUTO, BINARY, BINARY_FRAMING_VERSIONS, FRAMING_REQUEST, TEXT, BinaryFraming, SocketReader, \
+    TextFraming
+from .imu_live import DROP_OLDEST, ImuLiveStream, LIVE_WINDOW_MS, RING_CAPACITY
+from .imu_store import ImuStoreBuilder
+from .imu_stream import CsvTextBuilder, ImuArrayBuilder, SENSOR_NAMES
+from .sinks import video_sink
 # from progress.bar import Bar
 
 BUFFER_SIZE = 4096
-PROPS_PATH = '../app/src/main/assets/server_config.properties'
+# Video payloads are received straight into one preallocated buffer of this size
+VIDEO_CHUNK_SIZE = 4 * 1024 * 1024
+# Kernel receive buffer requested for the data socket (the OS may clamp it)
+SOCKET_RCVBUF_SIZE = 8 * 1024 * 1024
+# Seconds each read or write may block before the phone is considered stalled
+IO_TIMEOUT_S = 30.0
+# Progress callbacks are batched, one call per this many received bytes
+PROGRESS_UPDATE_BYTES = 16 * 1024 * 1024
+# Resolved from this file, so the client works from any working directory
+PROPS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'app', 'src', 'main', 'assets', 'server_config.properties'
+)
 SUPPORTED_SERVER_VERSIONS = [
     'v.0.1.1'
-]
-NUM_SENSORS = 3
+] + BINARY_FRAMING_VERSIONS
+# Protocol extensions for resumable/parallel video download (see resumable_download.py).
+# The phone app doesn't implement them yet, servers that do also accept concurrent connections
+VIDEO_INFO_REQUEST = 'video_info'
+VIDEO_RANGE_REQUEST = 'get_video_range?offset=%d&length=%d'
+IMU_REQUEST = 'imu?duration=%d&accel=%d&gyro=%d&magnetic=%d'
+# Protocol extension answered with the phone's SENSOR_TIMESTAMP clock in ns, the clock of IMU rows
+# and video phases (see src/clock_sync.py). Not implemented by the phone app yet either
+CLOCK_REQUEST = 'clock'
+
+
+@functools.lru_cache(maxsize=None)
+def load_properties(filepath, sep='=', comment_char='#'):
+    """
+    Parses a java-style properties file (server_config.properties).
+    Each file is parsed once, later calls return the same (read-only) dict
+    :param filepath: (str) path to the properties file
+    :return: dict of property names to string values
+    """
+    props = {}
+    with open(filepath, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(comment_char):
+                key_value = line.split(sep)
+                key = key_value[0].strip()
+                value = sep.join(key_value[1:]).strip().strip('"')
+                props[key] = value
+    return props
 
 class RemoteControl:
     """
@@ -16,22 +62,78 @@ class RemoteControl:
     running OpenCamera Sensors application
     """
 
-    def __init__(self, hostname, timeout=None):
+    def __init__(self, hostname, timeout=None, chunk_size=VIDEO_CHUNK_SIZE,
+                 rcvbuf_size=SOCKET_RCVBUF_SIZE, port=None, framing=AUTO, io_timeout=IO_TIMEOUT_S):
         """
         Args:
             hostname (str): Smartphones hostname (IP address) in the current network.
             Is displayed in the dialog when starting OpenCamera Sensors on the smartphone.
             timeout (float): Connection timeout in seconds
+            chunk_size (int): Size of the reusable video receive buffer in bytes
+            rcvbuf_size (int): Requested SO_RCVBUF size in bytes, None keeps the OS default
+            port (int): RPC port, defaults to RPC_PORT from the server properties
+            framing (str): AUTO switches to binary frames once a response shows a server version
+            that supports them (the phone app's doesn't, it is never asked), TEXT always uses the
+            line protocol, BINARY switches when connecting and fails if the server can't
+            io_timeout (float): Seconds each read or write may block, None waits forever.
+            IMU requests add their recording duration. A timed out request raises
+            socket.timeout and leaves the stream mid-response, the connection must be closed.
+        A connection that times out raises ConnectionError, other connection failures OSError
         """
         self._load_properties(PROPS_PATH)
+        self.hostname = hostname
+        self.port = int(port or self.props['RPC_PORT'])
+        self._recv_buffer = bytearray(chunk_size)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if rcvbuf_size:
+            # Has to be set before connect() so the TCP window scale is negotiated for it
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf_size)
+        self.io_timeout = io_timeout
+        # seconds from the last timed request to its response status, see _read_status
+        self.last_round_trip_s = None
+        self._sent_at = None
         self.socket.settimeout(timeout)
         try:
-            self.socket.connect((hostname, int(self.props['RPC_PORT'])))
-            self.socket.settimeout(None)
+            self.socket.connect((hostname, self.port))
         except socket.timeout:
-            print("Connection timed out")
-            sys.exit()
+            self.socket.close()
+            raise ConnectionError('Connection to %s:%d timed out' % (hostname, self.port)) from None
+        except OSError:
+            self.socket.close()
+            raise
+        self.socket.settimeout(io_timeout)
+        # one buffered reader for the whole connection, see SocketReader
+        self.reader = SocketReader(self.socket)
+        self.framing = TextFraming(self.props)
+        # version line of the last response
+        self.server_version = None
+        # AUTO waits for the first response: asking a server without the extension costs a round trip
+        self._negotiate_pending = framing == AUTO
+        if framing == BINARY:
+            try:
+                self._negotiate_framing(True)
+            except BaseException:
+                self.socket.close()
+                raise
+
+    def pipeline(self):
+        """
+        Collects requests to send in one go, see Pipeline.
+        Usage: imu, _ = remote.pipeline().get_imu_arrays(1000, True, True, False).stop_video().execute()
+        """
+        return Pipeline(self)
+
+    def _negotiate_framing(self, required):
+        self._negotiate_pending = False
+        self._send(FRAMING_REQUEST)
+        # servers without the extension answer "Invalid request", the connection stays usable
+        supported = self._read_status(raise_errors=False)
+        body = self.framing.read_lines(self.reader)
+        if supported and self.server_version in BINARY_FRAMING_VERSIONS and body == [BINARY]:
+            self.framing = BinaryFraming()
+        elif required:
+            self.close()
+            raise RuntimeError('Server %s does not support binary framing' % self.server_version)
 
     def get_imu(self, duration_ms, want_accel, want_gyro, want_magnetic):
         """
@@ -43,188 +145,329 @@ class RemoteControl:
         :return: Tuple (accel_data, gyro_data, magnetic_data) - csv data strings
         If one of the sensors wasn't requested, the corresponding data is None
         """
-        accel = int(want_accel)
-        gyro = int(want_gyro)
-        magnetic = int(want_magnetic)
-        status, socket_file = self._send_and_get_response_status(
-            'imu?duration=%d&accel=%d&gyro=%d&magnetic=%d\n' % (duration_ms, accel, gyro, magnetic)
-        )
-        accel_data = None
-        gyro_data = None
-        magnetic_data = None
-
-        for i in range(NUM_SENSORS):
-            # read filename or end marker
-            line = socket_file.readline()
-            msg = line.strip('\n')
-            if msg == self.props['CHUNK_END_DELIMITER']:
-                break
-            data = ""
-            # accept file contents
-            line = socket_file.readline()
-            while line.strip("\n") != self.props['SENSOR_END_MARKER']:
-                # print('Received: %s' % (line.strip('\n')))
-                data += line
-                line = socket_file.readline()
-
-            # TODO: refactor these hardcoded checks
-            if msg.endswith("accel.csv"):
-                accel_data = data
-            elif msg.endswith("gyro.csv"):
-                gyro_data = data
-            elif msg.endswith("magnetic.csv"):
-                magnetic_data = data
-
-        socket_file.close()
-        return accel_data, gyro_data, magnetic_data
+        return self._recv_imu(duration_ms, want_accel, want_gyro, want_magnetic, CsvTextBuilder)
 
-    def start_video(self):
+    def get_imu_arrays(self, duration_ms, want_accel, want_gyro, want_magnetic):
         """
-        Starts video recording and receives phase and duration info
-        :return: Tuple (phase, average duration, exposure time) - all in nanoseconds
+        Request IMU data recording, rows are decoded while they are being received
+        :param duration_ms: (int) duration in milliseconds
+        :param want_accel: (boolean) request accelerometer recording
+        :param want_gyro: (boolean) request gyroscope recording
+        :param want_magnetic: (boolean) request magnetometer recording
+        :return: Tuple (accel_data, gyro_data, magnetic_data) - numpy arrays of IMU_DTYPE
+        (int64 timestamp in ns, float32 x, y, z).
+        If one of the sensors wasn't requested, the corresponding data is None
         """
-        status, socket_file = self._send_and_get_response_status(
-            self.props['VIDEO_START_REQUEST']
+        return self._recv_imu(duration_ms, want_accel, want_gyro, want_magnetic, ImuArrayBuilder)
+
+    def get_imu_to_store(self, duration_ms, want_accel, want_gyro, want_magnetic, directory):
+        """
+        Request IMU data recording, rows are written to column stores (see src/imu_store.py)
+        in directory/<sensor> while they are being received
+        :param directory: (str) directory for the sensor stores
+        :return: Tuple (accel_path, gyro_path, magnetic_path) - store directories
+        for ImuColumnReader, None for sensors that weren't requested
+        """
+        return self._recv_imu(
+            duration_ms, want_accel, want_gyro, want_magnetic, functools.partial(ImuStoreBuilder, directory)
         )
-        # print(status)
 
-        line = socket_file.readline()
-        phase_ns = int(line)
+    def stream_imu(self, want_accel, want_gyro, want_magnetic, window_ms=LIVE_WINDOW_MS,
+                   capacity=RING_CAPACITY, policy=DROP_OLDEST):
+        """
+        Continuous IMU recording with samples delivered while it runs, see ImuLiveStream.
+        The connection is busy until the stream is stopped.
+        Usage: with remote.stream_imu(True, True, False) as stream: for batch in stream: ...
+        :param window_ms: (int) duration of each recording request, the latency of the stream
+        :param capacity: (int) samples buffered per sensor
+        :param policy: DROP_OLDEST or BLOCK, what to do when the consumer falls behind
+        :return: ImuLiveStream, started when entered or by start()
+        """
+        return ImuLiveStream(self, want_accel, want_gyro, want_magnetic, window_ms, capacity, policy)
 
-        line = socket_file.readline()
-        avg_duration_ns = float(line)
+    def _recv_imu(self, duration_ms, want_accel, want_gyro, want_magnetic, builder_factory):
+        self._send(imu_request(duration_ms, want_accel, want_gyro, want_magnetic))
+        return self._read_imu(builder_factory, duration_ms)
 
-        line = socket_file.readline()
-        exposure_time = int(line)
+    def _read_imu(self, builder_factory, duration_ms):
+        # the phone answers once it has recorded: allow for the duration, and don't take it for a round trip
+        self._sent_at = None
+        if self.io_timeout is not None:
+            self.socket.settimeout(self.io_timeout + duration_ms / 1000.0)
+        self._read_status()
+        # rows are handed to the builders while they are being received
+        results = self.framing.read_imu(self.reader, builder_factory)
+        return tuple(results.get(name) for name in SENSOR_NAMES)
 
-        socket_file.readline()
+    def start_video(self):
+        """
+        Starts video recording and receives phase and duration info
+        :return: Tuple (phase, average duration, exposure time) - all in nanoseconds
+        """
+        self._send(self.props['VIDEO_START_REQUEST'])
+        return self._read_video_phase()
+
+    def _read_video_phase(self):
+        self._read_status()
+        lines = self.framing.read_lines(self.reader)
+        phase_ns = int(lines[0])
+        avg_duration_ns = float(lines[1])
+        exposure_time = int(lines[2])
         return phase_ns, avg_duration_ns, exposure_time
 
     def stop_video(self):
         """
         Stops video recording
         """
+        self._send(self.props['VIDEO_STOP_REQUEST'])
+        self._read_empty()
 
-        # receive response
-        status, socket_file = self._send_and_get_response_status(
-            self.props['VIDEO_STOP_REQUEST']
-        )
-        # print(status)
-
-        line = socket_file.readline()
-        while line.strip('\n') != self.props['CHUNK_END_DELIMITER']:
-            # print(line)
-            line = socket_file.readline()
+    def _read_empty(self):
+        self._read_status()
+        self.framing.read_lines(self.reader)
 
-    def get_video(self, want_progress_bar):
+    def get_video(self, want_progress_bar, progress_callback=None, dest=None):
         """
-        Receives the last recorded video file, saves it in current directory
+        Receives the last recorded video file and streams it to dest without intermediate copies
         :param want_progress_bar: (boolean) display progress bar during video loading
-        :return: Saved video's filename
+        :param progress_callback: (callable) optional, called with the number of bytes
+        received since the previous call, at most once per PROGRESS_UPDATE_BYTES
+        :param dest: where to save the video: None - current directory under the phone's filename,
+        a directory - under the phone's filename in it, any other path - exactly there.
+        Paths are written to a temporary file in the same directory and renamed when complete.
+        A binary file object or a callable taking each chunk (a memoryview that is reused
+        afterwards) receive the data directly
+        :return: Saved video's path, or the phone's filename for file object and callable dests
         """
-        socket_file = self.socket.makefile('rwb', 0)
-        status, socket_file = self._send_and_get_response_status_bytes(
-            (self.props['GET_VIDEO_REQUEST'] + "\n").encode()
-        )
+        data_length, filename = self.request_video()
+
+        with video_sink(dest, filename) as (write, saved_as):
+            if want_progress_bar:
+                # only needed for the progress bar, kept out of startup
+                from tqdm import tqdm
+                with tqdm(total=data_length, unit='B', unit_scale=True, desc="Downloading video") as bar:
+                    def progress(n_bytes):
+                        bar.update(n_bytes)
+                        if progress_callback is not None:
+                            progress_callback(n_bytes)
+                    self._recv_payload(data_length, write, progress)
+            else:
+                self._recv_payload(data_length, write, progress_callback)
+
+        return saved_as
+
+    def get_video_info(self):
+        """
+        Requests size, filename and SHA-256 digest of the last recorded video without transferring it.
+        This is a protocol extension (VIDEO_INFO_REQUEST): servers that don't implement it
+        reply with an error, the connection stays usable in that case
+        :return: Tuple (size in bytes, filename, sha256 hex digest) or None if unsupported
+        """
+        self._send(VIDEO_INFO_REQUEST)
+        return self._read_video_info()
+
+    def _read_video_info(self):
+        supported = self._read_status(raise_errors=False)
+        # the body is the error message if unsupported
+        lines = self.framing.read_lines(self.reader)
+        if not supported:
+            return None
+        return int(lines[0]), lines[1], lines[2]
+
+    def get_clock(self):
+        """
+        Reads the phone's SENSOR_TIMESTAMP clock, see src/clock_sync.py for the offset to host time.
+        This is a protocol extension (CLOCK_REQUEST): servers that don't implement it
+        reply with an error, the connection stays usable in that case
+        :return: (int) phone time in ns, None if unsupported
+        """
+        self._send(CLOCK_REQUEST)
+        supported = self._read_status(raise_errors=False)
+        lines = self.framing.read_lines(self.reader)
+        return int(lines[0]) if supported else None
+
+    def get_video_range(self, video_file, offset, length, progress_callback=None):
+        """
+        Receives a byte range of the last recorded video and writes it to video_file at the same offset.
+        Only servers that answer get_video_info() support this request
+        :param video_file: binary file object opened for writing
+        :param offset: (int) first byte of the range
+        :param length: (int) number of bytes requested
+        :param progress_callback: (callable) optional, see get_video
+        :return: Number of bytes received, less than length if the range crosses the end of file
+        """
+        self._send(VIDEO_RANGE_REQUEST % (offset, length))
+        data_length, _ = self._read_video_header()
 
-        line = socket_file.readline()
-        data_length = int(line.decode())
-        line = socket_file.readline()
-        filename = line.decode().strip("\n")
-        socket_file.readline()  # Read and discard end marker
-        socket_file.close()
+        video_file.seek(offset)
+        self.recv_video(video_file, data_length, progress_callback)
+        return data_length
 
-        if want_progress_bar:
-            with tqdm(total=data_length, unit='B', unit_scale=True, desc="Downloading video") as bar:
-                self._recv_video_file(filename, data_length, bar)
-        else:
-            self._recv_video_file(filename, data_length)
+    def request_video(self):
+        """
+        Sends the video request and reads the response header. The video payload
+        must then be consumed with recv_video() and/or skip_video()
+        :return: Tuple (video size in bytes, video filename on the smartphone)
+        """
+        self._send(self.props['GET_VIDEO_REQUEST'])
+        return self._read_video_header()
 
-        return filename
+    def _read_video_header(self):
+        self._read_status()
+        lines = self.framing.read_lines(self.reader)
+        return int(lines[0]), lines[1]
 
-    def _recv_video_file(self, filename, data_length, bar=None):
+    def recv_video(self, video_file, data_length, progress_callback=None):
+        """
+        Receives the next data_length bytes of the video payload into video_file
+        at its current position
+        :param video_file: binary file object opened for writing
+        :param data_length: (int) number of bytes to receive
+        :param progress_callback: (callable) optional, see get_video
+        """
+        self._recv_payload(data_length, video_file.write, progress_callback)
+
+    def skip_video(self, data_length, progress_callback=None):
+        """
+        Receives and drops the next data_length bytes of the video payload.
+        Used to resume a download from a server that can only send the whole file
+        """
+        self._recv_payload(data_length, None, progress_callback)
+
+    def _recv_payload(self, data_length, write, progress=None):
+        # recv_into() fills the same preallocated buffer on every iteration, so no
+        # per-chunk bytes objects are created and the file gets a zero-copy view.
+        # Payload bytes that came in with the response header are taken from the reader first
+        view = memoryview(self._recv_buffer)
+        chunk_size = len(view)
         recv_len = 0
-        with open(filename, "wb") as video_file:
-            while recv_len < data_length:
-                more = self.socket.recv(BUFFER_SIZE)
-                if not more:
-                    raise EOFError()
-                video_file.write(more)
-                recv_len += len(more)
-                if bar is not None:
-                    bar.update(len(more))
-                    
-    def _send_and_get_response_status(self, msg):
-        # open socket as a file
-        socket_file = self.socket.makefile("rw")
-        # send request message
-        socket_file.write(msg + '\n')
-        socket_file.flush()
-        # receive response
-        status = socket_file.readline()
-        version = socket_file.readline().strip('\n')
-        if (version not in SUPPORTED_SERVER_VERSIONS):
-            socket_file.close()
-            self.socket.close()
-            print('Status: %s' % status)
-            raise RuntimeError('Unsupported app server version: %s' % version)
-        if status.strip('\n') == self.props['ERROR']:
-            msg = socket_file.readline()
-            socket_file.close()
-            self.socket.close()
-            raise RuntimeError(msg)
+        pending = 0
+        while recv_len < data_length:
+            n_bytes = self.reader.readinto(view[:min(chunk_size, data_length - recv_len)])
+            if write is not None:
+                write(view[:n_bytes])
+            recv_len += n_bytes
+            pending += n_bytes
+            if progress is not None and pending >= PROGRESS_UPDATE_BYTES:
+                progress(pending)
+                pending = 0
+        if progress is not None and pending:
+            progress(pending)
 
-        return status.strip('\n') == self.props['SUCCESS'], socket_file
-
-    # def _recv_video_file(self, filename, data_length, bar=None):
-    #     recv_len = 0
-    #     with open(filename, "wb") as video_file:
-    #         while recv_len < data_length:
-    #             more = self.socket.recv(BUFFER_SIZE)
-    #             if not more:
-    #                 raise EOFError()
-    #             recv_len += len(more)
-    #             video_file.write(more)
-    #             if bar is not None:
-    #                 bar.next(len(more))
-    #                 sys.stdout.flush()
-    #     if bar is not None:
-    #         bar.finish()
-
-    def _send_and_get_response_status_bytes(self, msg):
-        # open socket as a file
-        socket_file = self.socket.makefile("rwb", 0)
-        # send request message
-        socket_file.write(msg)
-        socket_file.flush()
-        # receive response
-        status = socket_file.readline()
-        version = socket_file.readline().decode().strip('\n')
-        if (version not in SUPPORTED_SERVER_VERSIONS):
-            socket_file.close()
+    def _send(self, *requests):
+        if self._negotiate_pending and self.server_version in BINARY_FRAMING_VERSIONS:
+            # between two responses: everything sent from now on is answered in frames
+            self._negotiate_framing(False)
+        # every request starts with the default deadline, IMU reads extend it
+        self.socket.settimeout(self.io_timeout)
+        # pipelined requests go out in one write, the server reads them one line at a time
+        self.socket.sendall(''.join(request + '\n' for request in requests).encode())
+        self._sent_at = time.perf_counter()
+
+    def _read_status(self, raise_errors=True):
+        """
+        Reads the status and version of the next response
+        :param raise_errors: (boolean) on an error status, close the connection and raise
+        with the error message. Otherwise the message is left to be read as the body
+        :return: (boolean) True on success
+        """
+        status, version = self.framing.read_status(self.reader)
+        if self._sent_at is not None:
+            # only the first response of a pipeline is a round trip, the others waited for it
+            self.last_round_trip_s = time.perf_counter() - self._sent_at
+            self._sent_at = None
+        if version not in SUPPORTED_SERVER_VERSIONS:
             self.socket.close()
+            print('Status: %s' % status)
             raise RuntimeError('Unsupported app server version: %s' % version)
-        if status.decode().strip('\n') == self.props['ERROR']:
-            msg = socket_file.readline()
-            socket_file.close()
+        self.server_version = version
+        if version not in BINARY_FRAMING_VERSIONS:
+            self._negotiate_pending = False
+        if status == self.props['ERROR'] and raise_errors:
+            msg = '\n'.join(self.framing.read_lines(self.reader))
             self.socket.close()
             raise RuntimeError(msg)
-
-        return status.decode().strip('\n') == self.props['SUCCESS'], socket_file
+        return status == self.props['SUCCESS']
 
     def _load_properties(self, filepath, sep='=', comment_char='#'):
         """
         Read the file passed as parameter as a properties file.
         """
-        self.props = {}
-        with open(filepath, "rt") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith(comment_char):
-                    key_value = line.split(sep)
-                    key = key_value[0].strip()
-                    value = sep.join(key_value[1:]).strip().strip('"')
-                    self.props[key] = value
+        self.props = load_properties(filepath, sep, comment_char)
 
     def close(self):
         self.socket.close()
+
+
+def imu_request(duration_ms, want_accel, want_gyro, want_magnetic):
+    return IMU_REQUEST % (duration_ms, int(want_accel), int(want_gyro), int(want_magnetic))
+
+
+class Pipeline:
+    """
+    Requests written to the connection together, with the responses read
+    afterwards in order. The phone handles requests one after the other, so
+    this saves the round trips in between, e.g. stopping the video right after
+    an IMU recording. Methods return the pipeline for chaining; nothing is
+    sent before execute(). If a response is an error the connection is closed
+    and the error raised, the remaining responses are lost.
+    """
+
+    def __init__(self, remote):
+        """
+        Args:
+            remote (RemoteControl): Connection to send the requests on
+        """
+        self.remote = remote
+        self._requests = []
+
+    def start_video(self):
+        """
+        Result: Tuple (phase, average duration, exposure time), see RemoteControl.start_video
+        """
+        return self._add(self.remote.props['VIDEO_START_REQUEST'], self.remote._read_video_phase)
+
+    def stop_video(self):
+        """
+        Result: None
+        """
+        return self._add(self.remote.props['VIDEO_STOP_REQUEST'], self.remote._read_empty)
+
+    def get_imu(self, duration_ms, want_accel, want_gyro, want_magnetic):
+        """
+        Result: Tuple of csv data strings, see RemoteControl.get_imu
+        """
+        return self._add_imu(duration_ms, want_accel, want_gyro, want_magnetic, CsvTextBuilder)
+
+    def get_imu_arrays(self, duration_ms, want_accel, want_gyro, want_magnetic):
+        """
+        Result: Tuple of numpy arrays of IMU_DTYPE, see RemoteControl.get_imu_arrays
+        """
+        return self._add_imu(duration_ms, want_accel, want_gyro, want_magnetic, ImuArrayBuilder)
+
+    def get_video_info(self):
+        """
+        Result: Tuple (size in bytes, filename, sha256 hex digest) or None, see RemoteControl.get_video_info
+        """
+        return self._add(VIDEO_INFO_REQUEST, self.remote._read_video_info)
+
+    def execute(self):
+        """
+        Sends the collected requests and reads their responses
+        :return: list of the results, in the order the requests were added
+        """
+        requests, self._requests = self._requests, []
+        if not requests:
+            return []
+        self.remote._send(*[request for request, _, _ in requests])
+        return [read_response(*args) for _, read_response, args in requests]
+
+    def _add(self, request, read_response, *args):
+        self._requests.append((request, read_response, args))
+        return self
+
+    def _add_imu(self, duration_ms, want_accel, want_gyro, want_magnetic, builder_factory):
+        return self._add(
+            imu_request(duration_ms, want_accel, want_gyro, want_magnetic), self.remote._read_imu, builder_factory,
+            duration_ms
+        )
@@ -0,0 +1,200 @@
+import io
+
+import numpy as np
+
+LINEAR = 'linear'
+CUBIC = 'cubic'
+# Intervals longer than this many median sample intervals are treated as gaps
+GAP_FACTOR = 2.5
+
+GAP_DTYPE = np.dtype([
+    ('index', np.int64),  # index of the last sample before the gap
+    ('start_ns', np.int64),
+    ('end_ns', np.int64),
+    ('missing', np.int64),  # estimated number of dropped samples
+])
+
+
+def parse_frame_timestamps(data):
+    """
+    :param data: (bytes or str) contents of a VideoFrameInfo timestamps csv, one timestamp per line
+    :return: numpy int64 array of frame timestamps in ns
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if not data.strip():
+        return np.empty(0, dtype=np.int64)
+    return np.loadtxt(io.BytesIO(data), dtype=np.int64, ndmin=1)
+
+
+def frame_grid(phase_ns, avg_duration_ns, start_ns, end_ns):
+    """
+    Expected frame timestamps from the start_video response, for recordings
+    without a frame timestamps file
+    :param phase_ns: (int) timestamp of a recorded frame, as returned by start_video
+    :param avg_duration_ns: (float) average frame duration, as returned by start_video
+    :param start_ns: (int) first timestamp of interest
+    :param end_ns: (int) last timestamp of interest
+    :return: numpy int64 array of frame timestamps in [start_ns, end_ns]
+    """
+    first = int(np.ceil((start_ns - phase_ns) / avg_duration_ns))
+    last = int(np.floor((end_ns - phase_ns) / avg_duration_ns))
+    k = np.arange(first, last + 1, dtype=np.float64)
+    return phase_ns + np.round(k * avg_duration_ns).astype(np.int64)
+
+
+def median_interval(timestamps):
+    """
+    :param timestamps: numpy int64 array of sorted timestamps
+    :return: (float) median interval between consecutive timestamps in ns, None for fewer than 2
+    """
+    if len(timestamps) < 2:
+        return None
+    return float(np.median(np.diff(timestamps)))
+
+
+def find_gaps(timestamps, max_gap_ns=None, expected_interval_ns=None):
+    """
+    Finds dropouts: consecutive timestamps further apart than max_gap_ns
+    :param timestamps: numpy int64 array of sorted timestamps (IMU or frame)
+    :param max_gap_ns: (int) longest regular interval, defaults to GAP_FACTOR expected intervals
+    :param expected_interval_ns: (float) nominal sample interval, e.g. avg_duration_ns
+    of start_video for frames, defaults to the median interval
+    :return: numpy array of GAP_DTYPE, one entry per gap
+    """
+    if len(timestamps) < 2:
+        return np.empty(0, dtype=GAP_DTYPE)
+    intervals = np.diff(timestamps)
+    if expected_interval_ns is None:
+        expected_interval_ns = float(np.median(intervals))
+    if max_gap_ns is None:
+        max_gap_ns = GAP_FACTOR * expected_interval_ns
+    index = np.flatnonzero(intervals > max_gap_ns)
+    gaps = np.empty(len(index), dtype=GAP_DTYPE)
+    gaps['index'] = index
+    gaps['start_ns'] = timestamps[index]
+    gaps['end_ns'] = timestamps[index + 1]
+    if expected_interval_ns > 0:
+        gaps['missing'] = np.maximum(np.round(intervals[index] / expected_interval_ns).astype(np.int64) - 1, 0)
+    else:
+        gaps['missing'] = 0
+    return gaps
+
+
+def _values(samples):
+    """
+    :param samples: numpy array of IMU_DTYPE, or Tuple (timestamps, values) with values of shape (n,) or (n, k)
+    :return: Tuple (int64 timestamps, float64 values of shape (n, k))
+    """
+    if isinstance(samples, tuple):
+        timestamps, values = samples
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        return np.asarray(timestamps, dtype=np.int64), values
+    values = np.column_stack([samples['x'], samples['y'], samples['z']]).astype(np.float64)
+    return samples['timestamp'].astype(np.int64, copy=False), values
+
+
+def interpolate(samples, times, kind=LINEAR, max_gap_ns=None):
+    """
+    Estimates the sensor values at arbitrary timestamps
+    :param samples: numpy array of IMU_DTYPE sorted by timestamp,
+    or Tuple (timestamps, values) for other signals
+    :param times: numpy int64 array of timestamps to estimate the values at
+    :param kind: (str) LINEAR, or CUBIC for a cubic Hermite spline with
+    Catmull-Rom tangents (passes through the samples, no overshoot-prone global fit)
+    :param max_gap_ns: (int) intervals longer than this are not interpolated over,
+    defaults to GAP_FACTOR median intervals
+    :return: numpy float64 array of shape (len(times), k) - x, y, z for IMU samples - NaN where unknown
+    """
+    if kind not in (LINEAR, CUBIC):
+        raise ValueError('Unknown interpolation kind: %s' % kind)
+    # one searchsorted over the sample timestamps replaces a per-row lookup loop.
+    # Time differences are taken in int64 before the float conversion, so
+    # nanosecond epoch timestamps lose no precision
+    timestamps, values = _values(samples)
+    times = np.asarray(times, dtype=np.int64)
+    out = np.full((len(times), values.shape[1]), np.nan)
+    n = len(timestamps)
+    if n < 2 or not len(times):
+        return out
+    if max_gap_ns is None:
+        max_gap_ns = GAP_FACTOR * median_interval(timestamps)
+
+    # right neighbour of every requested time; times equal to a sample use the
+    # interval ending there, so the last sample is still covered
+    right = np.clip(np.searchsorted(timestamps, times, side='left'), 1, n - 1)
+    left = right - 1
+    t0 = timestamps[left]
+    t1 = timestamps[right]
+    h = t1 - t0
+    valid = (times >= t0) & (times <= t1) & (h > 0) & (h <= max_gap_ns)
+    left, right, h = left[valid], right[valid], h[valid].astype(np.float64)
+    s = ((times[valid] - t0[valid]) / h)[:, None]
+    p0 = values[left]
+    p1 = values[right]
+
+    if kind == LINEAR:
+        out[valid] = p0 + s * (p1 - p0)
+        return out
+
+    # tangents from the neighbouring samples, falling back to one-sided
+    # differences at the ends of the recording and next to gaps
+    prev = np.maximum(left - 1, 0)
+    nxt = np.minimum(right + 1, n - 1)
+    prev = np.where(timestamps[left] - timestamps[prev] > max_gap_ns, left, prev)
+    nxt = np.where(timestamps[nxt] - timestamps[right] > max_gap_ns, right, nxt)
+    m0 = (p1 - values[prev]) / (timestamps[right] - timestamps[prev]).astype(np.float64)[:, None]
+    m1 = (values[nxt] - p0) / (timestamps[nxt] - timestamps[left]).astype(np.float64)[:, None]
+    s2 = s * s
+    s3 = s2 * s
+    hh = h[:, None]
+    out[valid] = (
+        (2 * s3 - 3 * s2 + 1) * p0
+        + (s3 - 2 * s2 + s) * hh * m0
+        + (-2 * s3 + 3 * s2) * p1
+        + (s3 - s2) * hh * m1
+    )
+    return out
+
+
+def align_to_frames(frame_timestamps, accel=None, gyro=None, magnetic=None, kind=LINEAR, max_gap_ns=None):
+    """
+    Per-frame IMU values: every sensor is interpolated at the frame timestamps
+    :param frame_timestamps: numpy int64 array, see parse_frame_timestamps and frame_grid
+    :param accel: numpy array of IMU_DTYPE or None, as returned by get_imu_arrays
+    :param gyro: numpy array of IMU_DTYPE or None
+    :param magnetic: numpy array of IMU_DTYPE or None
+    :param kind: (str) LINEAR or CUBIC, see interpolate
+    :param max_gap_ns: (int) see interpolate, per sensor default if None
+    :return: dict sensor name -> numpy float64 array of shape (n_frames, 3), for the given sensors
+    """
+    return dict(
+        (name, interpolate(samples, frame_timestamps, kind, max_gap_ns))
+        for name, samples in (('accel', accel), ('gyro', gyro), ('magnetic', magnetic))
+        if samples is not None
+    )
+
+
+def resample(sensors, interval_ns, kind=LINEAR, max_gap_ns=None, start_ns=None, end_ns=None):
+    """
+    Resamples several sensors to one common clock
+    :param sensors: dict name -> numpy array of IMU_DTYPE (or Tuple (timestamps, values))
+    :param interval_ns: (int) interval of the common clock, e.g. 5000000 for 200 Hz
+    :param kind: (str) LINEAR or CUBIC, see interpolate
+    :param max_gap_ns: (int) see interpolate, per sensor default if None
+    :param start_ns: (int) first tick, defaults to the latest first sample of all sensors
+    :param end_ns: (int) last tick at most, defaults to the earliest last sample of all sensors
+    :return: Tuple (numpy int64 array of ticks, dict name -> float64 array of shape (n_ticks, k))
+    """
+    timestamps = [_values(samples)[0] for samples in sensors.values()]
+    timestamps = [t for t in timestamps if len(t)]
+    if start_ns is None:
+        start_ns = max(int(t[0]) for t in timestamps) if timestamps else 0
+    if end_ns is None:
+        end_ns = min(int(t[-1]) for t in timestamps) if timestamps else start_ns - 1
+    ticks = np.arange(start_ns, end_ns + 1, interval_ns, dtype=np.int64)
+    return ticks, dict(
+        (name, interpolate(samples, ticks, kind, max_gap_ns)) for name, samples in sensors.items()
+    )
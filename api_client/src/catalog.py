@@ -0,0 +1,213 @@
+import contextlib
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+CATALOG_FILENAME = 'catalog.sqlite3'
+VIDEO_EXTENSION = '.mp4'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    path TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    participant_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_by_session ON videos (session_id, recorded_at);
+CREATE INDEX IF NOT EXISTS videos_by_participant ON videos (participant_id, recorded_at);
+CREATE INDEX IF NOT EXISTS videos_by_time ON videos (recorded_at);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    dir_mtime_ns INTEGER
+);
+"""
+
+
+def participant_id(filename):
+    """
+    :param filename: (str) video filename like "subjectID_activity_2025-07-24_15-43-00.mp4"
+    :return: (str) participant ID, the part before the first underscore
+    """
+    return os.path.splitext(os.path.basename(filename))[0].split('_')[0]
+
+
+def link_or_copy(src, dest):
+    """
+    Makes dest refer to src without duplicating the data: a hardlink, or a
+    symlink when hardlinks aren't possible (different filesystems). Copies only
+    if neither is supported
+    """
+    try:
+        os.link(src, dest)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class Catalog:
+    """
+    SQLite index of the videos saved under a root directory (root/<session_id>/<video>).
+    Videos are added one by one as they are saved, so listing and grouping
+    never have to scan the directory tree. Session directories are indexed on
+    access whenever their modification time changed since the last listing, so
+    videos saved before the catalog existed or copied in later are picked up
+    and deleted ones dropped.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Directory holding one subdirectory per session, the database is stored in it
+        """
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self.db_path = os.path.join(self.root, CATALOG_FILENAME)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(_SCHEMA)
+            columns = [row[1] for row in db.execute('PRAGMA table_info(sessions)')]
+            if 'dir_mtime_ns' not in columns:
+                # catalogs created before sessions were re-indexed
+                db.execute('ALTER TABLE sessions ADD COLUMN dir_mtime_ns INTEGER')
+
+    def add(self, session_id, path, recorded_at=None):
+        """
+        Indexes a saved video, replacing any previous entry for the same file
+        :param session_id: (str) session the video belongs to
+        :param path: (str) video path, inside root
+        :param recorded_at: (datetime) recording time, defaults to the file modification time
+        """
+        with self._connect() as db:
+            self._add(db, session_id, path, recorded_at)
+
+    def videos(self, session_id=None, participant_id=None, since=None, until=None):
+        """
+        :param session_id: (str) optional, only videos of this session
+        :param participant_id: (str) optional, only videos of this participant
+        :param since: (datetime) optional, only videos recorded at or after this time
+        :param until: (datetime) optional, only videos recorded before this time
+        :return: list of dicts with path (absolute), session_id, participant_id, name,
+        recorded_at (ISO format) and size, ordered by recording time
+        """
+        for indexed_id in [session_id] if session_id is not None else self._session_ids():
+            self._index_session_dir(indexed_id)
+        conditions = []
+        args = []
+        for column, op, value in (
+            ('session_id', '=', session_id),
+            ('participant_id', '=', participant_id),
+            ('recorded_at', '>=', since and since.isoformat()),
+            ('recorded_at', '<', until and until.isoformat()),
+        ):
+            if value is not None:
+                conditions.append('%s %s ?' % (column, op))
+                args.append(value)
+        query = 'SELECT path, session_id, participant_id, name, recorded_at, size FROM videos'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY recorded_at, path'
+        with self._connect() as db:
+            rows = db.execute(query, args).fetchall()
+        return [
+            {
+                'path': os.path.join(self.root, row[0]),
+                'session_id': row[1],
+                'participant_id': row[2],
+                'name': row[3],
+                'recorded_at': row[4],
+                'size': row[5],
+            }
+            for row in rows
+        ]
+
+    def by_participant(self, session_id):
+        """
+        :return: dict participant ID -> list of video dicts (see videos()) of the session
+        """
+        grouped = {}
+        for video in self.videos(session_id):
+            grouped.setdefault(video['participant_id'], []).append(video)
+        return grouped
+
+    def link_grouped(self, session_id, grouped_dir):
+        """
+        Builds grouped_dir/<participant_id>/<video> with links to the session's
+        videos (see link_or_copy). Existing entries are kept
+        :return: dict participant ID -> list of video dicts (see videos())
+        """
+        grouped = self.by_participant(session_id)
+        for pid, videos in grouped.items():
+            participant_dir = os.path.join(grouped_dir, pid)
+            os.makedirs(participant_dir, exist_ok=True)
+            for video in videos:
+                dest = os.path.join(participant_dir, video['name'])
+                if not os.path.lexists(dest):
+                    link_or_copy(video['path'], dest)
+        return grouped
+
+    def _session_ids(self):
+        with self._connect() as db:
+            return [row[0] for row in db.execute(
+                'SELECT session_id FROM sessions UNION SELECT DISTINCT session_id FROM videos'
+            )]
+
+    def _index_session_dir(self, session_id):
+        # one stat per access, the directory is only listed again when entries were added, removed or renamed
+        session_dir = os.path.join(self.root, session_id)
+        try:
+            mtime_ns = os.stat(session_dir).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT dir_mtime_ns FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            if row is not None and row[0] == mtime_ns:
+                return
+            found = set()
+            if mtime_ns is not None:
+                for entry in os.scandir(session_dir):
+                    if entry.is_file() and entry.name.lower().endswith(VIDEO_EXTENSION):
+                        # known videos keep their recording time, only the size is refreshed
+                        self._add(db, session_id, entry.path, None, replace=False)
+                        db.execute(
+                            'UPDATE videos SET size = ? WHERE path = ?',
+                            (entry.stat().st_size, os.path.relpath(entry.path, self.root))
+                        )
+                        found.add(os.path.relpath(entry.path, self.root))
+            gone = [
+                (path,) for (path,) in db.execute('SELECT path FROM videos WHERE session_id = ?', (session_id,))
+                if path not in found
+            ]
+            db.executemany('DELETE FROM videos WHERE path = ?', gone)
+            db.execute('INSERT OR REPLACE INTO sessions (session_id, dir_mtime_ns) VALUES (?, ?)', (session_id, mtime_ns))
+
+    def _add(self, db, session_id, path, recorded_at, replace=True):
+        stat = os.stat(path)
+        if recorded_at is None:
+            recorded_at = datetime.fromtimestamp(stat.st_mtime)
+        db.execute(
+            '%s INTO videos (path, session_id, participant_id, name, recorded_at, size) '
+            'VALUES (?, ?, ?, ?, ?, ?)' % ('INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'),
+            (
+                os.path.relpath(os.path.abspath(path), self.root), session_id, participant_id(path),
+                os.path.basename(path), recorded_at.isoformat(), stat.st_size,
+            )
+        )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # a short-lived connection per call keeps the catalog usable from any thread
+        db = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
@@ -0,0 +1,195 @@
+import collections
+import time
+
+import numpy as np
+
+# Host timebase all phones are mapped to: monotonic, so it doesn't jump with NTP or DST
+host_clock_ns = time.monotonic_ns
+
+# Clock readings per sync() call, SYNC_INTERVAL_S apart
+SYNC_ROUNDS = 16
+SYNC_INTERVAL_S = 0.005
+# Readings kept per estimator, the oldest are dropped
+MAX_SAMPLES = 4096
+# Samples are grouped in windows of this length and only the fastest round trip of each is used:
+# the others waited in a queue on the way, which skews their offset (the NTP clock filter)
+FILTER_WINDOW_S = 1.0
+# Drift is only fitted once the windows used span this long, before that it is taken as 0
+MIN_DRIFT_SPAN_S = 10.0
+
+
+class ClockModel:
+    """
+    Maps one phone's clock to the host's:
+    phone = host + offset_ns + drift * (host - reference_ns).
+    Conversions work on scalars and whole arrays (int64 ns) at once.
+    """
+
+    def __init__(self, reference_ns, offset_ns, drift=0.0, round_trip_ns=None, residual_ns=None, samples=0):
+        """
+        Args:
+            reference_ns (int): Host time the offset is given at
+            offset_ns (float): Phone time minus host time at reference_ns
+            drift (float): Phone clock rate minus host clock rate, e.g. 2e-5 for 20 ppm fast
+            round_trip_ns (int): Fastest round trip used, the offset is within half of it
+            residual_ns (float): RMS of the fit residuals
+            samples (int): Number of readings the model was fitted on
+        """
+        self.reference_ns = int(reference_ns)
+        self.offset_ns = float(offset_ns)
+        self.drift = float(drift)
+        self.round_trip_ns = round_trip_ns
+        self.residual_ns = residual_ns
+        self.samples = samples
+
+    @property
+    def drift_ppm(self):
+        return self.drift * 1e6
+
+    @property
+    def uncertainty_ns(self):
+        """
+        :return: (float) bound of the offset error: half the fastest round trip, the phone read its
+        clock at an unknown point of it
+        """
+        return None if self.round_trip_ns is None else self.round_trip_ns / 2
+
+    def to_host(self, phone_ns):
+        """
+        :param phone_ns: (int or array-like) timestamps of the phone's clock in ns
+        :return: (int or numpy int64 array) the same instants in host_clock_ns time
+        """
+        # int64 differences first: absolute timestamps don't fit float64's 53 bits at ns resolution
+        anchor = self.reference_ns + int(round(self.offset_ns))
+        delta = np.asarray(phone_ns, dtype=np.int64) - anchor
+        host = self.reference_ns + np.rint(delta / (1.0 + self.drift)).astype(np.int64)
+        return int(host) if host.ndim == 0 else host
+
+    def to_phone(self, host_ns):
+        """
+        :param host_ns: (int or array-like) host_clock_ns timestamps
+        :return: (int or numpy int64 array) the same instants in the phone's clock
+        """
+        delta = np.asarray(host_ns, dtype=np.int64) - self.reference_ns
+        phone = self.reference_ns + int(round(self.offset_ns)) + np.rint(delta * (1.0 + self.drift)).astype(np.int64)
+        return int(phone) if phone.ndim == 0 else phone
+
+    def to_host_imu(self, imu, field='timestamp'):
+        """
+        :param imu: numpy structured array with timestamps of the phone, e.g. IMU_DTYPE rows
+        :param field: (str) the timestamp field
+        :return: copy of imu with the timestamps converted to host time
+        """
+        converted = imu.copy()
+        converted[field] = self.to_host(imu[field])
+        return converted
+
+    def as_dict(self):
+        return {
+            'reference_ns': self.reference_ns,
+            'offset_ns': self.offset_ns,
+            'drift_ppm': self.drift_ppm,
+            'round_trip_ns': self.round_trip_ns,
+            'uncertainty_ns': self.uncertainty_ns,
+            'residual_ns': self.residual_ns,
+            'samples': self.samples,
+        }
+
+
+def filter_samples(samples, window_ns):
+    """
+    NTP-style clock filter: the fastest round trip of each time window
+    :param samples: numpy int64 array of shape (n, 3), rows (host send, phone, host receive) in ns
+    :return: numpy int64 array of the kept rows, in time order
+    """
+    round_trips = samples[:, 2] - samples[:, 0]
+    windows = (samples[:, 0] - samples[:, 0].min()) // window_ns
+    order = np.lexsort((round_trips, windows))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = windows[order][1:] != windows[order][:-1]
+    return samples[order[first]]
+
+
+def fit_clock(samples, window_s=FILTER_WINDOW_S, min_drift_span_s=MIN_DRIFT_SPAN_S):
+    """
+    Fits a ClockModel to timed clock readings: offsets at the midpoints of the
+    round trips kept by filter_samples(), weighted by their round trip, with a
+    linear drift once they span min_drift_span_s
+    :param samples: (array-like) rows (host send, phone, host receive) in ns
+    :return: ClockModel
+    """
+    samples = np.asarray(samples, dtype=np.int64).reshape(-1, 3)
+    if not len(samples):
+        raise ValueError('No clock samples')
+    kept = filter_samples(samples, int(window_s * 1e9))
+    round_trips = kept[:, 2] - kept[:, 0]
+    midpoints = kept[:, 0] + round_trips // 2
+    reference_ns = int(midpoints[np.argmin(round_trips)])
+    x = (midpoints - reference_ns).astype(np.float64)
+    y = (kept[:, 1] - midpoints - (kept[0, 1] - midpoints[0])).astype(np.float64)
+    # readings over faster round trips bound the offset more tightly
+    weights = 1.0 / np.maximum(round_trips, 1)
+    if x.max() - x.min() >= min_drift_span_s * 1e9:
+        drift, intercept = np.polyfit(x, y, 1, w=weights)
+    else:
+        drift, intercept = 0.0, np.average(y, weights=weights)
+    residuals = y - (intercept + drift * x)
+    return ClockModel(
+        reference_ns, intercept + (kept[0, 1] - midpoints[0]), drift, int(round_trips.min()),
+        float(np.sqrt(np.average(residuals ** 2, weights=weights))), len(samples),
+    )
+
+
+class ClockEstimator:
+    """
+    Offset and drift of a phone's clock relative to host_clock_ns, from
+    repeated clock readings. Readings accumulate across sync() calls, so
+    syncing before and after a recording also measures the drift over it.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES, window_s=FILTER_WINDOW_S, min_drift_span_s=MIN_DRIFT_SPAN_S):
+        """
+        Args:
+            max_samples (int): Readings kept, the oldest are dropped
+            window_s (float): Filter window, see fit_clock
+            min_drift_span_s (float): Time span needed to fit the drift, see fit_clock
+        """
+        self.window_s = window_s
+        self.min_drift_span_s = min_drift_span_s
+        self._samples = collections.deque(maxlen=max_samples)
+
+    def add(self, sent_ns, phone_ns, received_ns):
+        """
+        Adds a reading: the phone's clock read between two host_clock_ns times
+        """
+        self._samples.append((sent_ns, phone_ns, received_ns))
+
+    def __len__(self):
+        return len(self._samples)
+
+    def model(self):
+        """
+        :return: ClockModel fitted on the readings so far
+        """
+        return fit_clock(list(self._samples), self.window_s, self.min_drift_span_s)
+
+
+def sync(remote, estimator=None, rounds=SYNC_ROUNDS, interval_s=SYNC_INTERVAL_S):
+    """
+    Reads the clock of a connected phone rounds times
+    :param remote: (RemoteControl) connection to a server answering get_clock()
+    :param estimator: ClockEstimator to add the readings to, a new one by default
+    :return: ClockModel of the phone, None if the server doesn't implement the clock request
+    """
+    if estimator is None:
+        estimator = ClockEstimator()
+    for i in range(rounds):
+        if i:
+            time.sleep(interval_s)
+        sent_ns = host_clock_ns()
+        phone_ns = remote.get_clock()
+        received_ns = host_clock_ns()
+        if phone_ns is None:
+            return None
+        estimator.add(sent_ns, phone_ns, received_ns)
+    return estimator.model()
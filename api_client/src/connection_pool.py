@@ -0,0 +1,211 @@
+import contextlib
+import select
+import threading
+import time
+
+from .RemoteControl import RemoteControl
+from .resilience import RETRY_ATTEMPTS, TRANSIENT_ERRORS, CircuitOpenError, DeviceHealth, retry
+
+# Idle connections are closed after this many seconds. The phone serves one
+# client at a time, so a connection held for nothing locks everybody else out
+IDLE_TIMEOUT_S = 300.0
+# Seconds a connection attempt may take, a phone on the LAN answers in milliseconds
+CONNECT_TIMEOUT_S = 5.0
+
+
+class DeviceBusyError(TimeoutError):
+    """
+    Raised when a device stays leased by another request for longer than the caller waits
+    """
+
+
+class _PooledDevice:
+    def __init__(self, health):
+        self.lock = threading.Lock()
+        self.remote = None
+        self.last_used = 0.0
+        self.health = health
+
+
+def is_healthy(remote):
+    """
+    Checks an idle connection without sending anything to the phone:
+    an idle socket must have nothing to read. Readable means the peer closed
+    it (EOF) or left stray bytes of an earlier response - both unusable
+    :param remote: (RemoteControl) connection to check
+    :return: (boolean) True if the connection can be used for a new request
+    """
+    if remote.socket.fileno() < 0 or remote.reader.buffered:
+        return False
+    try:
+        readable, _, _ = select.select([remote.socket], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+class ConnectionPool:
+    """
+    Keeps one persistent RemoteControl connection per smartphone and lends it
+    out exclusively, so requests from different threads never interleave on a
+    socket. Connections are health-checked before use, reopened when broken
+    and closed after idling for idle_timeout seconds.
+
+    Each device has a DeviceHealth: failed connections and requests open its
+    circuit, and a phone that stopped answering is left alone instead of being
+    waited on by every request. Reconnects are retried with backoff, and reads
+    are bounded by a deadline adapted to the phone's response times.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT_S, connect_timeout=CONNECT_TIMEOUT_S, factory=RemoteControl,
+                 attempts=RETRY_ATTEMPTS, health_factory=DeviceHealth):
+        """
+        Args:
+            idle_timeout (float): Seconds after which an unused connection is closed
+            connect_timeout (float): Connection timeout passed to the factory
+            factory (callable): Creates a connection from (hostname, timeout=..., port=...)
+            attempts (int): Connection attempts per lease, and attempts of idempotent operations, see call()
+            health_factory (callable): Creates the DeviceHealth of a device
+        """
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.factory = factory
+        self.attempts = attempts
+        self.health_factory = health_factory
+        self._devices = {}
+        self._devices_lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self, hostname, port=None, wait_timeout=-1):
+        """
+        Leases the connection to a smartphone, connecting if needed.
+        If the body raises, the connection is closed since its stream may be
+        left mid-response; the next lease reconnects. Link failures in the
+        body (OSError, EOFError) count against the device's circuit, error
+        responses of the phone don't
+        :param hostname: (str) smartphone hostname
+        :param port: (int) RPC port, defaults to RPC_PORT from the server properties
+        :param wait_timeout: (float) seconds to wait while another request uses the device, -1 waits forever
+        :raises DeviceBusyError: if the device is still leased after wait_timeout
+        :raises CircuitOpenError: if the device failed repeatedly and isn't retried yet
+        """
+        device = self._device(hostname, port)
+        if not device.lock.acquire(timeout=wait_timeout):
+            raise DeviceBusyError('Device %s is busy' % hostname)
+        try:
+            device.health.check(self._name(hostname, port))
+            if device.remote is not None and not is_healthy(device.remote):
+                self._discard(device)
+            if device.remote is None:
+                try:
+                    device.remote = retry(
+                        lambda: self.factory(hostname, timeout=self.connect_timeout, port=port), self.attempts
+                    )
+                except TRANSIENT_ERRORS as e:
+                    device.health.record_failure(e)
+                    raise
+            remote = device.remote
+            remote.io_timeout = device.health.timeout()
+            try:
+                yield remote
+            except BaseException as e:
+                self._discard(device)
+                if isinstance(e, TRANSIENT_ERRORS):
+                    device.health.record_failure(e)
+                else:
+                    device.health.record_success()
+                raise
+            finally:
+                self._observe_round_trip(device, remote)
+            device.health.record_success()
+            device.last_used = time.monotonic()
+        finally:
+            device.lock.release()
+
+    def call(self, hostname, operation, port=None, wait_timeout=-1, idempotent=False, on_retry=None):
+        """
+        Runs operation(remote) on a leased connection, see connection(). Idempotent
+        operations (video info, ranges, downloading the last video again) are
+        retried with backoff on a new connection when the link fails. Start and
+        stop requests must not be: the phone may have acted on the lost request
+        :param operation: (callable) takes the RemoteControl, its result is returned
+        :param idempotent: (boolean) the operation can safely be repeated
+        :param on_retry: (callable) optional, called with the error and the delay before each retry
+        """
+        def attempt():
+            with self.connection(hostname, port, wait_timeout) as remote:
+                return operation(remote)
+        if not idempotent:
+            return attempt()
+        return retry(attempt, self.attempts, give_up_on=(CircuitOpenError, DeviceBusyError), on_retry=on_retry)
+
+    def status(self):
+        """
+        Current state of every device, e.g. to route captures around unreachable phones
+        :return: list of dicts with host, port, connected, in_use and the DeviceHealth status
+        """
+        with self._devices_lock:
+            devices = list(self._devices.items())
+        return [
+            dict(device.health.status(), host=hostname, port=port, connected=device.remote is not None,
+                 in_use=device.lock.locked())
+            for (hostname, port), device in devices
+        ]
+
+    def evict_idle(self):
+        """
+        Closes connections unused for longer than idle_timeout. Devices in use are skipped
+        :return: (int) number of closed connections
+        """
+        evicted = 0
+        now = time.monotonic()
+        with self._devices_lock:
+            devices = list(self._devices.values())
+        for device in devices:
+            if not device.lock.acquire(blocking=False):
+                continue
+            try:
+                if device.remote is not None and now - device.last_used > self.idle_timeout:
+                    self._discard(device)
+                    evicted += 1
+            finally:
+                device.lock.release()
+        return evicted
+
+    def close(self):
+        with self._devices_lock:
+            devices = list(self._devices.values())
+            self._devices.clear()
+        for device in devices:
+            with device.lock:
+                self._discard(device)
+
+    def health(self, hostname, port=None):
+        """
+        :return: DeviceHealth of a smartphone
+        """
+        return self._device(hostname, port).health
+
+    def _device(self, hostname, port):
+        with self._devices_lock:
+            device = self._devices.get((hostname, port))
+            if device is None:
+                device = self._devices[(hostname, port)] = _PooledDevice(self.health_factory())
+            return device
+
+    @staticmethod
+    def _name(hostname, port):
+        return hostname if port is None else '%s:%d' % (hostname, port)
+
+    @staticmethod
+    def _observe_round_trip(device, remote):
+        round_trip = getattr(remote, 'last_round_trip_s', None)
+        if round_trip is not None:
+            device.health.observe_round_trip(round_trip)
+            remote.last_round_trip_s = None
+
+    @staticmethod
+    def _discard(device):
+        if device.remote is not None:
+            device.remote.close()
+            device.remote = None
@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+
+from .RemoteControl import (
+    PROPS_PATH, SUPPORTED_SERVER_VERSIONS, VIDEO_INFO_REQUEST, VIDEO_RANGE_REQUEST, load_properties,
+)
+
+# Sent to identify a server. The phone doesn't know it and answers with an error response carrying
+# its version, so the handshake has no effect on the phone
+HANDSHAKE_REQUEST = 'hello'
+# Seconds to connect and to get each handshake response. A phone on the LAN answers in milliseconds,
+# addresses without a host never answer, so this bounds the scan time
+PROBE_TIMEOUT_S = 0.5
+# Handshakes per device, the fastest is taken as its round trip
+HANDSHAKE_ROUNDS = 3
+# Addresses probed at the same time
+SCAN_CONCURRENCY = 256
+# Largest network scanned, a /22
+MAX_SCAN_ADDRESSES = 1024
+# Prefix length of the local network scanned when none is given
+LOCAL_PREFIX = 24
+# Bytes of the last video fetched to measure the bandwidth of servers with the get_video_range extension.
+# Other phones get their bandwidth from the downloads reported to DeviceRegistry.observe_transfer
+BANDWIDTH_PROBE_BYTES = 1024 * 1024
+BANDWIDTH_PROBE_TIMEOUT_S = 5.0
+# Devices not seen by a scan for this many seconds are dropped from the registry
+DEVICE_TTL_S = 180.0
+
+# Answered the handshake with a supported version
+READY = 'ready'
+# Accepts connections but doesn't answer: the phone serves one client at a time and another one holds it
+BUSY = 'busy'
+# Answered with a version this client doesn't support
+UNSUPPORTED = 'unsupported'
+
+
+class DeviceInfo:
+    """
+    A smartphone found on the network and what was measured of it
+    """
+
+    def __init__(self, hostname, port, state=READY, version=None, round_trip_s=None, bandwidth_bytes_s=None,
+                 last_seen=None):
+        self.hostname = hostname
+        self.port = port
+        self.state = state
+        self.version = version
+        self.round_trip_s = round_trip_s
+        self.bandwidth_bytes_s = bandwidth_bytes_s
+        self.last_seen = time.time() if last_seen is None else last_seen
+
+    @property
+    def host(self):
+        """
+        :return: (str) "hostname:port", as taken by the examples and Rig
+        """
+        return '%s:%d' % (self.hostname, self.port)
+
+    def as_dict(self):
+        return {
+            'hostname': self.hostname,
+            'port': self.port,
+            'state': self.state,
+            'version': self.version,
+            'round_trip_ms': None if self.round_trip_s is None else self.round_trip_s * 1000,
+            'bandwidth_mb_s': None if self.bandwidth_bytes_s is None else self.bandwidth_bytes_s / 1e6,
+            'last_seen': self.last_seen,
+        }
+
+
+async def _read_response(reader, end):
+    """
+    :return: Tuple (status, version, body lines) of a line protocol response
+    """
+    lines = []
+    while len(lines) < 2 or lines[-1] != end:
+        line = await reader.readline()
+        if not line:
+            raise EOFError()
+        lines.append(line.decode().rstrip('\n'))
+    return lines[0], lines[1], lines[2:-1]
+
+
+async def _measure_bandwidth(reader, writer, props, n_bytes):
+    """
+    :return: (float) bytes per second receiving part of the last video, None if the server can't send ranges
+    """
+    end = props['CHUNK_END_DELIMITER']
+    writer.write((VIDEO_INFO_REQUEST + '\n').encode())
+    status, _, body = await _read_response(reader, end)
+    if status != props['SUCCESS'] or not int(body[0]):
+        return None
+    start = time.perf_counter()
+    writer.write((VIDEO_RANGE_REQUEST % (0, min(n_bytes, int(body[0]))) + '\n').encode())
+    status, _, body = await _read_response(reader, end)
+    if status != props['SUCCESS']:
+        return None
+    length = int(body[0])
+    await reader.readexactly(length)
+    return length / (time.perf_counter() - start)
+
+
+async def probe(hostname, port=None, timeout=PROBE_TIMEOUT_S, rounds=HANDSHAKE_ROUNDS,
+                bandwidth_bytes=BANDWIDTH_PROBE_BYTES):
+    """
+    Checks whether a smartphone server listens at an address
+    :param port: (int) RPC port, defaults to RPC_PORT from the server properties
+    :param timeout: (float) seconds allowed for connecting and for each handshake
+    :param rounds: (int) handshakes, the fastest is the round trip
+    :param bandwidth_bytes: (int) bytes to fetch for the bandwidth, 0 skips the measurement
+    :return: DeviceInfo, None if nothing answers there like a phone
+    """
+    props = load_properties(PROPS_PATH)
+    port = int(port or props['RPC_PORT'])
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(hostname, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    device = DeviceInfo(hostname, port)
+    try:
+        round_trips = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            writer.write((HANDSHAKE_REQUEST + '\n').encode())
+            status, device.version, _ = await asyncio.wait_for(
+                _read_response(reader, props['CHUNK_END_DELIMITER']), timeout
+            )
+            round_trips.append(time.perf_counter() - start)
+            if status not in (props['SUCCESS'], props['ERROR']) or device.version not in SUPPORTED_SERVER_VERSIONS:
+                device.state = UNSUPPORTED
+                return device
+        device.round_trip_s = min(round_trips)
+        if bandwidth_bytes:
+            try:
+                device.bandwidth_bytes_s = await asyncio.wait_for(
+                    _measure_bandwidth(reader, writer, props, bandwidth_bytes), BANDWIDTH_PROBE_TIMEOUT_S
+                )
+            except (OSError, EOFError, ValueError, IndexError, asyncio.TimeoutError):
+                pass
+        return device
+    except asyncio.TimeoutError:
+        device.state = BUSY
+        return device
+    except (OSError, EOFError, UnicodeDecodeError):
+        # closed or garbled: some other service on the port
+        return None
+    finally:
+        writer.close()
+
+
+def local_subnet(prefix=LOCAL_PREFIX):
+    """
+    :return: (str) the network of the interface used to reach the LAN, e.g. "192.168.4.0/24"
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # no packet is sent, this only picks the outgoing interface
+        sock.connect(('10.255.255.255', 1))
+        address = sock.getsockname()[0]
+    except OSError:
+        address = '127.0.0.1'
+    finally:
+        sock.close()
+    return str(ipaddress.ip_network('%s/%d' % (address, prefix), strict=False))
+
+
+def subnet_hosts(subnet):
+    """
+    :param subnet: (str) network, e.g. "192.168.4.0/24", or a single address
+    :return: list of the host addresses (str) of the network
+    """
+    network = ipaddress.ip_network(subnet, strict=False)
+    if network.num_addresses > MAX_SCAN_ADDRESSES:
+        raise ValueError('%s has %d addresses, at most %d are scanned' % (
+            subnet, network.num_addresses, MAX_SCAN_ADDRESSES
+        ))
+    return [str(address) for address in network.hosts()] or [str(network.network_address)]
+
+
+async def scan(subnet=None, port=None, hosts=None, concurrency=SCAN_CONCURRENCY, **probe_kwargs):
+    """
+    Probes every address of a network at once, concurrency at a time
+    :param subnet: (str) network to scan, the local one (see local_subnet) by default
+    :param port: (int) RPC port, defaults to RPC_PORT from the server properties
+    :param hosts: (list) addresses to probe instead of a network
+    :param probe_kwargs: passed to probe()
+    :return: list of DeviceInfo of the devices found, ready ones first, fastest first
+    """
+    if hosts is None:
+        hosts = subnet_hosts(subnet or local_subnet())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(hostname):
+        async with semaphore:
+            return await probe(hostname, port, **probe_kwargs)
+
+    found = [device for device in await asyncio.gather(*(limited(host) for host in hosts)) if device is not None]
+    return sorted(found, key=_rank)
+
+
+def discover(subnet=None, port=None, **kwargs):
+    """
+    Blocking scan(), for scripts
+    :return: list of DeviceInfo, see scan()
+    """
+    return asyncio.run(scan(subnet, port, **kwargs))
+
+
+def _rank(device):
+    return device.state != READY, device.round_trip_s if device.round_trip_s is not None else float('inf')
+
+
+class DeviceRegistry:
+    """
+    Devices found by the scans, each kept until ttl seconds after a scan last
+    saw it, so a phone missing one scan isn't forgotten. A phone busy with
+    another client can't answer the handshake: it keeps what earlier scans
+    measured. Phones this process is connected to aren't probed, they would
+    look busy too. Safe to use from several threads.
+    """
+
+    def __init__(self, ttl=DEVICE_TTL_S, clock=time.time):
+        """
+        Args:
+            ttl (float): Seconds a device is kept after it was last seen
+            clock (callable): Time in seconds, the last_seen timestamps
+        """
+        self.ttl = ttl
+        self._clock = clock
+        self._devices = {}
+        self._lock = threading.Lock()
+        self.scanned_at = None
+        self.subnet = None
+
+    async def refresh(self, subnet=None, port=None, held=None, **kwargs):
+        """
+        Scans the network and updates the registry, see scan()
+        :param held: (callable) optional, returns the hostnames this process holds a connection to,
+        e.g. from ConnectionPool.status(). Registered ones are kept ready instead of being probed:
+        the phone serves one client at a time, so the probe would find it busy
+        :return: list of DeviceInfo currently registered
+        """
+        subnet = subnet or local_subnet()
+        port = int(port or load_properties(PROPS_PATH)['RPC_PORT'])
+        skipped = self._registered(held() if held else (), port)
+        hosts = [hostname for hostname in subnet_hosts(subnet) if hostname not in skipped]
+        found = await scan(port=port, hosts=hosts, **kwargs)
+        # connected to while the scan ran
+        skipped |= self._registered(held() if held else (), port)
+        self.update([device for device in found if device.state != BUSY or device.hostname not in skipped])
+        self._keep_ready(skipped, port)
+        self.scanned_at = self._clock()
+        self.subnet = subnet
+        return self.devices()
+
+    def update(self, found):
+        """
+        Registers devices seen now
+        :param found: (list) DeviceInfo objects
+        """
+        now = self._clock()
+        with self._lock:
+            for device in found:
+                known = self._devices.get((device.hostname, device.port))
+                if known is not None and device.state == BUSY:
+                    known.state = BUSY
+                    known.last_seen = now
+                    continue
+                if known is not None and device.bandwidth_bytes_s is None:
+                    device.bandwidth_bytes_s = known.bandwidth_bytes_s
+                device.last_seen = now
+                self._devices[(device.hostname, device.port)] = device
+
+    def _registered(self, hostnames, port):
+        with self._lock:
+            return {hostname for hostname in hostnames if (hostname, port) in self._devices}
+
+    def _keep_ready(self, hostnames, port):
+        now = self._clock()
+        with self._lock:
+            for hostname in hostnames:
+                device = self._devices.get((hostname, port))
+                if device is not None:
+                    device.state = READY
+                    device.last_seen = now
+
+    def observe_transfer(self, hostname, port, n_bytes, seconds):
+        """
+        Records the bandwidth of a transfer from a registered device, e.g. a video download
+        :param port: (int) RPC port, defaults to RPC_PORT from the server properties
+        """
+        if seconds <= 0:
+            return
+        port = int(port or load_properties(PROPS_PATH)['RPC_PORT'])
+        with self._lock:
+            device = self._devices.get((hostname, port))
+            if device is not None:
+                device.bandwidth_bytes_s = n_bytes / seconds
+
+    def devices(self):
+        """
+        :return: list of DeviceInfo seen within ttl, ready ones first, fastest first
+        """
+        expired_before = self._clock() - self.ttl
+        with self._lock:
+            for key in [key for key, device in self._devices.items() if device.last_seen < expired_before]:
+                del self._devices[key]
+            return sorted(self._devices.values(), key=_rank)
+
+    def best(self):
+        """
+        :return: DeviceInfo of the fastest ready device, None if there is none
+        """
+        devices = self.devices()
+        return devices[0] if devices and devices[0].state == READY else None
+
+    def status(self):
+        """
+        :return: dict with the registered devices, the last scan time, the scanned subnet and the ttl
+        """
+        return {
+            'devices': [device.as_dict() for device in self.devices()],
+            'scanned_at': self.scanned_at,
+            'subnet': self.subnet,
+            'ttl_s': self.ttl,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find OpenCamera Sensors smartphones on the network")
+    parser.add_argument('subnet', nargs='?', help="network to scan, e.g. 192.168.4.0/24, the local /24 by default")
+    parser.add_argument('--port', type=int, help="RPC port, RPC_PORT of the server properties by default")
+    parser.add_argument('--timeout', type=float, default=PROBE_TIMEOUT_S, help="seconds to wait for each address")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    devices = discover(args.subnet, args.port, timeout=args.timeout)
+    print('%-22s %-12s %-10s %10s %12s' % ('host', 'state', 'version', 'RTT ms', 'MB/s'))
+    for device in devices:
+        info = device.as_dict()
+        print('%-22s %-12s %-10s %10s %12s' % (
+            device.host, device.state, device.version or '-',
+            '%.2f' % info['round_trip_ms'] if info['round_trip_ms'] is not None else '-',
+            '%.1f' % info['bandwidth_mb_s'] if info['bandwidth_mb_s'] is not None else '-',
+        ))
+    print('%d device(s) found in %.1f s' % (len(devices), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+import argparse
+import hashlib
+import random
+import re
+import socket
+import threading
+import time
+
+from .RemoteControl import CLOCK_REQUEST, PROPS_PATH, VIDEO_INFO_REQUEST, load_properties
+from .framing import (
+    BINARY, BINARY_FRAMING_VERSIONS, FRAME_END, FRAME_ROWS, FRAME_SENSOR, FRAME_STATUS, FRAME_TEXT,
+    FRAMING_REQUEST, encode_frame,
+)
+
+IMU_REQUEST_PATTERN = re.compile(r'imu\?duration=(\d+)&accel=(\d)&gyro=(\d)&magnetic=(\d)')
+VIDEO_RANGE_REQUEST_PATTERN = re.compile(r'get_video_range\?offset=(\d+)&length=(\d+)')
+# Same block is sent over and over, so serving a multi-GB "video" costs no memory
+PAYLOAD_BLOCK_SIZE = 1024 * 1024
+SENSOR_NAMES = ('accel', 'gyro', 'magnetic')
+# accept() polls with this timeout so stop() is noticed, like SOCKET_WAIT_TIME_MS on the phone
+ACCEPT_TIMEOUT_S = 0.5
+# IMU rows per FRAME_ROWS frame in binary framing
+ROWS_PER_FRAME = 4096
+# Bytes sent at a time by a simulated link, the granularity of stalls and rate limiting
+LINK_QUANTUM = 64 * 1024
+
+
+def payload_block():
+    """
+    :return: (bytes) the repeating block the fake video payload is made of
+    """
+    return bytes(range(256)) * (PAYLOAD_BLOCK_SIZE // 256)
+
+
+class LinkProfile:
+    """
+    Network conditions a FakePhoneServer imposes on its responses, e.g. to mimic
+    the phone's Wi-Fi: a delay before every response, a send rate cap and random
+    stalls in the middle of transfers. Each connection is shaped on its own.
+    """
+
+    def __init__(self, bandwidth_mb_s=None, latency_ms=0.0, latency_jitter_ms=0.0,
+                 stall_probability=0.0, stall_ms=0.0, seed=None):
+        """
+        Args:
+            bandwidth_mb_s (float): Send rate of each connection in MB/s, None for unlimited
+            latency_ms (float): Delay before every response
+            latency_jitter_ms (float): Random extra delay before every response, uniform up to this
+            stall_probability (float): Chance of a stall before each LINK_QUANTUM bytes sent
+            stall_ms (float): Length of a stall
+            seed (int): Seed of the random delays and stalls, None for a different run every time
+        """
+        self.bandwidth_mb_s = bandwidth_mb_s
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.stall_probability = stall_probability
+        self.stall_ms = stall_ms
+        self.seed = seed
+
+    def as_dict(self):
+        return {
+            'bandwidth_mb_s': self.bandwidth_mb_s,
+            'latency_ms': self.latency_ms,
+            'latency_jitter_ms': self.latency_jitter_ms,
+            'stall_probability': self.stall_probability,
+            'stall_ms': self.stall_ms,
+        }
+
+
+class _ShapedConnection:
+    """
+    Client socket of the fake server sending through a LinkProfile
+    """
+
+    def __init__(self, conn, profile):
+        self.conn = conn
+        self.profile = profile
+        self.stalls = 0
+        self._random = random.Random(profile.seed)
+        # when the link is free again, for the rate limit
+        self._next_send = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def respond_delay(self):
+        profile = self.profile
+        delay_ms = profile.latency_ms + self._random.uniform(0.0, profile.latency_jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+    def sendall(self, data):
+        profile = self.profile
+        view = memoryview(data)
+        for offset in range(0, len(view), LINK_QUANTUM):
+            part = view[offset:offset + LINK_QUANTUM]
+            if profile.stall_probability and self._random.random() < profile.stall_probability:
+                self.stalls += 1
+                time.sleep(profile.stall_ms / 1000.0)
+            self.conn.sendall(part)
+            if profile.bandwidth_mb_s:
+                now = time.perf_counter()
+                self._next_send = max(self._next_send, now) + len(part) / (profile.bandwidth_mb_s * 1e6)
+                if self._next_send > now:
+                    time.sleep(self._next_send - now)
+
+
+class FakePhoneServer:
+    """
+    Local stand-in for the OpenCamera Sensors RPC server (see RemoteRpcServer.java).
+    Speaks the same line protocol, so RemoteControl can be exercised and
+    benchmarked without a smartphone.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, video_size=64 * 1024 * 1024,
+                 video_name='VID_fake.mp4', imu_rate_hz=200, props_path=PROPS_PATH,
+                 supports_ranges=True, drop_after=None, realtime_imu=False, binary_framing=False, link=None,
+                 clock_offset_ns=0, clock_drift_ppm=0.0):
+        """
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on, 0 picks a free one
+            video_size (int): Size of the video returned by get_video in bytes
+            video_name (str): Filename reported for the video
+            imu_rate_hz (int): Sample rate of the generated IMU rows
+            props_path (str): Path to server_config.properties
+            supports_ranges (bool): Serve the video_info/get_video_range extension,
+            when False these requests get the phone app's "Invalid request" error
+            drop_after (int): If set, the first video transfer longer than this is cut after this many bytes
+            realtime_imu (bool): Answer IMU requests only after the requested duration, like the phone,
+            with timestamps from the phone clock (see clock_ns) so consecutive recordings line up
+            binary_framing (bool): Report a server version with binary framing and accept FRAMING_REQUEST
+            link (LinkProfile): Simulated network conditions, None sends as fast as possible
+            clock_offset_ns (int): Offset of the simulated phone clock from the host's monotonic clock
+            clock_drift_ppm (float): Rate error of the simulated phone clock, in parts per million
+        """
+        self.props = load_properties(props_path)
+        self.video_size = video_size
+        self.video_name = video_name
+        self.imu_rate_hz = imu_rate_hz
+        self.supports_ranges = supports_ranges
+        self.drop_after = drop_after
+        self.realtime_imu = realtime_imu
+        self.binary_framing = binary_framing
+        self.link = link
+        self.clock_offset_ns = clock_offset_ns
+        self.clock_drift_ppm = clock_drift_ppm
+        self._clock_start_ns = time.monotonic_ns()
+        self.version = BINARY_FRAMING_VERSIONS[0] if binary_framing else self.props['SERVER_VERSION']
+        self._block = payload_block()
+        self._video_sha256 = None
+        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind((host, port))
+        self._thread = None
+        self._running = False
+
+    @property
+    def video_sha256(self):
+        """
+        :return: (str) SHA-256 hex digest of the served video
+        """
+        if self._video_sha256 is None:
+            digest = hashlib.sha256()
+            full_blocks, rest = divmod(self.video_size, len(self._block))
+            for _ in range(full_blocks):
+                digest.update(self._block)
+            digest.update(self._block[:rest])
+            self._video_sha256 = digest.hexdigest()
+        return self._video_sha256
+
+    def clock_ns(self):
+        """
+        :return: (int) time of the simulated phone clock in ns, answered to CLOCK_REQUEST
+        """
+        now = time.monotonic_ns()
+        return now + self.clock_offset_ns + int((now - self._clock_start_ns) * self.clock_drift_ppm * 1e-6)
+
+    @property
+    def address(self):
+        """
+        :return: Tuple (host, port) the server is listening on
+        """
+        return self._server_socket.getsockname()
+
+    def start(self):
+        self._server_socket.listen(16)
+        self._server_socket.settimeout(ACCEPT_TIMEOUT_S)
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self._server_socket.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._server_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def _serve_client(self, conn):
+        binary = False
+        with conn, conn.makefile('rb') as reader:
+            if self.link is not None:
+                conn = _ShapedConnection(conn, self.link)
+            for line in reader:
+                try:
+                    if self.link is not None:
+                        conn.respond_delay()
+                    binary = self._handle_request(line.decode().strip('\n'), conn, binary)
+                except OSError:
+                    break
+
+    def _handle_request(self, msg, conn, binary):
+        """
+        :param binary: (bool) the connection uses binary framing
+        :return: (bool) whether the following responses use binary framing
+        """
+        imu_match = IMU_REQUEST_PATTERN.search(msg)
+        range_match = VIDEO_RANGE_REQUEST_PATTERN.search(msg) if self.supports_ranges else None
+        if imu_match:
+            duration_ms = int(imu_match.group(1))
+            wanted = [int(flag) == 1 for flag in imu_match.groups()[1:]]
+            self._send(conn, self._imu_response(duration_ms, wanted, binary))
+        elif msg == self.props['VIDEO_START_REQUEST']:
+            # phase, average frame duration and exposure time, see VideoPhaseInfo.toString()
+            self._send(conn, self._success('%d\n%s\n%d\n' % (12345678, 33333333.0, 10000000), binary))
+        elif msg == self.props['VIDEO_STOP_REQUEST']:
+            self._send(conn, self._success('', binary))
+        elif msg == self.props['GET_VIDEO_REQUEST']:
+            self._send(conn, self._success('%d\n%s\n' % (self.video_size, self.video_name), binary))
+            self._send_video(conn, 0, self.video_size)
+        elif range_match:
+            offset = min(int(range_match.group(1)), self.video_size)
+            length = min(int(range_match.group(2)), self.video_size - offset)
+            self._send(conn, self._success('%d\n%s\n' % (length, self.video_name), binary))
+            self._send_video(conn, offset, length)
+        elif msg == VIDEO_INFO_REQUEST and self.supports_ranges:
+            self._send(conn, self._success(
+                '%d\n%s\n%s\n' % (self.video_size, self.video_name, self.video_sha256), binary
+            ))
+        elif msg == CLOCK_REQUEST:
+            self._send(conn, self._success('%d\n' % self.clock_ns(), binary))
+        elif msg == FRAMING_REQUEST and self.binary_framing:
+            # answered in the current framing, the switch applies to the next response
+            self._send(conn, self._success(BINARY + '\n', binary))
+            return True
+        else:
+            self._send(conn, self._error('Invalid request', binary))
+        return binary
+
+    def _send_video(self, conn, offset, length):
+        drop_after = self.drop_after
+        if drop_after is not None and drop_after < length:
+            self.drop_after = None
+            self._send_payload(conn, offset, drop_after)
+            # simulate the link going down mid-transfer
+            conn.shutdown(socket.SHUT_RDWR)
+            raise ConnectionAbortedError()
+        self._send_payload(conn, offset, length)
+
+    def _send_payload(self, conn, offset, length):
+        # payload byte i is self._block[i % len(self._block)]
+        block = memoryview(self._block)
+        position = offset % len(block)
+        remaining = length
+        while remaining > 0:
+            n_bytes = min(remaining, len(block) - position)
+            conn.sendall(block[position:position + n_bytes])
+            remaining -= n_bytes
+            position = 0
+
+    def _imu_response(self, duration_ms, wanted, binary):
+        n_rows = duration_ms * self.imu_rate_hz // 1000
+        period_ns = 1000000000 // self.imu_rate_hz
+        start_ns = 0
+        if self.realtime_imu:
+            start_ns = self.clock_ns()
+            time.sleep(duration_ms / 1000.0)
+        sensors = []
+        for name, want in zip(SENSOR_NAMES, wanted):
+            if want:
+                rows = [
+                    '%s,%s,%s,%d\n' % (0.01 * (i % 100), -0.02 * (i % 50), 9.81, start_ns + i * period_ns)
+                    for i in range(n_rows)
+                ]
+                sensors.append(('%s.csv' % name, rows))
+        if not binary:
+            parts = []
+            for filename, rows in sensors:
+                parts.append(filename + '\n')
+                parts.extend(rows)
+                parts.append(self.props['SENSOR_END_MARKER'] + '\n')
+            return self._success(''.join(parts), binary)
+        frames = [self._status_frame(self.props['SUCCESS'])]
+        for filename, rows in sensors:
+            frames.append(encode_frame(FRAME_SENSOR, filename.encode()))
+            for start in range(0, len(rows), ROWS_PER_FRAME):
+                frames.append(encode_frame(FRAME_ROWS, ''.join(rows[start:start + ROWS_PER_FRAME]).encode()))
+        frames.append(encode_frame(FRAME_END))
+        return b''.join(frames)
+
+    def _success(self, message, binary=False):
+        if binary:
+            return self._frames(self.props['SUCCESS'], message)
+        return '%s\n%s\n%s%s\n' % (
+            self.props['SUCCESS'], self.version, message, self.props['CHUNK_END_DELIMITER']
+        )
+
+    def _error(self, message, binary=False):
+        if binary:
+            return self._frames(self.props['ERROR'], message)
+        return '%s\n%s\n%s\n%s\n' % (
+            self.props['ERROR'], self.version, message, self.props['CHUNK_END_DELIMITER']
+        )
+
+    def _status_frame(self, status):
+        return encode_frame(FRAME_STATUS, ('%s\n%s' % (status, self.version)).encode())
+
+    def _frames(self, status, message):
+        frames = [self._status_frame(status)]
+        if message:
+            frames.append(encode_frame(FRAME_TEXT, message.encode()))
+        frames.append(encode_frame(FRAME_END))
+        return b''.join(frames)
+
+    @staticmethod
+    def _send(conn, data):
+        conn.sendall(data.encode() if isinstance(data, str) else data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenCamera Sensors RPC server")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to listen on, 0.0.0.0 for the LAN")
+    parser.add_argument('--port', type=int, help="port to listen on, RPC_PORT of the server properties by default")
+    parser.add_argument('--video-mb', type=float, default=64, help="size of the served video in MB")
+    parser.add_argument('--imu-rate', type=int, default=200, help="IMU sample rate in Hz")
+    parser.add_argument('--bandwidth-mb-s', type=float, help="send rate cap per connection in MB/s")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="delay before every response")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="random extra delay before every response")
+    parser.add_argument('--stall-probability', type=float, default=0.0, help="chance of a stall per 64 KiB sent")
+    parser.add_argument('--stall-ms', type=float, default=0.0, help="length of a stall")
+    parser.add_argument('--binary-framing', action='store_true', help="offer binary framing")
+    parser.add_argument('--clock-offset-ms', type=float, default=0.0, help="offset of the phone clock from the host's")
+    parser.add_argument('--clock-drift-ppm', type=float, default=0.0, help="rate error of the phone clock")
+    args = parser.parse_args()
+
+    link = LinkProfile(args.bandwidth_mb_s, args.latency_ms, args.jitter_ms, args.stall_probability, args.stall_ms)
+    port = args.port if args.port is not None else int(load_properties(PROPS_PATH)['RPC_PORT'])
+    server = FakePhoneServer(
+        args.host, port, video_size=int(args.video_mb * 1e6), imu_rate_hz=args.imu_rate,
+        realtime_imu=True, binary_framing=args.binary_framing, link=link,
+        clock_offset_ns=int(args.clock_offset_ms * 1e6), clock_drift_ppm=args.clock_drift_ppm,
+    )
+    with server:
+        print("Fake phone listening on %s:%d" % server.address)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import struct
+
+from .imu_stream import ImuStreamParser, sensor_name
+
+TEXT = 'text'
+BINARY = 'binary'
+# Binary frames if the server supports them, the line protocol otherwise
+AUTO = 'auto'
+# Server versions that can switch a connection to length-prefixed frames.
+# The phone app (v.0.1.1) only speaks the line protocol
+BINARY_FRAMING_VERSIONS = ['v.0.2.0']
+# Asks the server to send the following responses as frames. Requests stay text lines
+FRAMING_REQUEST = 'framing?mode=binary'
+# Size of each recv() of the shared read buffer
+READ_BUFFER_SIZE = 256 * 1024
+
+# Every frame is a 1-byte type and a 4-byte big-endian payload length, then the payload
+FRAME_HEADER = struct.Struct('!BI')
+# End of a response, empty
+FRAME_END = 0
+# b"<status>\n<version>", first frame of every response
+FRAME_STATUS = 1
+# Lines of the response body, e.g. the phase info of video_start or an error message
+FRAME_TEXT = 2
+# IMU file name, starts the rows of a sensor
+FRAME_SENSOR = 3
+# Complete csv rows of the current sensor
+FRAME_ROWS = 4
+
+
+def encode_frame(kind, payload=b''):
+    """
+    :param kind: (int) one of the FRAME_* types
+    :param payload: (bytes) frame payload
+    :return: (bytes) the frame as sent on the wire
+    """
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+class SocketReader:
+    """
+    Receive side of a connection, shared by all the calls made on it. Lines are
+    cut out of large recv() calls instead of being read byte by byte, and bytes
+    that arrive early (the start of the next pipelined response) stay buffered
+    for the next call. Large payloads bypass the buffer once it is drained.
+    """
+
+    def __init__(self, sock, buffer_size=READ_BUFFER_SIZE):
+        """
+        Args:
+            sock (socket.socket): Connected socket
+            buffer_size (int): Bytes requested per recv()
+        """
+        self.sock = sock
+        self.buffer_size = buffer_size
+        self._data = bytearray()
+        self._start = 0
+
+    @property
+    def buffered(self):
+        """
+        :return: (int) bytes received but not consumed yet
+        """
+        return len(self._data) - self._start
+
+    def readline(self):
+        """
+        :return: (bytes) next line without its newline
+        """
+        newline = self._data.find(b'\n', self._start)
+        while newline < 0:
+            searched = len(self._data)
+            self._fill()
+            newline = self._data.find(b'\n', searched)
+        line = bytes(self._data[self._start:newline])
+        self._consume(newline + 1 - self._start)
+        return line
+
+    def read_exact(self, n_bytes):
+        """
+        :return: (bytes) the next n_bytes bytes
+        """
+        while self.buffered < n_bytes:
+            self._fill()
+        data = bytes(self._data[self._start:self._start + n_bytes])
+        self._consume(n_bytes)
+        return data
+
+    def read_some(self):
+        """
+        :return: (bytes) everything buffered, or the result of one recv() if nothing is
+        """
+        if not self.buffered:
+            self._fill()
+        data = bytes(self._data[self._start:])
+        self._consume(len(data))
+        return data
+
+    def readinto(self, view):
+        """
+        Fills view from the buffer, or straight from the socket once the buffer is empty
+        :param view: (memoryview) writable destination
+        :return: (int) number of bytes written to view, at least 1
+        """
+        if self.buffered:
+            n_bytes = min(len(view), self.buffered)
+            view[:n_bytes] = self._data[self._start:self._start + n_bytes]
+            self._consume(n_bytes)
+            return n_bytes
+        n_bytes = self.sock.recv_into(view)
+        if not n_bytes:
+            raise EOFError()
+        return n_bytes
+
+    def unread(self, data):
+        """
+        Puts data back in front of the buffer, for parsers that read past the end of a response
+        """
+        if data:
+            self._data[self._start:self._start] = data
+
+    def read_frame(self):
+        """
+        :return: Tuple (frame type, payload bytes)
+        """
+        kind, length = FRAME_HEADER.unpack(self.read_exact(FRAME_HEADER.size))
+        return kind, self.read_exact(length)
+
+    def _fill(self):
+        data = self.sock.recv(self.buffer_size)
+        if not data:
+            raise EOFError()
+        self._data += data
+
+    def _consume(self, n_bytes):
+        self._start += n_bytes
+        if self._start == len(self._data):
+            del self._data[:]
+            self._start = 0
+        elif self._start > self.buffer_size:
+            # drop consumed bytes once in a while instead of after every line
+            del self._data[:self._start]
+            self._start = 0
+
+
+class TextFraming:
+    """
+    The phone's line protocol: status and version lines, then the body up to a
+    CHUNK_END_DELIMITER line, IMU rows delimited by SENSOR_END_MARKER lines
+    """
+    name = TEXT
+
+    def __init__(self, props):
+        """
+        Args:
+            props (dict): Server properties, see load_properties
+        """
+        self.props = props
+        self._end = props['CHUNK_END_DELIMITER'].encode()
+
+    def read_status(self, reader):
+        """
+        :return: Tuple (status, server version)
+        """
+        status = reader.readline().decode()
+        version = reader.readline().decode()
+        return status, version
+
+    def read_lines(self, reader):
+        """
+        :return: list of the body lines (str) of the response
+        """
+        lines = []
+        line = reader.readline()
+        while line != self._end:
+            lines.append(line.decode())
+            line = reader.readline()
+        return lines
+
+    def read_imu(self, reader, builder_factory):
+        """
+        :param builder_factory: (callable) creates the row collector of each sensor, see ImuStreamParser
+        :return: dict of sensor name to the builder's result
+        """
+        parser = ImuStreamParser(
+            self.props['SENSOR_END_MARKER'], self.props['CHUNK_END_DELIMITER'], builder_factory
+        )
+        while not parser.done:
+            parser.feed(reader.read_some())
+        reader.unread(parser.remainder)
+        return parser.results()
+
+
+class BinaryFraming:
+    """
+    Length-prefixed frames (FRAME_*), negotiated with FRAMING_REQUEST. Nothing is
+    searched for delimiters: IMU rows arrive as whole blocks that go straight to
+    the builders
+    """
+    name = BINARY
+
+    def read_status(self, reader):
+        status, version = self._expect(reader, FRAME_STATUS).decode().split('\n', 1)
+        return status, version
+
+    def read_lines(self, reader):
+        lines = []
+        kind, payload = reader.read_frame()
+        while kind != FRAME_END:
+            if kind != FRAME_TEXT:
+                raise RuntimeError('Unexpected frame type %d in a text response' % kind)
+            lines.extend(payload.decode().splitlines())
+            kind, payload = reader.read_frame()
+        return lines
+
+    def read_imu(self, reader, builder_factory):
+        builders = {}
+        current = None
+        kind, payload = reader.read_frame()
+        while kind != FRAME_END:
+            if kind == FRAME_SENSOR:
+                name = sensor_name(payload.decode())
+                current = builder_factory(name)
+                builders[name] = current
+            elif kind == FRAME_ROWS and current is not None:
+                if payload:
+                    current.append(payload)
+            else:
+                raise RuntimeError('Unexpected frame type %d in an IMU response' % kind)
+            kind, payload = reader.read_frame()
+        return dict((name, builder.result()) for name, builder in builders.items())
+
+    @staticmethod
+    def _expect(reader, expected):
+        kind, payload = reader.read_frame()
+        if kind != expected:
+            raise RuntimeError('Expected frame type %d, got %d' % (expected, kind))
+        return payload
@@ -0,0 +1,225 @@
+import threading
+
+import numpy as np
+
+from .imu_stream import IMU_DTYPE, SENSOR_NAMES, parse_imu_rows
+
+# Length of each recording request of a live stream. The phone only answers an
+# IMU request once its duration is over, so this is the latency of the stream
+LIVE_WINDOW_MS = 500
+# Samples buffered per sensor, about 30 s at 500 Hz
+RING_CAPACITY = 16384
+
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+
+
+class SampleRing:
+    """
+    Fixed-size FIFO of IMU_DTYPE rows over one preallocated array.
+    Not thread-safe, ImuLiveStream guards it with its lock
+    """
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self._data = np.empty(capacity, dtype=IMU_DTYPE)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    @property
+    def free(self):
+        return len(self._data) - self._size
+
+    def write(self, rows):
+        """
+        Appends rows, overwriting the oldest ones if there isn't enough space
+        :param rows: numpy array of IMU_DTYPE
+        :return: (int) number of rows dropped to make room
+        """
+        capacity = len(self._data)
+        dropped = max(self._size + len(rows) - capacity, 0)
+        if len(rows) > capacity:
+            rows = rows[-capacity:]
+        overwritten = min(dropped, self._size)
+        self._start = (self._start + overwritten) % capacity
+        self._size -= overwritten
+
+        end = (self._start + self._size) % capacity
+        first = min(len(rows), capacity - end)
+        self._data[end:end + first] = rows[:first]
+        self._data[:len(rows) - first] = rows[first:]
+        self._size += len(rows)
+        return dropped
+
+    def read(self, max_rows=None):
+        """
+        Removes and returns the oldest rows
+        :param max_rows: (int) optional limit
+        :return: numpy array of IMU_DTYPE (a copy)
+        """
+        n_rows = self._size if max_rows is None else min(max_rows, self._size)
+        capacity = len(self._data)
+        first = min(n_rows, capacity - self._start)
+        rows = np.concatenate([self._data[self._start:self._start + first], self._data[:n_rows - first]])
+        self._start = (self._start + n_rows) % capacity
+        self._size -= n_rows
+        return rows
+
+
+class _RingBuilder:
+    """
+    Row collector for ImuStreamParser that hands rows to the live stream as they arrive
+    """
+
+    def __init__(self, stream, sensor):
+        self.stream = stream
+        self.sensor = sensor
+
+    def append(self, block):
+        self.stream._put(self.sensor, parse_imu_rows(block))
+
+    def result(self):
+        return None
+
+
+class ImuLiveStream:
+    """
+    Continuous IMU recording: back-to-back requests of window_ms are sent from a
+    background thread, and their rows are decoded while being received and
+    buffered in one SampleRing per sensor. Iterating yields batches as soon as
+    they are available, so memory stays bounded however long the stream runs.
+
+    When a ring is full the policy decides: DROP_OLDEST overwrites the oldest
+    samples and counts them in dropped, BLOCK stops reading from the socket
+    until the consumer catches up (backpressure).
+
+    The phone records nothing between two requests, so the stream has short
+    gaps at window boundaries (see alignment.find_gaps). The RemoteControl is
+    used by the stream's thread and must not be used for anything else until
+    the stream is stopped.
+    """
+
+    def __init__(self, remote, want_accel, want_gyro, want_magnetic, window_ms=LIVE_WINDOW_MS,
+                 capacity=RING_CAPACITY, policy=DROP_OLDEST):
+        """
+        Args:
+            remote (RemoteControl): Connected client
+            want_accel (bool): Stream accelerometer samples
+            want_gyro (bool): Stream gyroscope samples
+            want_magnetic (bool): Stream magnetometer samples
+            window_ms (int): Duration of each recording request
+            capacity (int): Samples buffered per sensor
+            policy (str): DROP_OLDEST or BLOCK, what to do when a buffer is full
+        """
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError('Unknown policy: %s' % policy)
+        self.remote = remote
+        self.wanted = (want_accel, want_gyro, want_magnetic)
+        self.window_ms = window_ms
+        self.policy = policy
+        sensors = [name for name, want in zip(SENSOR_NAMES, self.wanted) if want]
+        self._rings = dict((name, SampleRing(capacity)) for name in sensors)
+        self.received = dict((name, 0) for name in sensors)
+        self.dropped = dict((name, 0) for name in sensors)
+        self.windows = 0
+        self.error = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='imu-live', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops requesting new windows and waits for the current one to be received,
+        so the connection can be used again. Buffered samples can still be read
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __iter__(self):
+        while True:
+            batch = self.get()
+            if batch is None:
+                return
+            yield batch
+
+    def get(self, timeout=None):
+        """
+        Waits for samples and takes everything buffered
+        :param timeout: (float) seconds to wait, None waits until samples arrive or the stream ends
+        :return: dict sensor name -> numpy array of IMU_DTYPE with at least one non-empty array,
+        {} on timeout, None once the stream has ended and the buffers are empty
+        :raises: the error that ended the stream, once the buffers are empty
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._buffered() or not self._running, timeout)
+            if not self._buffered():
+                if self._running:
+                    return {}
+                if self.error is not None:
+                    raise self.error
+                return None
+            batch = dict((name, ring.read()) for name, ring in self._rings.items())
+            self._cond.notify_all()
+            return batch
+
+    def _buffered(self):
+        return any(len(ring) for ring in self._rings.values())
+
+    def _put(self, sensor, rows):
+        with self._cond:
+            ring = self._rings.get(sensor)
+            if ring is None:
+                return
+            self.received[sensor] += len(rows)
+            if self.policy == BLOCK:
+                while len(rows):
+                    self._cond.wait_for(lambda: ring.free or self._stopping)
+                    if self._stopping and not ring.free:
+                        # nobody is reading anymore: finish the window without buffering,
+                        # the unread samples are kept and the rest of the window is dropped
+                        self.dropped[sensor] += len(rows)
+                        break
+                    n_rows = min(ring.free, len(rows))
+                    ring.write(rows[:n_rows])
+                    rows = rows[n_rows:]
+                    self._cond.notify_all()
+                return
+            self.dropped[sensor] += ring.write(rows)
+            self._cond.notify_all()
+
+    def _run(self):
+        try:
+            while not self._stopping:
+                self.remote._recv_imu(self.window_ms, *self.wanted, builder_factory=self._builder)
+                self.windows += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def _builder(self, sensor):
+        return _RingBuilder(self, sensor)
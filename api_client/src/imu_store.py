@@ -0,0 +1,279 @@
+import json
+import os
+
+import numpy as np
+
+from .imu_stream import IMU_DTYPE, parse_imu_rows
+
+# A capture of one sensor is a directory holding one raw little-endian file per
+# IMU_DTYPE field, a json header and an index of per-chunk timestamp bounds:
+#   header.json  timestamp.bin  x.bin  y.bin  z.bin  index.bin
+FORMAT_NAME = 'imu-columns'
+FORMAT_VERSION = 1
+HEADER_FILENAME = 'header.json'
+INDEX_FILENAME = 'index.bin'
+COLUMN_SUFFIX = '.bin'
+# Rows per chunk: the granularity of time-range lookups
+CHUNK_ROWS = 65536
+
+COLUMNS = tuple((name, IMU_DTYPE[name].newbyteorder('<')) for name in IMU_DTYPE.names)
+TIMESTAMP_DTYPE = dict(COLUMNS)['timestamp']
+# One entry per complete chunk; rows after the last complete chunk form the tail chunk
+CHUNK_INDEX_DTYPE = np.dtype([
+    ('first_row', '<i8'),
+    ('rows', '<i8'),
+    ('t_min', '<i8'),
+    ('t_max', '<i8'),
+])
+
+
+def _column_path(path, name):
+    return os.path.join(path, name + COLUMN_SUFFIX)
+
+
+def _read_header(path):
+    with open(os.path.join(path, HEADER_FILENAME)) as f:
+        header = json.load(f)
+    if header.get('format') != FORMAT_NAME or header.get('version') != FORMAT_VERSION:
+        raise RuntimeError('Unsupported IMU store format in %s' % path)
+    return header
+
+
+def _stored_rows(path):
+    """
+    :return: (int) number of rows present in every column file
+    """
+    return min(os.path.getsize(_column_path(path, name)) // dtype.itemsize for name, dtype in COLUMNS)
+
+
+def _read_index(path, rows):
+    index = np.fromfile(os.path.join(path, INDEX_FILENAME), dtype=CHUNK_INDEX_DTYPE)
+    # entries written before a crash may describe rows that never reached every column
+    return index[index['first_row'] + index['rows'] <= rows]
+
+
+class ImuColumnWriter:
+    """
+    Appends IMU rows to a column store, e.g. while a recording is being received.
+    Reopening an existing store continues it; rows only partially written by an
+    interrupted writer are dropped. Timestamps must be non-decreasing.
+    """
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        """
+        Args:
+            path (str): Store directory, created if missing
+            chunk_rows (int): Rows per chunk for a new store, existing stores keep theirs
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, HEADER_FILENAME)):
+            self.chunk_rows = _read_header(path)['chunk_rows']
+            self.rows = _stored_rows(path)
+            index = _read_index(path, self.rows)
+        else:
+            self.chunk_rows = chunk_rows
+            self.rows = 0
+            index = np.empty(0, dtype=CHUNK_INDEX_DTYPE)
+            for name, _ in COLUMNS:
+                open(_column_path(path, name), 'wb').close()
+            with open(os.path.join(path, HEADER_FILENAME), 'w') as f:
+                json.dump({
+                    'format': FORMAT_NAME,
+                    'version': FORMAT_VERSION,
+                    'chunk_rows': self.chunk_rows,
+                    'columns': dict((name, dtype.str) for name, dtype in COLUMNS),
+                }, f)
+
+        self._files = {}
+        for name, dtype in COLUMNS:
+            f = open(_column_path(path, name), 'r+b')
+            f.truncate(self.rows * dtype.itemsize)
+            f.seek(0, os.SEEK_END)
+            self._files[name] = f
+        self._index_file = open(os.path.join(path, INDEX_FILENAME), 'ab')
+        self._index_file.truncate(index.nbytes)
+
+        # bounds of the chunk being filled
+        self._chunk_first = len(index) * self.chunk_rows
+        self._chunk_t_min = None
+        self._last_timestamp = int(index['t_max'][-1]) if len(index) else None
+        timestamps = np.fromfile(
+            _column_path(path, 'timestamp'), dtype=TIMESTAMP_DTYPE,
+            count=self.rows - self._chunk_first, offset=self._chunk_first * TIMESTAMP_DTYPE.itemsize
+        )
+        # complete chunks whose index entries were lost are indexed again
+        for start in range(0, len(timestamps), self.chunk_rows):
+            part = timestamps[start:start + self.chunk_rows]
+            self._chunk_t_min = int(part[0])
+            self._last_timestamp = int(part[-1])
+            if len(part) == self.chunk_rows:
+                self._close_chunk()
+
+    def append(self, rows):
+        """
+        :param rows: numpy array of IMU_DTYPE, sorted by timestamp
+        """
+        if not len(rows):
+            return
+        timestamps = rows['timestamp']
+        if np.any(np.diff(timestamps) < 0) or (
+                self._last_timestamp is not None and timestamps[0] < self._last_timestamp):
+            raise ValueError('IMU rows must be appended in timestamp order')
+        position = 0
+        while position < len(rows):
+            take = min(len(rows) - position, self._chunk_first + self.chunk_rows - self.rows)
+            part = rows[position:position + take]
+            for name, dtype in COLUMNS:
+                self._files[name].write(np.ascontiguousarray(part[name], dtype=dtype))
+            if self._chunk_t_min is None:
+                self._chunk_t_min = int(part['timestamp'][0])
+            self._last_timestamp = int(part['timestamp'][-1])
+            self.rows += take
+            position += take
+            if self.rows == self._chunk_first + self.chunk_rows:
+                self._close_chunk()
+
+    def append_csv(self, block):
+        """
+        :param block: (bytes) one or more complete "x,y,z,timestamp\\n" rows
+        """
+        self.append(parse_imu_rows(block))
+
+    def flush(self):
+        # columns first: an index entry must never point past the column data
+        for f in self._files.values():
+            f.flush()
+        self._index_file.flush()
+
+    def close(self):
+        if self._index_file.closed:
+            return
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _close_chunk(self):
+        for f in self._files.values():
+            f.flush()
+        entry = np.array(
+            [(self._chunk_first, self.chunk_rows, self._chunk_t_min, self._last_timestamp)], dtype=CHUNK_INDEX_DTYPE
+        )
+        self._index_file.write(entry.tobytes())
+        self._chunk_first += self.chunk_rows
+        self._chunk_t_min = None
+
+
+class ImuColumnReader:
+    """
+    Memory-maps a column store. Columns and time ranges are returned as NumPy
+    views of the mapped files, nothing is copied or parsed. Time-range lookups
+    use the chunk index, so only the timestamps of the two boundary chunks are read.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Store directory written by ImuColumnWriter
+        """
+        self.path = path
+        self.chunk_rows = _read_header(path)['chunk_rows']
+        self.rows = _stored_rows(path)
+        self.columns = {}
+        for name, dtype in COLUMNS:
+            if self.rows:
+                self.columns[name] = np.memmap(_column_path(path, name), dtype=dtype, mode='r', shape=(self.rows,))
+            else:
+                self.columns[name] = np.empty(0, dtype=dtype)
+
+        index = _read_index(path, self.rows)
+        tail_first = len(index) * self.chunk_rows
+        if tail_first < self.rows:
+            tail = self.columns['timestamp'][tail_first:]
+            index = np.append(index, np.array(
+                [(tail_first, len(tail), tail[0], tail[-1])], dtype=CHUNK_INDEX_DTYPE
+            ))
+        self.index = index
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def row_range(self, start_ns=None, end_ns=None):
+        """
+        :param start_ns: (int) first timestamp included, None for the beginning
+        :param end_ns: (int) first timestamp excluded, None for the end
+        :return: Tuple (first row, end row) of the rows with start_ns <= timestamp < end_ns
+        """
+        timestamps = self.columns['timestamp']
+        first, end = 0, self.rows
+        if start_ns is not None:
+            chunk = np.searchsorted(self.index['t_max'], start_ns, side='left')
+            first = self._search_chunk(chunk, start_ns, self.rows)
+        if end_ns is not None:
+            chunk = np.searchsorted(self.index['t_min'], end_ns, side='left') - 1
+            end = self._search_chunk(chunk, end_ns, 0) if chunk >= 0 else 0
+        return first, max(first, end)
+
+    def range(self, start_ns=None, end_ns=None):
+        """
+        :return: dict column name -> view of the rows with start_ns <= timestamp < end_ns, see row_range
+        """
+        first, end = self.row_range(start_ns, end_ns)
+        return dict((name, column[first:end]) for name, column in self.columns.items())
+
+    def to_array(self, start_ns=None, end_ns=None):
+        """
+        :return: numpy array of IMU_DTYPE (a copy) of the rows with start_ns <= timestamp < end_ns
+        """
+        columns = self.range(start_ns, end_ns)
+        rows = np.empty(len(columns['timestamp']), dtype=IMU_DTYPE)
+        for name, column in columns.items():
+            rows[name] = column
+        return rows
+
+    def close(self):
+        # the mappings are released once no views of them are left
+        self.columns = dict((name, np.empty(0, dtype=dtype)) for name, dtype in COLUMNS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _search_chunk(self, chunk, timestamp, past_end):
+        if chunk >= len(self.index):
+            return past_end
+        first = int(self.index['first_row'][chunk])
+        end = first + int(self.index['rows'][chunk])
+        return first + int(np.searchsorted(self.columns['timestamp'][first:end], timestamp, side='left'))
+
+
+class ImuStoreBuilder:
+    """
+    Row collector for ImuStreamParser that writes each sensor's rows to
+    <directory>/<sensor> as they arrive instead of keeping them in memory
+    """
+
+    def __init__(self, directory, sensor, chunk_rows=CHUNK_ROWS):
+        self.writer = ImuColumnWriter(os.path.join(directory, sensor or 'unknown'), chunk_rows)
+
+    def append(self, block):
+        self.writer.append_csv(block)
+
+    def result(self):
+        """
+        :return: (str) store directory of the sensor
+        """
+        self.writer.close()
+        return self.writer.path
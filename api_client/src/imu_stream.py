@@ -0,0 +1,192 @@
+import io
+
+import numpy as np
+
+# One row of a RawSensorInfo csv file: "x,y,z,timestamp", timestamp in ns
+IMU_DTYPE = np.dtype([
+    ('x', np.float32),
+    ('y', np.float32),
+    ('z', np.float32),
+    ('timestamp', np.int64),
+])
+SENSOR_NAMES = ('accel', 'gyro', 'magnetic')
+INITIAL_CAPACITY = 4096
+
+
+def sensor_name(filename):
+    """
+    :param filename: (str) IMU file name sent by the server, e.g. "20210101_120000_accel.csv"
+    :return: (str) one of SENSOR_NAMES, or None for an unknown sensor
+    """
+    for name in SENSOR_NAMES:
+        if filename.endswith(name + '.csv'):
+            return name
+    return None
+
+
+def parse_imu_rows(block):
+    """
+    :param block: (bytes) one or more complete "x,y,z,timestamp\\n" rows
+    :return: numpy array of IMU_DTYPE
+    """
+    # loadtxt parses in C (numpy >= 1.23); timestamps are read as integers
+    # so nanosecond precision survives values above 2**53
+    return np.loadtxt(io.BytesIO(block), delimiter=',', dtype=IMU_DTYPE, ndmin=1)
+
+
+def parse_imu_csv(data):
+    """
+    Parses RawSensorInfo csv rows in one go
+    :param data: (bytes or str) csv rows, e.g. the contents of an accel.csv file
+    :return: numpy array of IMU_DTYPE
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+    builder = ImuArrayBuilder()
+    if data:
+        builder.append(data)
+    return builder.result()
+
+
+class ImuArrayBuilder:
+    """
+    Growable IMU_DTYPE array filled from blocks of complete csv rows.
+    Capacity doubles when full, so appending n rows costs amortized O(n).
+    """
+
+    def __init__(self, sensor=None, capacity=INITIAL_CAPACITY):
+        """
+        Args:
+            sensor (str): Sensor name, one of SENSOR_NAMES
+            capacity (int): Initial capacity in rows
+        """
+        self.sensor = sensor
+        self._data = np.empty(capacity, dtype=IMU_DTYPE)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, block):
+        """
+        :param block: (bytes) one or more complete "x,y,z,timestamp\\n" rows
+        """
+        rows = parse_imu_rows(block)
+        n_rows = len(rows)
+        self._reserve(self._size + n_rows)
+        self._data[self._size:self._size + n_rows] = rows
+        self._size += n_rows
+
+    def result(self):
+        """
+        :return: numpy array of IMU_DTYPE holding the rows appended so far
+        """
+        return self._data[:self._size]
+
+    def _reserve(self, capacity):
+        if capacity > len(self._data):
+            grown = np.empty(max(capacity, 2 * len(self._data)), dtype=IMU_DTYPE)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+
+
+class CsvTextBuilder:
+    """
+    Collects the raw csv rows of a sensor, for the string-returning get_imu()
+    """
+
+    def __init__(self, sensor=None):
+        self.sensor = sensor
+        self._blocks = []
+
+    def append(self, block):
+        self._blocks.append(block)
+
+    def result(self):
+        return b''.join(self._blocks).decode()
+
+
+class ImuStreamParser:
+    """
+    Incremental parser for the IMU response payload:
+    for every sensor a filename line, csv rows and the sensor end marker,
+    then the chunk end delimiter. Rows are handed to a builder per sensor
+    as soon as complete lines arrive.
+    """
+
+    def __init__(self, sensor_end_marker, end_delimiter, builder_factory=ImuArrayBuilder):
+        """
+        Args:
+            sensor_end_marker (str): SENSOR_END_MARKER from the server properties
+            end_delimiter (str): CHUNK_END_DELIMITER from the server properties
+            builder_factory (callable): Creates the row collector for each sensor, called with the sensor name
+        """
+        self._marker = sensor_end_marker.encode() + b'\n'
+        self._end = end_delimiter.encode()
+        self._builder_factory = builder_factory
+        self._tail = b''
+        self._current = None
+        self.builders = {}
+        self.done = False
+        # bytes fed after the end delimiter, the start of whatever follows the response
+        self.remainder = b''
+
+    def feed(self, data):
+        """
+        :param data: (bytes) next piece of the payload, may end in the middle of a line
+        :return: (bool) True once the end delimiter was received
+        """
+        data = self._tail + bytes(data)
+        last_newline = data.rfind(b'\n')
+        if last_newline < 0:
+            self._tail = data
+            return self.done
+        self._tail = data[last_newline + 1:]
+        position = self._consume(data[:last_newline + 1])
+        if self.done:
+            self.remainder = data[position:]
+            self._tail = b''
+        return self.done
+
+    def results(self):
+        """
+        :return: dict of sensor name to the builder's result
+        """
+        return dict((name, builder.result()) for name, builder in self.builders.items())
+
+    def _consume(self, lines):
+        position = 0
+        while position < len(lines) and not self.done:
+            if self._current is None:
+                newline = lines.index(b'\n', position)
+                header = lines[position:newline]
+                position = newline + 1
+                if header == self._end:
+                    self.done = True
+                else:
+                    name = sensor_name(header.decode())
+                    self._current = self._builder_factory(name)
+                    self.builders[name] = self._current
+                continue
+            marker = self._find_marker(lines, position)
+            if marker < 0:
+                self._append(lines[position:])
+                position = len(lines)
+                break
+            self._append(lines[position:marker])
+            self._current = None
+            position = marker + len(self._marker)
+        return position
+
+    def _find_marker(self, lines, position):
+        marker = lines.find(self._marker, position)
+        # the marker only counts at the start of a line
+        while marker > position and lines[marker - 1:marker] != b'\n':
+            marker = lines.find(self._marker, marker + 1)
+        return marker
+
+    def _append(self, block):
+        if block:
+            self._current.append(block)
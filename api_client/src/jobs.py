@@ -0,0 +1,198 @@
+import collections
+import queue
+import threading
+import time
+import uuid
+
+MAX_WORKERS = 2
+MAX_QUEUED_JOBS = 32
+# Finished jobs are forgotten, oldest first, beyond this many
+MAX_FINISHED_JOBS = 1000
+# How often idle workers check whether the manager is shutting down
+SHUTDOWN_POLL_S = 0.5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class Job:
+    """
+    A unit of background work with byte-based progress. The job function
+    receives the Job and reports through set_total() and add_progress(),
+    both safe to call from the worker thread.
+    """
+
+    def __init__(self, fn, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.state = QUEUED
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        # bumped on every change, lets pollers skip unchanged states
+        self.version = 0
+
+    def set_total(self, n_bytes):
+        with self._lock:
+            self.bytes_total = n_bytes
+            self._notify()
+
+    def add_progress(self, n_bytes):
+        with self._lock:
+            self.bytes_done += n_bytes
+            self._notify()
+
+    def reset_progress(self):
+        """
+        Starts the progress over, for a job retrying its work from the beginning
+        """
+        with self._lock:
+            self.bytes_done = 0
+            self._notify()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def status(self):
+        """
+        :return: dict with state, progress, rate (bytes/s) and ETA (s) of the job
+        """
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            rate = self.bytes_done / elapsed if elapsed > 0 else None
+            eta = None
+            if rate and self.bytes_total is not None and not self.finished:
+                eta = max(self.bytes_total - self.bytes_done, 0) / rate
+            return {
+                'id': self.id,
+                'state': self.state,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'rate_bytes_s': rate,
+                'eta_s': eta,
+                'result': self.result,
+                'error': self.error,
+                'version': self.version,
+            }
+
+    def _run(self):
+        with self._lock:
+            self.state = RUNNING
+            self.started_at = time.time()
+            self._notify()
+        try:
+            result = self._fn(self, *self._args, **self._kwargs)
+        except Exception as e:
+            with self._lock:
+                self.state = FAILED
+                self.error = str(e) or type(e).__name__
+                self.finished_at = time.time()
+                self._notify()
+        else:
+            with self._lock:
+                self.state = DONE
+                self.result = result
+                self.finished_at = time.time()
+                self._notify()
+
+    def _notify(self):
+        self.version += 1
+
+
+class JobManager:
+    """
+    Runs jobs on a fixed number of worker threads fed by a bounded queue,
+    so long transfers never hold up request handlers.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED_JOBS):
+        self._queue = queue.Queue(max_queued)
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._work, name='job-worker-%d' % i, daemon=True)
+            for i in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queues fn(job, *args, **kwargs)
+        :return: the queued Job
+        :raises QueueFullError: if max_queued jobs are already waiting
+        :raises RuntimeError: after shutdown()
+        """
+        if self._stopping.is_set():
+            raise RuntimeError('Job manager is shut down')
+        job = Job(fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError('Too many queued jobs')
+        return job
+
+    def get(self, job_id):
+        """
+        :return: the Job with this id or None
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once the queued jobs are done
+        :param wait: (boolean) block until then
+        """
+        self._stopping.set()
+        # never block on a full queue: workers that miss a sentinel see the flag once it is empty
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _work(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=SHUTDOWN_POLL_S)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+            if job is None:
+                break
+            job._run()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
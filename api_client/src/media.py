@@ -0,0 +1,283 @@
+import contextlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .resumable_download import file_sha256
+from .video_meta import probe_mp4
+
+# ffmpeg executable, the media stage is disabled if it isn't found
+FFMPEG = os.getenv('FFMPEG', 'ffmpeg')
+# Generated files are cached under <root>/MEDIA_DIRNAME/<sha256 of the video>/
+MEDIA_DIRNAME = '.media'
+INDEX_FILENAME = 'index.sqlite3'
+MANIFEST_NAME = 'manifest.json'
+PROXY_NAME = 'proxy.mp4'
+POSTER_NAME = 'poster.jpg'
+SPRITE_NAME = 'sprite.jpg'
+
+# Proxies are H.264 at this height and quality, 1.5 Mbit/s at most, quick to load for review in a browser
+PROXY_HEIGHT = 480
+PROXY_CRF = 28
+PROXY_MAX_RATE = '1500k'
+POSTER_WIDTH = 640
+# The poster is taken this far into the video, past the first frames that are often dark
+POSTER_TIME_S = 1.0
+# Scrubbing sprite: SPRITE_TILES frames spread over the video, SPRITE_COLUMNS per row
+SPRITE_TILES = 50
+SPRITE_COLUMNS = 10
+SPRITE_TILE_WIDTH = 160
+# Threads per ffmpeg process and its niceness, so processing never competes with capture and downloads
+FFMPEG_THREADS = 2
+FFMPEG_NICENESS = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+
+def ffmpeg_available(ffmpeg=FFMPEG):
+    return shutil.which(ffmpeg) is not None
+
+
+def _low_priority():
+    """
+    :return: dict of subprocess arguments starting the process at a lower CPU priority
+    """
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    return {'preexec_fn': lambda: os.nice(FFMPEG_NICENESS)}
+
+
+def run_ffmpeg(ffmpeg, args):
+    """
+    Runs ffmpeg at low priority
+    :param args: (list) arguments after the executable
+    :raises RuntimeError: with the end of ffmpeg's error output if it fails
+    """
+    command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-y'] + args
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **_low_priority())
+    if result.returncode:
+        message = result.stderr.decode(errors='replace').strip().splitlines()
+        raise RuntimeError('ffmpeg failed: %s' % (message[-1] if message else 'exit code %d' % result.returncode))
+
+
+def proxy_args(video_path, output_path):
+    return [
+        '-i', video_path, '-threads', str(FFMPEG_THREADS),
+        '-vf', 'scale=-2:%d' % PROXY_HEIGHT,
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(PROXY_CRF),
+        '-maxrate', PROXY_MAX_RATE, '-bufsize', PROXY_MAX_RATE, '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '64k',
+        # index first, so the browser can start playing and seek before the whole file is loaded
+        '-movflags', '+faststart',
+        output_path,
+    ]
+
+
+def poster_args(video_path, output_path, duration_s):
+    at = min(POSTER_TIME_S, duration_s / 2) if duration_s else 0
+    return [
+        '-ss', '%.3f' % at, '-i', video_path, '-threads', str(FFMPEG_THREADS),
+        '-frames:v', '1', '-vf', 'scale=%d:-2' % POSTER_WIDTH, '-q:v', '4',
+        output_path,
+    ]
+
+
+def sprite_layout(duration_s):
+    """
+    :return: dict with the tiles count, columns, rows, tile width and interval_s between tiles
+    """
+    tiles = SPRITE_TILES if duration_s else 1
+    return {
+        'tiles': tiles,
+        'columns': min(tiles, SPRITE_COLUMNS),
+        'rows': int(math.ceil(tiles / float(SPRITE_COLUMNS))),
+        'tile_width': SPRITE_TILE_WIDTH,
+        'interval_s': duration_s / tiles if duration_s else None,
+    }
+
+
+def sprite_args(video_path, output_path, layout):
+    fps = '1/%f' % layout['interval_s'] if layout['interval_s'] else '1'
+    return [
+        '-i', video_path, '-threads', str(FFMPEG_THREADS),
+        # one decoded frame per interval, scaled and tiled into a single image
+        '-vf', 'fps=%s,scale=%d:-2,tile=%dx%d' % (fps, layout['tile_width'], layout['columns'], layout['rows']),
+        '-frames:v', '1', '-q:v', '5',
+        output_path,
+    ]
+
+
+class MediaOutputs:
+    """
+    Proxy, poster and sprite generated for a video, and the manifest describing them
+    """
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+
+    @property
+    def proxy_path(self):
+        return os.path.join(self.directory, PROXY_NAME)
+
+    @property
+    def poster_path(self):
+        return os.path.join(self.directory, POSTER_NAME)
+
+    @property
+    def sprite_path(self):
+        return os.path.join(self.directory, SPRITE_NAME)
+
+
+class MediaCache:
+    """
+    Review copies of the videos saved under a root directory: a low-bitrate
+    proxy, a poster image and a sprite of thumbnails for scrubbing. Outputs
+    are stored per content hash, so a renamed or duplicated video reuses
+    them, and published all at once by renaming their directory, so a
+    half-processed video is never served. The hash of each video is indexed
+    by path, size and mtime, a video is hashed once.
+    """
+
+    def __init__(self, root, ffmpeg=FFMPEG):
+        """
+        Args:
+            root (str): Directory the videos are saved under, the cache is created in it
+            ffmpeg (str): ffmpeg executable
+        """
+        self.root = os.path.abspath(root)
+        self.directory = os.path.join(self.root, MEDIA_DIRNAME)
+        self.ffmpeg = ffmpeg
+        os.makedirs(self.directory, exist_ok=True)
+        self.db_path = os.path.join(self.directory, INDEX_FILENAME)
+        self._manifests = {}
+        # path -> (size, mtime_ns, sha256), saves the index lookup on repeated requests
+        self._digests = {}
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(_SCHEMA)
+
+    def digest(self, path, compute=True, stat_result=None):
+        """
+        :param path: (str) video path
+        :param compute: (boolean) hash the file if its digest isn't indexed, otherwise return None
+        :param stat_result: (os.stat_result) optional, current stat of the file if the caller has it
+        :return: (str) SHA-256 hex digest of the video, None if not indexed and compute is False
+        """
+        path = os.path.realpath(path)
+        stat = stat_result or os.stat(path)
+        version = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            known = self._digests.get(path)
+        if known is not None and known[:2] == version:
+            return known[2]
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT sha256 FROM digests WHERE path = ? AND size = ? AND mtime_ns = ?', (path,) + version
+            ).fetchone()
+        if row:
+            sha256 = row[0]
+        elif compute:
+            sha256 = file_sha256(path)
+            with self._connect() as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO digests (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)',
+                    (path,) + version + (sha256,)
+                )
+        else:
+            return None
+        with self._lock:
+            self._digests[path] = version + (sha256,)
+        return sha256
+
+    def outputs(self, path, stat_result=None):
+        """
+        Looks up the generated files of a video without hashing or processing it
+        :param stat_result: (os.stat_result) optional, see digest()
+        :return: MediaOutputs, None if the video wasn't processed yet
+        """
+        sha256 = self.digest(path, compute=False, stat_result=stat_result)
+        return self._load(sha256) if sha256 else None
+
+    def generate(self, path):
+        """
+        Generates the proxy, poster and sprite of a video unless they are cached.
+        Slow, meant for a background worker
+        :return: MediaOutputs
+        """
+        sha256 = self.digest(path)
+        outputs = self._load(sha256)
+        if outputs is not None:
+            return outputs
+
+        duration_s, codec = probe_mp4(path)
+        layout = sprite_layout(duration_s)
+        work_dir = tempfile.mkdtemp(dir=self.directory, prefix='.%s.' % sha256)
+        try:
+            run_ffmpeg(self.ffmpeg, proxy_args(path, os.path.join(work_dir, PROXY_NAME)))
+            run_ffmpeg(self.ffmpeg, poster_args(path, os.path.join(work_dir, POSTER_NAME), duration_s))
+            run_ffmpeg(self.ffmpeg, sprite_args(path, os.path.join(work_dir, SPRITE_NAME), layout))
+            manifest = {
+                'sha256': sha256,
+                'source_name': os.path.basename(path),
+                'source_codec': codec,
+                'duration_s': duration_s,
+                'proxy_size': os.path.getsize(os.path.join(work_dir, PROXY_NAME)),
+                'proxy_height': PROXY_HEIGHT,
+                'sprite': layout,
+                'created_at': time.time(),
+            }
+            with open(os.path.join(work_dir, MANIFEST_NAME), 'w') as f:
+                json.dump(manifest, f)
+            try:
+                os.replace(work_dir, self._output_dir(sha256))
+            except OSError:
+                # published meanwhile by another worker processing the same content
+                if self._load(sha256) is None:
+                    raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return self._load(sha256)
+
+    def _output_dir(self, sha256):
+        return os.path.join(self.directory, sha256)
+
+    def _load(self, sha256):
+        with self._lock:
+            outputs = self._manifests.get(sha256)
+        if outputs is not None:
+            return outputs
+        directory = self._output_dir(sha256)
+        try:
+            with open(os.path.join(directory, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        outputs = MediaOutputs(directory, manifest)
+        with self._lock:
+            self._manifests[sha256] = outputs
+        return outputs
+
+    @contextlib.contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
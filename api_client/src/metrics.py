@@ -0,0 +1,231 @@
+import bisect
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+# Upper bounds in seconds of the latency histograms, from a LAN round trip to a stuck phone
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds in seconds of the histograms of long operations (downloads, session grouping)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+# Upper bounds in bytes per second of the throughput histograms, 1 MB/s to 1 GB/s
+THROUGHPUT_BUCKETS = (1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6, 500e6, 1e9)
+
+# Spans of the request being served, see trace()
+_current_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return '%d' % value
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')) for name, value in pairs
+    )
+    return '{%s}' % ','.join('%s="%s"' % pair for pair in escaped)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        Args:
+            name (str): Metric name as exposed, e.g. smartphone_connect_seconds
+            documentation (str): HELP text
+            labels (tuple): Label names, their values are keyword arguments of the update methods
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children = {}
+        if not self.label_names:
+            # exposed from the start, so a rate over the first events has a zero to start from
+            self._children[()] = self._new_value()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError('%s takes labels %s, got %s' % (self.name, self.label_names, tuple(labels)))
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def collect(self):
+        """
+        :return: list of the exposition lines of the metric
+        """
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            children = sorted(self._children.items())
+            for key, value in children:
+                lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Monotonic total, e.g. bytes downloaded
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    @staticmethod
+    def _new_value():
+        return 0
+
+    def value(self, **labels):
+        with self._lock:
+            return self._children.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        return ['%s%s %s' % (self.name, _format_labels(self.label_names, key), _format_value(value))]
+
+
+class _HistogramValue:
+    def __init__(self, n_buckets):
+        self.counts = [0] * n_buckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observations in cumulative buckets, with their count and sum
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple): Sorted upper bounds, +Inf is added
+        """
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_value()
+            child.counts[index] += 1
+            child.count += 1
+            child.sum += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """
+        Observes the duration of the block in seconds, also when it raises, and
+        adds it to the trace of the current request (see trace())
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            add_span(self.name + _format_labels(self.label_names, self._key(labels)), elapsed)
+
+    def _new_value(self):
+        return _HistogramValue(len(self.buckets) + 1)
+
+    def snapshot(self, **labels):
+        """
+        :return: Tuple (count, sum) of the observations
+        """
+        with self._lock:
+            child = self._children.get(self._key(labels))
+            return (child.count, child.sum) if child else (0, 0.0)
+
+    def _samples(self, key, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), value.counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (
+                self.name, _format_labels(self.label_names, key, [('le', _format_value(bound))]), cumulative
+            ))
+        labels = _format_labels(self.label_names, key)
+        lines.append('%s_count%s %d' % (self.name, labels, value.count))
+        lines.append('%s_sum%s %s' % (self.name, labels, _format_value(value.sum)))
+        return lines
+
+
+class Registry:
+    """
+    Metrics exposed together, in the Prometheus text format
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError('Duplicate metric: %s' % metric.name)
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """
+        :return: (str) all metrics in the text exposition format (version 0.0.4)
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+class Trace:
+    """
+    Timed spans (name, seconds) recorded while serving one request
+    """
+
+    def __init__(self):
+        self.spans = []
+
+
+@contextlib.contextmanager
+def trace():
+    """
+    Collects the spans timed by Histogram.time() and add_span() in this context,
+    including the threads the request is handed to, since they copy the context.
+    Yields the Trace
+    """
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def add_span(name, seconds):
+    """
+    Adds a span to the current trace, if any
+    """
+    current = _current_trace.get()
+    if current is not None:
+        current.spans.append((name, seconds))
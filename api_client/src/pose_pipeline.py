@@ -0,0 +1,499 @@
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+import zlib
+
+import numpy as np
+
+from .alignment import LINEAR, interpolate
+from .resumable_download import file_sha256
+from .sinks import atomic_file
+
+POSE_SUFFIX = '.pose.npz'
+MANIFEST_FILENAME = 'pose_manifest.json'
+VIDEO_EXTENSION = '.mp4'
+# Frames buffered between two stages of a video's pipeline
+QUEUE_SIZE = 32
+MODEL_COMPLEXITY = 2
+# MediaPipe Pose landmarks, each stored as x, y, z, visibility
+N_LANDMARKS = 33
+LANDMARK_FIELDS = 4
+
+# Fast mode defaults: analysed frames per second and longest image side fed to the model
+FAST_TARGET_FPS = 10.0
+FAST_MAX_SIDE = 256
+# Margin added around the pose's bounding box on each side, relative to its size
+ROI_MARGIN = 0.25
+# Smallest ROI side in pixels, so a partly detected pose doesn't zoom in too far
+ROI_MIN_SIDE = 64
+
+SKIPPED = 'skipped'
+PROCESSED = 'processed'
+FAILED = 'failed'
+
+# end of a stage's output, and the signal to drop the results of a failed video
+_END = object()
+_ABORT = object()
+
+
+class PoseSettings:
+    """
+    What the pipeline computes per video. The default is full mode, every frame
+    at full resolution. Fast mode trades accuracy for speed:
+    target_fps - only this many frames per second are analysed, the others are
+    grabbed without being converted to images and their landmarks are
+    interpolated from the analysed neighbours,
+    max_side - images are downscaled so the longer side is at most this before inference,
+    roi - images are cropped to the region around the previous pose before
+    downscaling, so the person keeps more pixels at a given model input size
+    """
+
+    def __init__(self, model_complexity=MODEL_COMPLEXITY, target_fps=None, max_side=None, roi=False):
+        """
+        Args:
+            model_complexity (int): MediaPipe Pose model, 0 (fastest) to 2 (most accurate)
+            target_fps (float): Analysed frames per second, None analyses every frame
+            max_side (int): Longest image side in pixels fed to the model, None keeps the resolution
+            roi (bool): Crop to the region of the previous pose
+        """
+        self.model_complexity = model_complexity
+        self.target_fps = target_fps
+        self.max_side = max_side
+        self.roi = roi
+
+    @classmethod
+    def fast(cls, model_complexity=MODEL_COMPLEXITY):
+        return cls(model_complexity, FAST_TARGET_FPS, FAST_MAX_SIDE, True)
+
+    def as_dict(self):
+        return {
+            'model_complexity': self.model_complexity,
+            'target_fps': self.target_fps,
+            'max_side': self.max_side,
+            'roi': self.roi,
+        }
+
+    def key(self):
+        """
+        :return: (str) stored with the landmarks, files written with other settings are processed again
+        """
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+
+def find_videos(session_dir):
+    """
+    :param session_dir: (str) directory with the videos of a session
+    :return: list of the video paths directly in session_dir, sorted by name.
+    Subdirectories (e.g. grouped_by_participant links) are not searched
+    """
+    return sorted(
+        entry.path for entry in os.scandir(session_dir)
+        if entry.is_file() and entry.name.lower().endswith(VIDEO_EXTENSION)
+    )
+
+
+def pose_output_path(output_dir, video_path):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(video_path))[0] + POSE_SUFFIX)
+
+
+def load_landmarks(path):
+    """
+    :param path: (str) file written by the pipeline
+    :return: dict with landmarks (float32 array of shape (n_frames, N_LANDMARKS, LANDMARK_FIELDS),
+    normalized to the whole frame, NaN for frames without a detected pose),
+    timestamps_ms (int64 frame timestamps), analyzed (bool per frame, False where
+    the landmarks were interpolated), source_sha256 (content hash of the video)
+    and settings (dict, see PoseSettings)
+    """
+    with np.load(path) as data:
+        return {
+            'landmarks': data['landmarks'],
+            'timestamps_ms': data['timestamps_ms'],
+            'analyzed': data['analyzed'],
+            'source_sha256': str(data['source_sha256']),
+            'settings': json.loads(str(data['settings'])),
+        }
+
+
+def _stored_version(path):
+    """
+    :return: Tuple (source hash, settings key) of an existing landmark file, (None, None) if there is none
+    or it can't be read, e.g. truncated by an interrupted run: the video is processed again
+    """
+    try:
+        with np.load(path) as data:
+            return str(data['source_sha256']), str(data['settings'])
+    except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile, zlib.error):
+        return None, None
+
+
+class _StageTimer:
+    def __init__(self):
+        self.seconds = 0.0
+        self.frames = 0
+
+    def fps(self):
+        return self.frames / self.seconds if self.seconds else None
+
+
+def _downscale(image, max_side):
+    import cv2
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image
+    scale = max_side / float(max(height, width))
+    size = (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def _decode(video_path, frames, timer, stop, settings):
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise RuntimeError('Cannot open video: %s' % video_path)
+        interval_ms = 1000.0 / settings.target_fps if settings.target_fps else 0.0
+        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        # frames up to half a frame early are still analysed, so e.g. 10 of 30 fps takes every third frame
+        tolerance_ms = 500.0 / video_fps if video_fps and video_fps > 0 else 0.0
+        next_ms = None
+        while not stop.is_set():
+            start = time.perf_counter()
+            # grab() decodes, retrieve() converts the frame to an image: skipped frames stop at grab
+            if not cap.grab():
+                break
+            timestamp_ms = int(round(cap.get(cv2.CAP_PROP_POS_MSEC)))
+            if next_ms is not None and timestamp_ms < next_ms - tolerance_ms:
+                timer.seconds += time.perf_counter() - start
+                timer.frames += 1
+                frames.put((timestamp_ms, None))
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                break
+            if interval_ms:
+                next_ms = max(next_ms or timestamp_ms, timestamp_ms - tolerance_ms) + interval_ms
+            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if not settings.roi:
+                # without ROI the whole frame is downscaled here, off the inference thread
+                image_rgb = _downscale(image_rgb, settings.max_side)
+            timer.seconds += time.perf_counter() - start
+            timer.frames += 1
+            frames.put((timestamp_ms, image_rgb))
+    finally:
+        cap.release()
+
+
+def _landmark_array(pose_landmarks):
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmarks.landmark], dtype=np.float32)
+
+
+class _RegionOfInterest:
+    """
+    Crop box following the pose. The box stays put while the pose is well inside
+    it and only moves when the pose nears its border or is lost, so the tracking
+    model mostly sees a stable view
+    """
+
+    def __init__(self):
+        self.box = None
+
+    def crop(self, image):
+        if self.box is None:
+            return image
+        x0, y0, x1, y1 = self.box
+        return image[y0:y1, x0:x1]
+
+    def to_frame(self, landmarks, image):
+        """
+        Maps landmarks normalized to the crop to coordinates normalized to the whole image
+        """
+        if self.box is None:
+            return landmarks
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = self.box
+        landmarks = landmarks.copy()
+        landmarks[:, 0] = (landmarks[:, 0] * (x1 - x0) + x0) / width
+        landmarks[:, 1] = (landmarks[:, 1] * (y1 - y0) + y0) / height
+        # z is on the scale of x
+        landmarks[:, 2] *= (x1 - x0) / float(width)
+        return landmarks
+
+    def update(self, landmarks, image):
+        """
+        :param landmarks: array in whole-image coordinates, None if no pose was found
+        """
+        if landmarks is None:
+            self.box = None
+            return
+        height, width = image.shape[:2]
+        xs = np.clip(landmarks[:, 0], 0.0, 1.0) * width
+        ys = np.clip(landmarks[:, 1], 0.0, 1.0) * height
+        left, right, top, bottom = xs.min(), xs.max(), ys.min(), ys.max()
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            border_x = ROI_MARGIN / 2 * (x1 - x0)
+            border_y = ROI_MARGIN / 2 * (y1 - y0)
+            if (left >= x0 + border_x and right <= x1 - border_x
+                    and top >= y0 + border_y and bottom <= y1 - border_y):
+                return
+        margin_x = max((right - left) * ROI_MARGIN, (ROI_MIN_SIDE - (right - left)) / 2.0)
+        margin_y = max((bottom - top) * ROI_MARGIN, (ROI_MIN_SIDE - (bottom - top)) / 2.0)
+        self.box = (
+            int(max(left - margin_x, 0)), int(max(top - margin_y, 0)),
+            int(min(right + margin_x, width)), int(min(bottom + margin_y, height)),
+        )
+
+
+def _fill_skipped(landmarks, timestamps_ms, analyzed):
+    """
+    Interpolates the landmarks of the frames that were not analysed, in place.
+    Frames next to an analysed frame without a pose stay NaN
+    """
+    if analyzed.all() or analyzed.sum() < 2:
+        return
+    flat = landmarks.reshape(len(landmarks), -1)
+    times_ns = timestamps_ms * 1000000
+    flat[~analyzed] = interpolate((times_ns[analyzed], flat[analyzed]), times_ns[~analyzed], LINEAR)
+
+
+def _serialize(results, output_path, source_sha256, settings, timer):
+    landmarks = []
+    timestamps = []
+    analyzed = []
+    missing = np.full((N_LANDMARKS, LANDMARK_FIELDS), np.nan, dtype=np.float32)
+    while True:
+        item = results.get()
+        if item is _ABORT:
+            return
+        if item is _END:
+            break
+        start = time.perf_counter()
+        timestamp_ms, frame_landmarks, frame_analyzed = item
+        landmarks.append(missing if frame_landmarks is None else frame_landmarks)
+        timestamps.append(timestamp_ms)
+        analyzed.append(frame_analyzed)
+        timer.seconds += time.perf_counter() - start
+        timer.frames += 1
+
+    start = time.perf_counter()
+    landmarks = np.array(landmarks, dtype=np.float32).reshape(-1, N_LANDMARKS, LANDMARK_FIELDS)
+    timestamps = np.array(timestamps, dtype=np.int64)
+    analyzed = np.array(analyzed, dtype=bool)
+    _fill_skipped(landmarks, timestamps, analyzed)
+    with atomic_file(output_path) as f:
+        np.savez(
+            f,
+            landmarks=landmarks,
+            timestamps_ms=timestamps,
+            analyzed=analyzed,
+            source_sha256=np.array(source_sha256),
+            settings=np.array(settings.key()),
+        )
+    timer.seconds += time.perf_counter() - start
+
+
+def _run_thread(target, args, errors, inbox=None, outbox=None):
+    def run():
+        try:
+            target(*args)
+        except BaseException as e:
+            errors.append(e)
+            # keep consuming so the stage feeding this one never blocks on a full queue
+            while inbox is not None and inbox.get() not in (_END, _ABORT):
+                pass
+        finally:
+            # after errors is updated, so the next stage sees the failure with the end
+            if outbox is not None:
+                outbox.put(_END)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def process_video(video_path, output_path, settings=None, queue_size=QUEUE_SIZE, source_sha256=None, force=False):
+    """
+    Runs decode -> pose -> landmark serialization on one video. The three stages
+    run in their own threads joined by bounded queues: decoding and inference
+    release the GIL, so they overlap, and a slow stage holds back the others
+    instead of letting frames pile up in memory.
+    Meant to run in a worker process, see run_batch
+    :param video_path: (str) video to process
+    :param output_path: (str) landmark file to write, see load_landmarks
+    :param settings: (PoseSettings) full mode by default, see PoseSettings.fast
+    :param queue_size: (int) frames buffered between two stages
+    :param source_sha256: (str) content hash of the video if already known, computed otherwise
+    :param force: (bool) process even if output_path already holds landmarks of the same content and settings
+    :return: dict with status (SKIPPED or PROCESSED), sha256, frames, analyzed (frames run
+    through the model) and per-stage fps
+    """
+    settings = settings or PoseSettings()
+    start = time.perf_counter()
+    if source_sha256 is None:
+        source_sha256 = file_sha256(video_path)
+    if not force and _stored_version(output_path) == (source_sha256, settings.key()):
+        return {'video': video_path, 'status': SKIPPED, 'sha256': source_sha256, 'output': output_path}
+
+    import cv2
+    import mediapipe as mp
+    # parallelism comes from the process pool, one decoding thread per process avoids oversubscription
+    cv2.setNumThreads(1)
+
+    frames = queue.Queue(queue_size)
+    results = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+    timers = dict((stage, _StageTimer()) for stage in ('decode', 'pose', 'serialize'))
+
+    decoder = _run_thread(_decode, (video_path, frames, timers['decode'], stop, settings), errors, outbox=frames)
+    serializer = _run_thread(
+        _serialize, (results, output_path, source_sha256, settings, timers['serialize']), errors, inbox=results
+    )
+    pose = mp.solutions.pose.Pose(static_image_mode=False, model_complexity=settings.model_complexity)
+    roi = _RegionOfInterest() if settings.roi else None
+    completed = False
+    try:
+        while True:
+            item = frames.get()
+            if item is _END:
+                completed = not errors
+                break
+            timestamp_ms, image_rgb = item
+            if image_rgb is None:
+                results.put((timestamp_ms, None, False))
+                continue
+            stage_start = time.perf_counter()
+            if roi is None:
+                detection = pose.process(image_rgb)
+            else:
+                detection = pose.process(_downscale(roi.crop(image_rgb), settings.max_side))
+            landmarks = None
+            if detection.pose_landmarks is not None:
+                landmarks = _landmark_array(detection.pose_landmarks)
+                if roi is not None:
+                    landmarks = roi.to_frame(landmarks, image_rgb)
+            if roi is not None:
+                roi.update(landmarks, image_rgb)
+            timers['pose'].seconds += time.perf_counter() - stage_start
+            timers['pose'].frames += 1
+            results.put((timestamp_ms, landmarks, True))
+            if errors:
+                break
+    finally:
+        stop.set()
+        pose.close()
+        # unblock the decoder if it waits on a full queue
+        while decoder.is_alive():
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        # a failed video leaves no landmark file that a rerun would take as done
+        results.put(_END if completed else _ABORT)
+        serializer.join()
+    if errors:
+        raise errors[0]
+
+    wall_s = time.perf_counter() - start
+    frame_count = timers['serialize'].frames
+    return {
+        'video': video_path,
+        'status': PROCESSED,
+        'sha256': source_sha256,
+        'output': output_path,
+        'frames': frame_count,
+        'analyzed': timers['pose'].frames,
+        'wall_s': wall_s,
+        'fps': frame_count / wall_s if wall_s else None,
+        'stage_fps': dict((stage, timer.fps()) for stage, timer in timers.items()),
+    }
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(path, manifest):
+    with atomic_file(path) as f:
+        f.write(json.dumps(manifest, indent=1, sort_keys=True).encode())
+
+
+def run_batch(session_dir, output_dir=None, workers=None, settings=None, queue_size=QUEUE_SIZE, force=False,
+              progress_callback=None):
+    """
+    Extracts pose landmarks from every video of a session on a process pool,
+    one video per worker at a time. Videos whose content hash and settings match
+    their existing landmark file are skipped, so reruns only process new or changed
+    videos. Content hashes are cached in MANIFEST_FILENAME by file size and mtime.
+    :param session_dir: (str) directory with the session's videos
+    :param output_dir: (str) landmark files directory, session_dir/pose by default
+    :param workers: (int) worker processes, the number of CPUs by default
+    :param settings: (PoseSettings) see process_video
+    :param queue_size: (int) see process_video
+    :param force: (bool) reprocess every video
+    :param progress_callback: (callable) optional, called with each video's result dict as it finishes
+    :return: dict with the per-video results and totals: processed, skipped,
+    failed, frames, wall_s, fps (frames per second of the whole batch) and
+    stage_fps (mean per-worker fps of decode, pose and serialize)
+    """
+    output_dir = output_dir or os.path.join(session_dir, 'pose')
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = _load_manifest(manifest_path)
+
+    start = time.perf_counter()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for video_path in find_videos(session_dir):
+            stat = os.stat(video_path)
+            cached = manifest.get(os.path.basename(video_path))
+            known_hash = None
+            if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+                known_hash = cached['sha256']
+            future = executor.submit(
+                process_video, video_path, pose_output_path(output_dir, video_path), settings,
+                queue_size, known_hash, force
+            )
+            futures[future] = (video_path, stat)
+
+        for future in concurrent.futures.as_completed(futures):
+            video_path, stat = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'video': video_path, 'status': FAILED, 'error': str(e) or type(e).__name__}
+            else:
+                manifest[os.path.basename(video_path)] = {
+                    'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': result['sha256'],
+                }
+                _save_manifest(manifest_path, manifest)
+            results.append(result)
+            if progress_callback is not None:
+                progress_callback(result)
+
+    wall_s = time.perf_counter() - start
+    processed = [r for r in results if r['status'] == PROCESSED]
+    frames = sum(r['frames'] for r in processed)
+    stage_fps = {}
+    for stage in ('decode', 'pose', 'serialize'):
+        values = [r['stage_fps'][stage] for r in processed if r['stage_fps'][stage]]
+        stage_fps[stage] = sum(values) / len(values) if values else None
+    return {
+        'videos': results,
+        'processed': len(processed),
+        'skipped': sum(r['status'] == SKIPPED for r in results),
+        'failed': sum(r['status'] == FAILED for r in results),
+        'frames': frames,
+        'wall_s': wall_s,
+        'fps': frames / wall_s if wall_s else None,
+        'stage_fps': stage_fps,
+    }
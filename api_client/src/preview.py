@@ -0,0 +1,323 @@
+import asyncio
+import collections
+import threading
+import time
+
+# Longest image side of preview frames, enough to check the framing
+PREVIEW_MAX_SIDE = 640
+JPEG_QUALITY = 70
+# Samples kept for the latency and fps metrics
+METRICS_WINDOW = 120
+# Seconds the preview keeps running after its last viewer left, so a page reload doesn't restart the source
+IDLE_STOP_S = 5.0
+# Seconds to wait before reopening a source that failed or ended
+REOPEN_DELAY_S = 1.0
+
+
+class _Window:
+    """
+    Last METRICS_WINDOW values of a measurement
+    """
+
+    def __init__(self, size=METRICS_WINDOW):
+        self.values = collections.deque(maxlen=size)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def summary(self):
+        if not self.values:
+            return {'mean': None, 'p95': None, 'max': None}
+        ordered = sorted(self.values)
+        return {
+            'mean': sum(ordered) / len(ordered),
+            'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+            'max': ordered[-1],
+        }
+
+
+class _Rate:
+    """
+    Events per second over the last METRICS_WINDOW events
+    """
+
+    def __init__(self, size=METRICS_WINDOW):
+        self.times = collections.deque(maxlen=size)
+
+    def tick(self, now):
+        self.times.append(now)
+
+    def per_second(self):
+        if len(self.times) < 2 or self.times[-1] == self.times[0]:
+            return None
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+
+class PreviewFrame:
+    def __init__(self, seq, jpeg, captured_at, width, height):
+        self.seq = seq
+        self.jpeg = jpeg
+        # time.monotonic() when the frame was read from the source
+        self.captured_at = captured_at
+        self.width = width
+        self.height = height
+
+
+class LivePreview:
+    """
+    Live JPEG preview of a video source (a file, a stream URL or a camera index,
+    anything cv2.VideoCapture opens). One reader thread takes frames from the
+    source and keeps only the newest; one encoder thread compresses the newest
+    frame whenever it is done with the previous one. Frames the encoder had no
+    time for are dropped instead of queued, so the preview lags the source by
+    at most one encode however slow the machine is. Every viewer gets the same
+    encoded frames, the cost doesn't grow with the number of viewers.
+
+    Files are played at their own frame rate and looped. The threads run while
+    there are viewers, plus IDLE_STOP_S.
+    """
+
+    def __init__(self, source, max_side=PREVIEW_MAX_SIDE, jpeg_quality=JPEG_QUALITY):
+        """
+        Args:
+            source (str): Video file, stream URL, or camera index as a digit string
+            max_side (int): Frames are downscaled to this longest side before encoding
+            jpeg_quality (int): JPEG quality, 0 - 100
+        """
+        self.source = int(source) if str(source).isdigit() else source
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self._cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        # newest frame read from the source and not encoded yet
+        self._raw = None
+        self._latest = None
+        self._seq = 0
+        self._viewers = 0
+        self._idle_since = None
+        self._stopping = False
+        # incremented by each start, threads of an earlier start see it changed and exit
+        self._generation = 0
+        self._threads = []
+        self._waiters = []
+        self.error = None
+
+        self.captured = 0
+        self.encoded = 0
+        self.dropped = 0
+        self._capture_rate = _Rate()
+        self._encode_rate = _Rate()
+        self._encode_ms = _Window()
+        self._latency_ms = _Window()
+
+    def attach(self):
+        """
+        Registers a viewer and starts the preview if it isn't running
+        """
+        with self._cond:
+            self._viewers += 1
+            self._idle_since = None
+        self.ensure_running()
+
+    def ensure_running(self):
+        """
+        Restarts the preview if it stopped after an idle period or an error. Viewers
+        call it when no frame came for a while. Doesn't wait for the stopped threads,
+        which can be blocked in a read from the source: they exit on their own, so it
+        can be called from the event loop
+        """
+        with self._start_lock:
+            with self._cond:
+                if self._threads and not self._stopping:
+                    return
+                self._generation += 1
+                self._stopping = False
+                self._raw = None
+                self._threads = [
+                    threading.Thread(target=self._read_loop, args=(self._generation,), name='preview-reader',
+                                     daemon=True),
+                    threading.Thread(target=self._encode_loop, args=(self._generation,), name='preview-encoder',
+                                     daemon=True),
+                ]
+                self._cond.notify_all()
+            for thread in self._threads:
+                thread.start()
+
+    def detach(self):
+        with self._cond:
+            self._viewers -= 1
+            if not self._viewers:
+                self._idle_since = time.monotonic()
+
+    def close(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def latest(self):
+        """
+        :return: (PreviewFrame) newest encoded frame, None before the first one
+        """
+        return self._latest
+
+    async def next_frame(self, after_seq=0, timeout=None):
+        """
+        Waits for an encoded frame newer than after_seq, without blocking the event loop
+        :param after_seq: (int) seq of the last frame the viewer got
+        :param timeout: (float) seconds to wait, None waits forever
+        :return: (PreviewFrame) the newest frame, intermediate ones are skipped; None on timeout
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            latest = self._latest
+            if latest is not None and latest.seq > after_seq:
+                return latest
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._cond:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def record_sent(self, frame):
+        """
+        Called by viewers when a frame is handed to the client, measures capture-to-send latency
+        """
+        self._latency_ms.add((time.monotonic() - frame.captured_at) * 1000)
+
+    def metrics(self):
+        """
+        :return: dict with frame counters, viewers, capture and encode fps, and windows
+        (mean, p95, max) of encode time and capture-to-send latency in ms
+        """
+        return {
+            'source': str(self.source),
+            'running': bool(self._threads) and not self._stopping,
+            'viewers': self._viewers,
+            'frames_captured': self.captured,
+            'frames_encoded': self.encoded,
+            'frames_dropped': self.dropped,
+            'capture_fps': self._capture_rate.per_second(),
+            'encode_fps': self._encode_rate.per_second(),
+            'encode_ms': self._encode_ms.summary(),
+            'latency_ms': self._latency_ms.summary(),
+            'error': self.error,
+        }
+
+    def _should_stop(self, generation):
+        """
+        Must be called with the lock held. Stopping is decided under the lock, so a
+        viewer attaching at the same time either cancels it or sees it and restarts
+        :param generation: (int) start the calling thread belongs to
+        """
+        if generation != self._generation:
+            return True
+        if self._idle_since is not None and time.monotonic() - self._idle_since > IDLE_STOP_S:
+            self._stopping = True
+        return self._stopping
+
+    def _check_stop(self, generation):
+        with self._cond:
+            return self._should_stop(generation)
+
+    def _stopped(self, generation):
+        with self._cond:
+            # a thread of an earlier start mustn't stop the running preview
+            if generation == self._generation:
+                self._stopping = True
+            self._cond.notify_all()
+
+    def _read_loop(self, generation):
+        import cv2
+        try:
+            while not self._check_stop(generation):
+                cap = cv2.VideoCapture(self.source)
+                try:
+                    if not cap.isOpened():
+                        self.error = 'Cannot open preview source: %s' % self.source
+                        time.sleep(REOPEN_DELAY_S)
+                        continue
+                    self.error = None
+                    # live sources deliver at their own pace, files are paced to their frame rate
+                    fps = cap.get(cv2.CAP_PROP_FPS) if isinstance(self.source, str) else 0
+                    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT) if fps else 0
+                    interval = 1.0 / fps if fps and frame_count > 0 else 0.0
+                    next_time = time.monotonic()
+                    while not self._check_stop(generation):
+                        ok, frame = cap.read()
+                        if not ok:
+                            break
+                        if interval:
+                            next_time += interval
+                            delay = next_time - time.monotonic()
+                            if delay > 0:
+                                time.sleep(delay)
+                            else:
+                                next_time = time.monotonic()
+                        now = time.monotonic()
+                        with self._cond:
+                            if self._raw is not None:
+                                self.dropped += 1
+                            self._raw = (frame, now)
+                            self.captured += 1
+                            self._capture_rate.tick(now)
+                            self._cond.notify_all()
+                finally:
+                    cap.release()
+                if not interval:
+                    # a live source that ended is retried, a file is looped right away
+                    time.sleep(REOPEN_DELAY_S)
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            self._stopped(generation)
+
+    def _encode_loop(self, generation):
+        import cv2
+        try:
+            while True:
+                with self._cond:
+                    # the timeout lets an idle preview notice it should stop
+                    self._cond.wait_for(lambda: self._raw is not None or self._should_stop(generation), 1.0)
+                    if self._should_stop(generation):
+                        return
+                    if self._raw is None:
+                        continue
+                    frame, captured_at = self._raw
+                    self._raw = None
+                start = time.monotonic()
+                height, width = frame.shape[:2]
+                scale = self.max_side / float(max(height, width))
+                if scale < 1.0:
+                    width, height = max(int(width * scale), 1), max(int(height * scale), 1)
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if not ok:
+                    continue
+                now = time.monotonic()
+                with self._cond:
+                    self._seq += 1
+                    self._latest = PreviewFrame(self._seq, buffer.tobytes(), captured_at, width, height)
+                    self.encoded += 1
+                    self._encode_rate.tick(now)
+                    self._encode_ms.add((now - start) * 1000)
+                    waiters, self._waiters = self._waiters, []
+                    latest = self._latest
+                for loop, future in waiters:
+                    loop.call_soon_threadsafe(_resolve, future, latest)
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+        finally:
+            self._stopped(generation)
+
+
+def _resolve(future, frame):
+    if not future.done():
+        future.set_result(frame)
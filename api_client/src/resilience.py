@@ -0,0 +1,197 @@
+import asyncio
+import random
+import threading
+import time
+
+# Consecutive failures of a device before its circuit opens and requests to it fail fast
+FAILURE_THRESHOLD = 3
+# Seconds an open circuit rejects requests before one trial request is let through.
+# Doubled after every failed trial up to MAX_OPEN_S, so a dead phone is reconnected to less and less often
+OPEN_S = 5.0
+MAX_OPEN_S = 120.0
+# Attempts of reconnects and idempotent requests, delays grow from RETRY_BASE_S up to RETRY_MAX_S
+RETRY_ATTEMPTS = 3
+RETRY_BASE_S = 0.2
+RETRY_MAX_S = 5.0
+# Per-read deadline derived from the response times like TCP's retransmission timeout
+# (smoothed round trip + 4 x its deviation), within these bounds. The floor leaves the
+# phone time for slow requests, e.g. finishing the video file before sending it
+MIN_TIMEOUT_S = 10.0
+MAX_TIMEOUT_S = 30.0
+# Errors of the link or the phone itself, as opposed to an error response of a working phone
+TRANSIENT_ERRORS = (OSError, EOFError, asyncio.TimeoutError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of contacting a device whose circuit is open
+    """
+
+    def __init__(self, device, retry_in_s):
+        super().__init__('%s is unreachable, next attempt in %.1f s' % (device, retry_in_s))
+        self.device = device
+        self.retry_in_s = retry_in_s
+
+
+def backoff_delays(attempts, base=RETRY_BASE_S, maximum=RETRY_MAX_S, rng=random):
+    """
+    Yields attempts delays doubling from base up to maximum, each randomized
+    between half and all of it so that clients retrying together spread out
+    """
+    for attempt in range(attempts):
+        delay = min(maximum, base * 2 ** attempt)
+        yield delay / 2 + rng.uniform(0, delay / 2)
+
+
+def retry(operation, attempts=RETRY_ATTEMPTS, retry_on=TRANSIENT_ERRORS, give_up_on=(CircuitOpenError,),
+          on_retry=None, sleep=time.sleep):
+    """
+    Calls operation() until it succeeds, at most attempts times, with backoff_delays
+    in between. Only for operations that can safely be repeated
+    :param retry_on: (tuple) exception types retried, others are raised at once
+    :param give_up_on: (tuple) subtypes of retry_on that are raised at once
+    :param on_retry: (callable) optional, called with the error and the delay before each retry
+    :return: the result of operation()
+    """
+    delays = backoff_delays(attempts - 1)
+    while True:
+        try:
+            return operation()
+        except give_up_on:
+            raise
+        except retry_on as e:
+            delay = next(delays, None)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(e, delay)
+            sleep(delay)
+
+
+class DeviceHealth:
+    """
+    Circuit breaker and response time estimate of one smartphone.
+
+    The circuit opens after failure_threshold consecutive failures: requests
+    then fail with CircuitOpenError without touching the network. Once the
+    open period has passed, the next request is the trial (half-open): success
+    closes the circuit, failure opens it again for twice as long. Callers
+    serialize requests per device (the connection pool leases one at a time),
+    so a single trial runs at once.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, open_s=OPEN_S, max_open_s=MAX_OPEN_S,
+                 min_timeout=MIN_TIMEOUT_S, max_timeout=MAX_TIMEOUT_S, clock=time.monotonic):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures opening the circuit
+            open_s (float): First open period in seconds
+            max_open_s (float): Longest open period in seconds
+            min_timeout (float): Lower bound of timeout() in seconds
+            max_timeout (float): Upper bound of timeout(), and its value before any response was timed
+            clock (callable): Monotonic time in seconds
+        """
+        self.failure_threshold = failure_threshold
+        self.open_s = open_s
+        self.max_open_s = max_open_s
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.successes = 0
+        self.last_error = None
+        self._open_period = open_s
+        self._retry_at = 0.0
+        # smoothed round trip and its mean deviation in seconds, None until the first sample
+        self.srtt = None
+        self.rttvar = None
+
+    def check(self, device):
+        """
+        Lets a request through unless the circuit is open
+        :param device: (str) device name for the error message
+        :raises CircuitOpenError: if the circuit is open
+        """
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self._retry_at - self._clock()
+                if retry_in > 0:
+                    raise CircuitOpenError(device, retry_in)
+                self.state = HALF_OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self._open_period = self.open_s
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = None if error is None else '%s: %s' % (type(error).__name__, error)
+            if self.state == HALF_OPEN:
+                # the trial failed: wait longer before the next one
+                self._open_period = min(self._open_period * 2, self.max_open_s)
+            elif self.consecutive_failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            self._retry_at = self._clock() + self._open_period
+
+    def observe_round_trip(self, seconds):
+        """
+        Adds a response time sample (RFC 6298 estimator)
+        """
+        with self._lock:
+            if self.srtt is None:
+                self.srtt = seconds
+                self.rttvar = seconds / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+                self.srtt = 0.875 * self.srtt + 0.125 * seconds
+
+    def timeout(self):
+        """
+        :return: (float) seconds to wait for a response of this device before considering it stalled
+        """
+        with self._lock:
+            if self.srtt is None:
+                return self.max_timeout
+            return min(self.max_timeout, max(self.min_timeout, self.srtt + 4 * self.rttvar))
+
+    @property
+    def available(self):
+        """
+        :return: (boolean) False while the circuit is open and requests would be rejected
+        """
+        with self._lock:
+            return self.state != OPEN or self._clock() >= self._retry_at
+
+    def status(self):
+        """
+        :return: dict with the circuit state, failure counts, response time estimate and timeout
+        """
+        timeout = self.timeout()
+        available = self.available
+        with self._lock:
+            retry_in = max(self._retry_at - self._clock(), 0.0) if self.state == OPEN else None
+            return {
+                'state': self.state,
+                'available': available,
+                'retry_in_s': retry_in,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.failures,
+                'successes': self.successes,
+                'last_error': self.last_error,
+                'round_trip_ms': None if self.srtt is None else self.srtt * 1000,
+                'round_trip_deviation_ms': None if self.rttvar is None else self.rttvar * 1000,
+                'timeout_s': timeout,
+            }
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+
+from .RemoteControl import RemoteControl
+
+# Journal checkpoints (and parallel work items) are this large
+SEGMENT_SIZE = 32 * 1024 * 1024
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+PART_SUFFIX = '.part'
+JOURNAL_SUFFIX = '.part.json'
+
+
+def file_sha256(path):
+    """
+    :return: (str) SHA-256 hex digest of the file at path
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResumableVideoDownload:
+    """
+    Downloads the last recorded video into dest_path + '.part', keeping a JSON
+    journal of the byte ranges already on disk next to it. If the transfer fails,
+    calling download() again continues from the journal instead of starting over.
+
+    When the server implements the video_info/get_video_range extension, missing
+    ranges are fetched over several parallel connections and the result is checked
+    against the server's SHA-256. Otherwise the whole video is requested again and
+    the part already on disk is received and dropped - this saves the disk writes
+    but not the network transfer.
+    """
+
+    def __init__(self, remote, dest_path, connections=4, segment_size=SEGMENT_SIZE):
+        """
+        Args:
+            remote (RemoteControl): Connected client, used for the info request,
+            the first range connection and the sequential fallback
+            dest_path (str): Final path of the video
+            connections (int): Number of parallel connections for ranged downloads
+            segment_size (int): Size of journal checkpoints in bytes
+        """
+        self.remote = remote
+        self.dest_path = dest_path
+        self.part_path = dest_path + PART_SUFFIX
+        self.journal_path = dest_path + JOURNAL_SUFFIX
+        self.connections = connections
+        self.segment_size = segment_size
+        self._journal = None
+        self._lock = threading.Lock()
+
+    def download(self, progress_callback=None):
+        """
+        Downloads (or resumes downloading) the video, verifies it and moves it to dest_path
+        :param progress_callback: (callable) optional, called with the number of newly written bytes
+        :return: Tuple (dest_path, sha256 hex digest of the video)
+        """
+        info = self.remote.get_video_info()
+        if info is not None:
+            size, filename, expected_digest = info
+            self._open_journal(size, filename, expected_digest)
+            self._download_ranges(progress_callback)
+        else:
+            size, filename = self.remote.request_video()
+            expected_digest = None
+            self._open_journal(size, filename, expected_digest)
+            self._download_sequential(progress_callback)
+
+        if os.path.getsize(self.part_path) != size:
+            raise RuntimeError('Downloaded %d bytes, expected %d' % (os.path.getsize(self.part_path), size))
+        digest = file_sha256(self.part_path)
+        if expected_digest is not None and digest != expected_digest:
+            # the journal can't be trusted anymore, next attempt starts from scratch
+            os.remove(self.journal_path)
+            raise RuntimeError('Checksum mismatch for %s: %s != %s' % (self.part_path, digest, expected_digest))
+        os.replace(self.part_path, self.dest_path)
+        os.remove(self.journal_path)
+        return self.dest_path, digest
+
+    def _open_journal(self, size, filename, digest):
+        journal = None
+        if os.path.exists(self.journal_path) and os.path.exists(self.part_path):
+            with open(self.journal_path, 'rt') as f:
+                journal = json.load(f)
+            if (journal['size'], journal['filename'], journal['sha256']) != (size, filename, digest):
+                # a different video was recorded since, its ranges are worthless
+                journal = None
+        if journal is None:
+            journal = {'size': size, 'filename': filename, 'sha256': digest, 'done': []}
+            with open(self.part_path, 'wb'):
+                pass
+        self._journal = journal
+        self._save_journal()
+
+    def _save_journal(self):
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'wt') as f:
+            json.dump(self._journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _mark_done(self, start, end):
+        with self._lock:
+            self._journal['done'].append([start, end])
+            self._save_journal()
+
+    def _pending_segments(self):
+        done = set(tuple(r) for r in self._journal['done'])
+        size = self._journal['size']
+        return [
+            (start, min(start + self.segment_size, size))
+            for start in range(0, size, self.segment_size)
+            if (start, min(start + self.segment_size, size)) not in done
+        ]
+
+    def _contiguous_offset(self):
+        offset = 0
+        for start, end in sorted(self._journal['done']):
+            if start != offset:
+                break
+            offset = end
+        return offset
+
+    def _download_sequential(self, progress_callback):
+        size = self._journal['size']
+        offset = self._contiguous_offset()
+        self.remote.skip_video(offset)
+        with open(self.part_path, 'r+b') as part_file:
+            part_file.truncate(offset)
+            part_file.seek(offset)
+            while offset < size:
+                end = min(offset + self.segment_size, size)
+                self.remote.recv_video(part_file, end - offset, progress_callback)
+                part_file.flush()
+                os.fsync(part_file.fileno())
+                self._mark_done(offset, end)
+                offset = end
+
+    def _download_ranges(self, progress_callback):
+        segments = queue.Queue()
+        for segment in self._pending_segments():
+            segments.put(segment)
+        if segments.empty():
+            return
+
+        n_workers = min(self.connections, segments.qsize())
+        errors = []
+        stop = threading.Event()
+        report_progress = None
+        if progress_callback is not None:
+            # workers report from several threads
+            def report_progress(n_bytes):
+                with self._lock:
+                    progress_callback(n_bytes)
+
+        def worker(remote):
+            try:
+                with open(self.part_path, 'r+b') as part_file:
+                    while not stop.is_set():
+                        try:
+                            start, end = segments.get_nowait()
+                        except queue.Empty:
+                            break
+                        self._fetch_range(remote, part_file, start, end, report_progress)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                if remote is not self.remote:
+                    remote.close()
+
+        threads = []
+        for i in range(n_workers):
+            if stop.is_set():
+                break
+            try:
+                remote = self.remote if i == 0 else RemoteControl(self.remote.hostname, port=self.remote.port)
+            except OSError as e:
+                errors.append(e)
+                stop.set()
+                break
+            thread = threading.Thread(target=worker, args=(remote,))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _fetch_range(self, remote, part_file, start, end, progress_callback):
+        received = remote.get_video_range(part_file, start, end - start, progress_callback)
+        if received != end - start:
+            raise EOFError('Server returned %d bytes for range %d-%d' % (received, start, end))
+        part_file.flush()
+        os.fsync(part_file.fileno())
+        self._mark_done(start, end)
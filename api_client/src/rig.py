@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+
+from .AsyncRemoteControl import AsyncRemoteControl, DEFAULT_TIMEOUT
+from .clock_sync import SYNC_INTERVAL_S, SYNC_ROUNDS, ClockEstimator, host_clock_ns
+from .resilience import TRANSIENT_ERRORS, DeviceHealth
+
+MAX_CONCURRENT_DOWNLOADS = 4
+
+
+def parse_host(host):
+    """
+    :param host: (str) "hostname" or "hostname:port"
+    :return: Tuple (hostname, port or None)
+    """
+    hostname, _, port = host.partition(':')
+    return hostname, int(port) if port else None
+
+
+class Rig:
+    """
+    Drives several smartphones as one capture rig. Connections are opened
+    ahead of time, start/stop requests are sent to all devices concurrently and
+    videos are downloaded in parallel with a bounded number of transfers.
+
+    Results are returned as dicts keyed by the host string. A device that
+    failed maps to its exception, the others are unaffected.
+    Timing of the last start/stop/download round is kept in self.metrics.
+
+    Every device has a circuit breaker (self.health, see DeviceHealth): a
+    phone that keeps failing is skipped with CircuitOpenError instead of
+    making every round wait for its timeout, and is reconnected to once its
+    circuit lets a trial through. The same DeviceHealth times each device's
+    responses, their deadline follows them within the rig's timeout.
+    """
+
+    def __init__(self, hosts, max_concurrent_downloads=MAX_CONCURRENT_DOWNLOADS, timeout=DEFAULT_TIMEOUT):
+        """
+        Args:
+            hosts (list): Smartphone hosts, "hostname" or "hostname:port"
+            max_concurrent_downloads (int): Number of videos downloaded at the same time
+            timeout (float): Longest per-operation timeout of each device, see AsyncRemoteControl
+        """
+        self.devices = {}
+        self.health = {}
+        for host in hosts:
+            hostname, port = parse_host(host)
+            self.health[host] = DeviceHealth()
+            self.devices[host] = AsyncRemoteControl(hostname, port=port, timeout=timeout, health=self.health[host])
+        # clock readings of each device, see sync_clocks()
+        self.clocks = dict((host, ClockEstimator()) for host in self.devices)
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.metrics = {}
+
+    async def connect(self):
+        """
+        Connects to all devices at once
+        :return: dict host -> None or the connection error
+        """
+        return await self._gather(lambda host, remote: remote.connect(), reconnect=False)
+
+    def device_status(self):
+        """
+        :return: dict host -> dict with connected and the DeviceHealth status of the device
+        """
+        return dict(
+            (host, dict(self.health[host].status(), connected=remote.connected))
+            for host, remote in self.devices.items()
+        )
+
+    async def close(self):
+        await asyncio.gather(*(remote.close() for remote in self.devices.values()))
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start_video(self):
+        """
+        Starts recording on all devices concurrently
+        :return: dict host -> dict with phase_ns, avg_duration_ns and exposure_time_ns
+        """
+        timings = {}
+        results = await self._gather(lambda host, remote: self._timed(host, remote.start_video(), timings))
+        self.metrics['start'] = self._round_metrics(timings)
+        return dict(
+            (host, result if isinstance(result, BaseException) else {
+                'phase_ns': result[0],
+                'avg_duration_ns': result[1],
+                'exposure_time_ns': result[2],
+            })
+            for host, result in results.items()
+        )
+
+    async def stop_video(self):
+        """
+        Stops recording on all devices concurrently
+        :return: dict host -> None or the error
+        """
+        timings = {}
+        results = await self._gather(lambda host, remote: self._timed(host, remote.stop_video(), timings))
+        self.metrics['stop'] = self._round_metrics(timings)
+        return results
+
+    async def sync_clocks(self, rounds=SYNC_ROUNDS, interval_s=SYNC_INTERVAL_S):
+        """
+        Reads the clock of every device rounds times, devices concurrently, and fits
+        their models (src/clock_sync.py). Readings add up across calls: syncing before
+        and after a recording fits the drift over it. The models map every phone's
+        IMU and frame timestamps to host_clock_ns, the rig's common timebase
+        :return: dict host -> ClockModel, None if the server doesn't implement the clock request
+        """
+        async def read(host, remote):
+            estimator = self.clocks[host]
+            for i in range(rounds):
+                if i:
+                    await asyncio.sleep(interval_s)
+                sent_ns = host_clock_ns()
+                phone_ns = await remote.get_clock()
+                received_ns = host_clock_ns()
+                if phone_ns is None:
+                    return None
+                estimator.add(sent_ns, phone_ns, received_ns)
+            return estimator.model()
+
+        return await self._gather(read)
+
+    async def download_videos(self, dest_dir):
+        """
+        Downloads the last video of every device into dest_dir/<host>/,
+        at most max_concurrent_downloads at a time
+        :return: dict host -> saved video path or the error
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+        durations = {}
+
+        async def download(host, remote):
+            device_dir = os.path.join(dest_dir, host.replace(':', '_'))
+            os.makedirs(device_dir, exist_ok=True)
+            async with semaphore:
+                start = time.perf_counter()
+                path = await remote.get_video(dest=device_dir)
+                durations[host] = time.perf_counter() - start
+            return path
+
+        start = time.perf_counter()
+        results = await self._gather(download)
+        wall_s = time.perf_counter() - start
+
+        sizes = dict(
+            (host, os.path.getsize(path)) for host, path in results.items() if not isinstance(path, BaseException)
+        )
+        total_bytes = sum(sizes.values())
+        self.metrics['download'] = {
+            'total_bytes': total_bytes,
+            'wall_s': wall_s,
+            'aggregate_mb_s': total_bytes / 1e6 / wall_s if wall_s else 0.0,
+            'device_mb_s': dict((host, sizes[host] / 1e6 / durations[host]) for host in sizes if durations[host]),
+        }
+        return results
+
+    async def _gather(self, operation, reconnect=True):
+        hosts = list(self.devices)
+        results = await asyncio.gather(
+            *(self._guarded(host, operation, reconnect) for host in hosts), return_exceptions=True
+        )
+        return dict(zip(hosts, results))
+
+    async def _guarded(self, host, operation, reconnect):
+        health = self.health[host]
+        remote = self.devices[host]
+        health.check(host)
+        try:
+            if reconnect and not remote.connected:
+                # closed by an earlier failure
+                await remote.connect()
+            result = await operation(host, remote)
+        except TRANSIENT_ERRORS as e:
+            health.record_failure(e)
+            raise
+        except Exception:
+            # an error response: the phone is reachable
+            health.record_success()
+            raise
+        health.record_success()
+        return result
+
+    async def _timed(self, host, coro, timings):
+        sent_ns = time.perf_counter_ns()
+        result = await coro
+        timings[host] = (sent_ns, time.perf_counter_ns())
+        return result
+
+    @staticmethod
+    def _round_metrics(timings):
+        """
+        :return: dict with the skew between the first and the last request sent,
+        the spread of the responses and each device's round trip latency (ns, host clock)
+        """
+        if not timings:
+            return {}
+        sent = [t[0] for t in timings.values()]
+        done = [t[1] for t in timings.values()]
+        return {
+            'skew_ns': max(sent) - min(sent),
+            'response_spread_ns': max(done) - min(done),
+            'latency_ns': dict((host, t[1] - t[0]) for host, t in timings.items()),
+        }
@@ -0,0 +1,130 @@
+import contextlib
+import os
+import secrets
+
+# Mode temporary files are created with, the kernel applies the umask as open() does.
+# Unlike mkstemp's 0600, the published file gets the permissions of any other new file
+FILE_MODE = 0o666
+# Attempts to find a free random temporary name before giving up
+TMP_NAME_ATTEMPTS = 100
+
+
+def unique_path(path):
+    """
+    :param path: (str) desired file path
+    :return: (str) path itself if it is free, otherwise "<base>_<n><ext>" with the first free n
+    """
+    path = os.fspath(path)
+    base, ext = os.path.splitext(path)
+    candidate = path
+    n = 1
+    while os.path.exists(candidate):
+        candidate = '%s_%d%s' % (base, n, ext)
+        n += 1
+    return candidate
+
+
+def reserved_tmp_path(path):
+    """
+    :return: (str) the hidden temporary file reserve_path() creates for path
+    """
+    directory, name = os.path.split(os.fspath(path))
+    return os.path.join(directory, '.%s.part' % name)
+
+
+def reserve_path(path):
+    """
+    unique_path() that holds on to the name until the file is written: it
+    creates the hidden temporary file of the name exclusively, so concurrent
+    callers never pick the same path. Write the file with
+    atomic_file(path, reserved_tmp_path(path)), or remove the temporary file
+    to release the name
+    :param path: (str) desired file path
+    :return: (str) the reserved path
+    """
+    path = os.fspath(path)
+    base, ext = os.path.splitext(path)
+    n = 0
+    while True:
+        candidate = path if n == 0 else '%s_%d%s' % (base, n, ext)
+        n += 1
+        if os.path.exists(candidate):
+            continue
+        try:
+            os.close(os.open(reserved_tmp_path(candidate), os.O_CREAT | os.O_EXCL | os.O_WRONLY, FILE_MODE))
+        except FileExistsError:
+            continue
+        if os.path.exists(candidate):
+            # published between the checks
+            os.remove(reserved_tmp_path(candidate))
+            continue
+        return candidate
+
+
+def _create_tmp(path):
+    """
+    Creates a hidden temporary file with a random name next to path
+    :return: Tuple (fd open for writing, temporary file path)
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    for _ in range(TMP_NAME_ATTEMPTS):
+        tmp_path = os.path.join(directory, '.%s.%s.part' % (name, secrets.token_hex(4)))
+        try:
+            return os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, FILE_MODE), tmp_path
+        except FileExistsError:
+            continue
+    raise FileExistsError('No free temporary file name for %s' % path)
+
+
+@contextlib.contextmanager
+def atomic_file(path, tmp_path=None):
+    """
+    Opens a hidden temporary file next to path for binary writing and renames
+    it to path once the block completes, so readers never see a partial file.
+    On error the temporary file is removed
+    :param path: (str) final file path
+    :param tmp_path: (str) optional, an existing temporary file to write instead of a new one,
+    e.g. reserved_tmp_path() of a reserve_path(). It is kept on error, so retries keep the reservation
+    """
+    path = os.fspath(path)
+    if tmp_path is None:
+        fd, tmp_path = _create_tmp(path)
+        owned = True
+    else:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_TRUNC)
+        owned = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if owned:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def video_sink(dest, filename):
+    """
+    Resolves the dest argument of get_video into a write function.
+    Yields Tuple (write, saved_as) where write takes each received chunk
+    :param dest: None - save as filename in the current directory;
+    a directory - save as filename in it; any other path - save there.
+    Paths are written atomically (see atomic_file).
+    A binary file object or a callable receive the chunks directly.
+    A callable must consume the chunk before returning: the buffer is reused
+    :param filename: (str) video filename reported by the smartphone
+    """
+    if dest is None or isinstance(dest, (str, os.PathLike)):
+        path = filename if dest is None else os.fspath(dest)
+        if os.path.isdir(path):
+            path = os.path.join(path, filename)
+        with atomic_file(path) as f:
+            yield f.write, path
+    elif hasattr(dest, 'write'):
+        yield dest.write, filename
+    elif callable(dest):
+        yield dest, filename
+    else:
+        raise TypeError('Unsupported video destination: %r' % (dest,))
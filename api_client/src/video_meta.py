@@ -0,0 +1,185 @@
+import collections
+import os
+import stat
+import struct
+import threading
+import time
+
+MAX_CACHED_VIDEOS = 1024
+# Cached entries are re-validated with a stat() once they are older than this
+REVALIDATE_AFTER_S = 5.0
+
+
+def _boxes(f, start, end):
+    """
+    Iterates the MP4 boxes stored between start and end
+    :return: generator of Tuple (box type, payload start, box end)
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            return
+        yield box_type, pos + header_size, pos + size
+        pos += size
+
+
+def _child(f, parent, box_type):
+    for child_type, start, end in _boxes(f, *parent):
+        if child_type == box_type:
+            return start, end
+    return None
+
+
+def _video_codec(f, trak):
+    mdia = _child(f, trak, b'mdia')
+    hdlr = mdia and _child(f, mdia, b'hdlr')
+    if not hdlr:
+        return None
+    f.seek(hdlr[0] + 8)
+    if f.read(4) != b'vide':
+        return None
+    stsd = None
+    minf = _child(f, mdia, b'minf')
+    stbl = minf and _child(f, minf, b'stbl')
+    if stbl:
+        stsd = _child(f, stbl, b'stsd')
+    if not stsd:
+        return None
+    # full box header and entry count, then the first sample entry's size and format
+    f.seek(stsd[0] + 12)
+    return f.read(4).decode('ascii', 'replace')
+
+
+def probe_mp4(path):
+    """
+    Reads duration and video codec from the MP4 headers, seeking over the media data
+    :param path: (str) video path
+    :return: Tuple (duration in seconds or None, codec fourcc such as "avc1" or None)
+    """
+    duration_s = None
+    codec = None
+    with open(path, 'rb') as f:
+        try:
+            moov = None
+            for box_type, start, end in _boxes(f, 0, os.fstat(f.fileno()).st_size):
+                if box_type == b'moov':
+                    moov = start, end
+                    break
+            if moov is None:
+                return None, None
+            for box_type, start, end in _boxes(f, *moov):
+                if box_type == b'mvhd':
+                    f.seek(start)
+                    if f.read(1) == b'\x01':
+                        f.seek(start + 20)
+                        timescale, duration = struct.unpack('>IQ', f.read(12))
+                    else:
+                        f.seek(start + 12)
+                        timescale, duration = struct.unpack('>II', f.read(8))
+                    if timescale:
+                        duration_s = duration / timescale
+                elif box_type == b'trak' and codec is None:
+                    codec = _video_codec(f, (start, end))
+        except struct.error:
+            # truncated or not an MP4 file
+            pass
+    return duration_s, codec
+
+
+class VideoMetadata:
+    def __init__(self, path, stat_result, duration_s, codec):
+        self.path = path
+        self.stat_result = stat_result
+        self.duration_s = duration_s
+        self.codec = codec
+        self.checked_at = time.monotonic()
+
+    @property
+    def size(self):
+        return self.stat_result.st_size
+
+    @property
+    def mtime(self):
+        return self.stat_result.st_mtime
+
+    def as_dict(self):
+        return {
+            'size': self.size,
+            'mtime': self.mtime,
+            'duration_s': self.duration_s,
+            'codec': self.codec,
+        }
+
+
+def _same_file(a, b):
+    return (a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_ino, b.st_size, b.st_mtime_ns)
+
+
+class VideoMetadataCache:
+    """
+    LRU cache of video metadata (resolved path, stat result, duration, codec).
+    A video is probed once; afterwards a single stat() every revalidate_after
+    seconds detects replaced files, so repeated playback and seeking cost no
+    filesystem access in between.
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_VIDEOS, revalidate_after=REVALIDATE_AFTER_S):
+        self.max_entries = max_entries
+        self.revalidate_after = revalidate_after
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        """
+        :param path: (str) video path
+        :return: VideoMetadata of the file
+        :raises FileNotFoundError: if the file doesn't exist
+        :raises IsADirectoryError: if the path isn't a regular file
+        """
+        key = os.fspath(path)
+        with self._lock:
+            meta = self._entries.get(key)
+            if meta is not None:
+                self._entries.move_to_end(key)
+                if time.monotonic() - meta.checked_at < self.revalidate_after:
+                    self.hits += 1
+                    return meta
+        try:
+            meta = self._load(key, meta)
+        except OSError:
+            with self._lock:
+                self._entries.pop(key, None)
+            raise
+        with self._lock:
+            self._entries[key] = meta
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return meta
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(os.fspath(path), None)
+
+    def _load(self, key, cached):
+        resolved = os.path.realpath(key)
+        stat_result = os.stat(resolved)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise IsADirectoryError('Not a file: %s' % resolved)
+        if cached is not None and cached.path == resolved and _same_file(cached.stat_result, stat_result):
+            self.hits += 1
+            cached.checked_at = time.monotonic()
+            return cached
+        self.misses += 1
+        duration_s, codec = probe_mp4(resolved)
+        return VideoMetadata(resolved, stat_result, duration_s, codec)
@@ -0,0 +1,332 @@
+import collections
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Read size when streaming files into the archive
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Already compressed formats are stored, everything else (csv, IMU columns, json) is deflated
+STORED_EXTENSIONS = ('.mp4', '.mov', '.jpg', '.jpeg', '.png', '.zip', '.npz', '.gz')
+DEFLATE_LEVEL = 6
+# Sizes and offsets from this value on need the ZIP64 extensions
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# Header field value meaning "see the ZIP64 record"
+_MAX_32 = 0xFFFFFFFF
+_MAX_16 = 0xFFFF
+# CRCs and deflated sizes remembered per (path, size, mtime), so resumed and repeated exports don't reread files
+MAX_CACHED_CHECKSUMS = 4096
+
+STORED = 0
+DEFLATED = 8
+# data descriptor after the data (CRC computed while streaming), UTF-8 names
+FLAGS = 0x08 | 0x800
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+DESCRIPTOR = struct.Struct('<IIII')
+DESCRIPTOR64 = struct.Struct('<IIQQ')
+END_RECORD = struct.Struct('<IHHHHIIH')
+END_RECORD64 = struct.Struct('<IQHHIIQQQQ')
+END_LOCATOR64 = struct.Struct('<IIQI')
+
+_checksums = collections.OrderedDict()
+_checksums_lock = threading.Lock()
+
+
+def _dos_time(mtime):
+    """
+    :return: Tuple (MS-DOS time, MS-DOS date) of a timestamp, 1980 at the earliest
+    """
+    t = time.localtime(max(mtime, 315532800))
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _field32(value):
+    return value if value < ZIP64_LIMIT else _MAX_32
+
+
+def _cached(key):
+    with _checksums_lock:
+        value = _checksums.get(key)
+        if value is not None:
+            _checksums.move_to_end(key)
+        return value
+
+
+def _cache(key, value):
+    with _checksums_lock:
+        _checksums[key] = value
+        _checksums.move_to_end(key)
+        while len(_checksums) > MAX_CACHED_CHECKSUMS:
+            _checksums.popitem(last=False)
+
+
+class ZipEntry:
+    """
+    A file of the archive: a file on disk, or small generated contents (data)
+    """
+
+    def __init__(self, name, path=None, data=None, mtime=None, method=None):
+        """
+        Args:
+            name (str): Path inside the archive
+            path (str): File to read, if data isn't given
+            data (bytes): Contents of a generated file
+            mtime (float): Modification time, the file's by default
+            method (int): STORED or DEFLATED, chosen from the extension by default
+        """
+        self.name = name
+        self.path = path
+        self.data = data
+        if data is None:
+            stat = os.stat(path)
+            self.size = stat.st_size
+            self._key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+            mtime = stat.st_mtime if mtime is None else mtime
+        else:
+            self.size = len(data)
+            self._key = None
+        self.mtime = time.time() if mtime is None else mtime
+        if method is None:
+            method = STORED if name.lower().endswith(STORED_EXTENSIONS) else DEFLATED
+        self.method = method
+        self._crc = None
+        self.compressed_size = self.size if method == STORED else None
+
+    def prepare(self):
+        """
+        Deflated entries are compressed once to learn their size, which the layout needs
+        """
+        if self.method == DEFLATED and self.compressed_size is None:
+            cached = self._key and _cached(self._key + (DEFLATE_LEVEL,))
+            if not cached:
+                crc, compressed_size = 0, 0
+                for raw, compressed in self._deflate():
+                    crc = zlib.crc32(raw, crc)
+                    compressed_size += len(compressed)
+                cached = (crc, compressed_size)
+                if self._key:
+                    _cache(self._key + (DEFLATE_LEVEL,), cached)
+            self._crc, self.compressed_size = cached
+
+    @property
+    def zip64(self):
+        return self.size >= ZIP64_LIMIT or self.compressed_size >= ZIP64_LIMIT
+
+    def crc(self):
+        """
+        :return: (int) CRC-32 of the contents, reading the file if it isn't known yet
+        """
+        if self._crc is None:
+            self._crc = self._key and _cached(self._key)
+        if self._crc is None:
+            crc = 0
+            for chunk in self._read_raw(0, self.size):
+                crc = zlib.crc32(chunk, crc)
+            self._set_crc(crc)
+        return self._crc
+
+    def iter_data(self, start, end):
+        """
+        Yields the stored or compressed bytes [start, end) of the entry. A stored
+        file read to its end has its CRC computed on the way, including the part
+        before start if needed
+        """
+        if self.method == DEFLATED:
+            position = 0
+            for _, compressed in self._deflate():
+                chunk_end = position + len(compressed)
+                if chunk_end > start and position < end:
+                    yield compressed[max(start - position, 0):end - position]
+                position = chunk_end
+                if position >= end:
+                    return
+            return
+        if self._crc is None:
+            self._crc = self._key and _cached(self._key)
+        track = self._crc is None and end == self.size
+        crc = 0
+        if track and start:
+            for chunk in self._read_raw(0, start):
+                crc = zlib.crc32(chunk, crc)
+        for chunk in self._read_raw(start, end):
+            if track:
+                crc = zlib.crc32(chunk, crc)
+            yield chunk
+        if track:
+            self._set_crc(crc)
+
+    def _set_crc(self, crc):
+        self._crc = crc
+        if self._key:
+            _cache(self._key, crc)
+
+    def _read_raw(self, start, end):
+        if self.data is not None:
+            yield self.data[start:end]
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(ZIP_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise RuntimeError('File changed during the export: %s' % self.path)
+                remaining -= len(chunk)
+                yield chunk
+
+    def _deflate(self):
+        """
+        Yields Tuple (raw chunk, its compressed bytes), the same bytes every time
+        """
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+        for chunk in self._read_raw(0, self.size):
+            yield chunk, compressor.compress(chunk)
+        yield b'', compressor.flush()
+
+
+class ZipStream:
+    """
+    A ZIP archive generated while it is sent, from files that stay where they
+    are: no temporary file, memory use bounded by the read size. The layout is
+    computed up front, so the total size is known and any byte range can be
+    produced on its own, which lets clients resume an interrupted download.
+    CRCs go into data descriptors after each file, so files are read once
+    while streaming; a range starting past a file whose CRC isn't cached yet
+    reads that file to compute it.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries (list): ZipEntry objects, in archive order
+        """
+        self.entries = list(entries)
+        # (start, end, kind, value) with kind 'bytes' (value: bytes), 'data' and 'descriptor' (value: ZipEntry),
+        # or 'central', the central directory, generated once the CRCs are known
+        self._segments = []
+        position = 0
+        self._offsets = []
+        for entry in self.entries:
+            entry.prepare()
+            self._offsets.append(position)
+            position = self._add(position, 'bytes', self._local_header(entry))
+            position = self._add(position, 'data', entry, entry.compressed_size)
+            position = self._add(position, 'descriptor', entry, (DESCRIPTOR64 if entry.zip64 else DESCRIPTOR).size)
+        self._central_offset = position
+        self._central_size = sum(
+            CENTRAL_HEADER.size + len(entry.name.encode()) + len(self._central_extra(entry, offset))
+            for entry, offset in zip(self.entries, self._offsets)
+        )
+        position = self._add(position, 'central', None, self._central_size)
+        position = self._add(position, 'bytes', self._end_records())
+        self.size = position
+
+    @property
+    def etag(self):
+        """
+        :return: (str) identifies the archive contents, changes if any file does
+        """
+        description = [
+            (entry.name, entry.size, entry.mtime, entry.method, entry._key[2] if entry._key else zlib.crc32(entry.data))
+            for entry in self.entries
+        ]
+        return hashlib.sha1(json.dumps(description).encode()).hexdigest()
+
+    def iter_bytes(self, start=0, end=None):
+        """
+        Yields the bytes [start, end) of the archive
+        :param start: (int) first byte
+        :param end: (int) byte after the last one, the archive size by default
+        """
+        end = self.size if end is None else end
+        for seg_start, seg_end, kind, value in self._segments:
+            if seg_end <= start or seg_start >= end:
+                continue
+            lo, hi = max(start, seg_start) - seg_start, min(end, seg_end) - seg_start
+            if kind == 'data':
+                for chunk in value.iter_data(lo, hi):
+                    yield chunk
+                continue
+            if kind == 'bytes':
+                data = value
+            elif kind == 'descriptor':
+                data = self._descriptor(value)
+            else:
+                data = b''.join(
+                    self._central_header(entry, offset) for entry, offset in zip(self.entries, self._offsets)
+                )
+            yield data[lo:hi]
+
+    def _add(self, position, kind, value, length=None):
+        length = len(value) if length is None else length
+        self._segments.append((position, position + length, kind, value))
+        return position + length
+
+    @staticmethod
+    def _local_header(entry):
+        name = entry.name.encode()
+        extra = b''
+        sizes = 0
+        if entry.zip64:
+            # sizes follow in the ZIP64 data descriptor
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            sizes = _MAX_32
+        mod_time, mod_date = _dos_time(entry.mtime)
+        return LOCAL_HEADER.pack(
+            0x04034b50, 45 if entry.zip64 else 20, FLAGS, entry.method, mod_time, mod_date,
+            0, sizes, sizes, len(name), len(extra)
+        ) + name + extra
+
+    @staticmethod
+    def _descriptor(entry):
+        if entry.zip64:
+            return DESCRIPTOR64.pack(0x08074b50, entry.crc(), entry.compressed_size, entry.size)
+        return DESCRIPTOR.pack(0x08074b50, entry.crc(), entry.compressed_size, entry.size)
+
+    @staticmethod
+    def _central_extra(entry, offset):
+        values = []
+        if entry.size >= ZIP64_LIMIT:
+            values.append(entry.size)
+        if entry.compressed_size >= ZIP64_LIMIT:
+            values.append(entry.compressed_size)
+        if offset >= ZIP64_LIMIT:
+            values.append(offset)
+        if not values:
+            return b''
+        return struct.pack('<HH%dQ' % len(values), 1, 8 * len(values), *values)
+
+    def _central_header(self, entry, offset):
+        name = entry.name.encode()
+        extra = self._central_extra(entry, offset)
+        version = 45 if extra else 20
+        mod_time, mod_date = _dos_time(entry.mtime)
+        return CENTRAL_HEADER.pack(
+            0x02014b50, (3 << 8) | version, version, FLAGS, entry.method, mod_time, mod_date, entry.crc(),
+            _field32(entry.compressed_size), _field32(entry.size), len(name), len(extra),
+            0, 0, 0, 0o100644 << 16, _field32(offset)
+        ) + name + extra
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if count >= ZIP64_COUNT_LIMIT or self._central_offset >= ZIP64_LIMIT or self._central_size >= ZIP64_LIMIT:
+            end64_offset = self._central_offset + self._central_size
+            records += END_RECORD64.pack(
+                0x06064b50, END_RECORD64.size - 12, 45, 45, 0, 0, count, count, self._central_size,
+                self._central_offset
+            )
+            records += END_LOCATOR64.pack(0x07064b50, 0, end64_offset, 1)
+        return records + END_RECORD.pack(
+            0x06054b50, 0, 0, count if count < ZIP64_COUNT_LIMIT else _MAX_16,
+            count if count < ZIP64_COUNT_LIMIT else _MAX_16,
+            _field32(self._central_size), _field32(self._central_offset), 0
+        )
@@ -0,0 +1,99 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.fake_phone import FakePhoneServer
+from src.framing import TEXT
+from src.imu_live import BLOCK, DROP_OLDEST
+from src.imu_stream import IMU_DTYPE
+from src.RemoteControl import RemoteControl
+
+IMU_RATE_HZ = 200
+WINDOW_MS = 100
+# samples of one sensor per window
+WINDOW_ROWS = WINDOW_MS * IMU_RATE_HZ // 1000
+
+
+@pytest.fixture
+def remote():
+    # answers after each window like the phone, in the line protocol (sensor_end / end markers)
+    with FakePhoneServer(imu_rate_hz=IMU_RATE_HZ, realtime_imu=True) as server:
+        remote = RemoteControl(server.address[0], port=server.address[1], framing=TEXT)
+        yield remote
+        remote.close()
+
+
+def wait_for_windows(stream, windows, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while stream.windows < windows:
+        assert time.monotonic() < deadline, 'stream stalled'
+        time.sleep(0.01)
+
+
+def test_batches(remote):
+    batches = []
+    with remote.stream_imu(True, True, False, window_ms=WINDOW_MS) as stream:
+        while sum(len(batch['accel']) for batch in batches) < 3 * WINDOW_ROWS:
+            batch = stream.get(timeout=5.0)
+            assert batch, 'no samples within 5 s'
+            batches.append(batch)
+    for batch in stream:
+        batches.append(batch)
+
+    assert all(set(batch) == {'accel', 'gyro'} for batch in batches)
+    for sensor in ('accel', 'gyro'):
+        rows = np.concatenate([batch[sensor] for batch in batches])
+        assert rows.dtype == IMU_DTYPE
+        assert len(rows) == stream.received[sensor] == stream.windows * WINDOW_ROWS
+        assert np.all(np.diff(rows['timestamp']) > 0)
+        assert stream.dropped[sensor] == 0
+
+
+def test_drop_oldest_counts_dropped(remote):
+    capacity = WINDOW_ROWS // 2
+    with remote.stream_imu(True, False, False, window_ms=WINDOW_MS, capacity=capacity, policy=DROP_OLDEST) as stream:
+        # nothing is read meanwhile
+        wait_for_windows(stream, 3)
+    received = stream.received['accel']
+    rows = stream.get()['accel']
+
+    assert received == stream.windows * WINDOW_ROWS
+    assert len(rows) == capacity
+    assert stream.dropped['accel'] == received - capacity
+    # the newest samples are kept
+    assert rows['timestamp'][-1] == max(rows['timestamp'])
+    assert np.all(np.diff(rows['timestamp']) > 0)
+
+
+def test_block_keeps_unread_samples_on_stop(remote):
+    capacity = WINDOW_ROWS // 2
+    with remote.stream_imu(True, False, False, window_ms=WINDOW_MS, capacity=capacity, policy=BLOCK) as stream:
+        # the receiver waits for the consumer with the first half window buffered
+        deadline = time.monotonic() + 10.0
+        while stream.received['accel'] == 0:
+            assert time.monotonic() < deadline, 'stream stalled'
+            time.sleep(0.01)
+        time.sleep(0.05)
+        first = stream._rings['accel']._data['timestamp'][:capacity].copy()
+    rows = stream.get()['accel']
+
+    # the samples waiting to be read weren't overwritten when the stream stopped
+    np.testing.assert_array_equal(rows['timestamp'], first)
+    assert stream.dropped['accel'] == stream.received['accel'] - capacity
+
+
+def test_close(remote):
+    stream = remote.stream_imu(True, True, False, window_ms=WINDOW_MS).start()
+    wait_for_windows(stream, 1)
+    stream.stop()
+
+    assert not stream._thread.is_alive()
+    assert stream.error is None
+    while stream.get() is not None:
+        pass
+    assert stream.get(timeout=0) is None
+    # the current window was received completely: the connection is usable again
+    accel, gyro, magnetic = remote.get_imu_arrays(WINDOW_MS, True, False, False)
+    assert len(accel) == WINDOW_ROWS
+    assert gyro is None and magnetic is None
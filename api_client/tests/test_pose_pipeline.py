@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from src.pose_pipeline import _stored_version
+
+
+@pytest.fixture
+def landmark_file(tmp_path):
+    path = tmp_path / 'video.mp4.pose.npz'
+    np.savez_compressed(
+        path, source_sha256=np.array('0' * 64), settings=np.array('key'), landmarks=np.zeros((100, 33, 4), np.float32)
+    )
+    return path
+
+
+def test_stored_version(landmark_file):
+    assert _stored_version(landmark_file) == ('0' * 64, 'key')
+
+
+@pytest.mark.parametrize('fraction', [0, 0.01, 0.5, 0.99])
+def test_truncated_file_is_stale(landmark_file, fraction):
+    # left by an interrupted run: the video must be processed again, not fail the batch
+    data = landmark_file.read_bytes()
+    landmark_file.write_bytes(data[:int(len(data) * fraction)])
+    assert _stored_version(landmark_file) == (None, None)
+
+
+def test_missing_file(tmp_path):
+    assert _stored_version(tmp_path / 'missing.pose.npz') == (None, None)
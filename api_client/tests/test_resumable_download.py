@@ -0,0 +1,105 @@
+import json
+import os
+
+import pytest
+
+from src.fake_phone import FakePhoneServer
+from src.RemoteControl import RemoteControl
+from src.resumable_download import JOURNAL_SUFFIX, PART_SUFFIX, ResumableVideoDownload, file_sha256
+
+VIDEO_SIZE = 1024 * 1024
+SEGMENT_SIZE = 64 * 1024
+
+
+def connect(server):
+    return RemoteControl(server.address[0], port=server.address[1])
+
+
+def download(server, dest_path, connections=4):
+    """
+    :return: Tuple (dest_path, sha256, bytes written by this attempt)
+    """
+    written = []
+    remote = connect(server)
+    try:
+        path, digest = ResumableVideoDownload(remote, dest_path, connections, SEGMENT_SIZE).download(written.append)
+    finally:
+        remote.close()
+    return path, digest, sum(written)
+
+
+def journal_bytes(dest_path):
+    with open(dest_path + JOURNAL_SUFFIX) as f:
+        return sum(end - start for start, end in json.load(f)['done'])
+
+
+def assert_complete(server, dest_path, digest):
+    assert digest == server.video_sha256 == file_sha256(dest_path)
+    assert not os.path.exists(dest_path + PART_SUFFIX)
+    assert not os.path.exists(dest_path + JOURNAL_SUFFIX)
+
+
+def test_parallel_ranges(tmp_path):
+    dest_path = str(tmp_path / 'video.mp4')
+    with FakePhoneServer(video_size=VIDEO_SIZE) as server:
+        path, digest, written = download(server, dest_path)
+    assert path == dest_path
+    assert written == VIDEO_SIZE
+    assert_complete(server, dest_path, digest)
+
+
+def test_resume_ranges_after_drop(tmp_path):
+    dest_path = str(tmp_path / 'video.mp4')
+    with FakePhoneServer(video_size=VIDEO_SIZE) as server:
+        written = []
+
+        def cut_after_three_segments(n_bytes):
+            written.append(n_bytes)
+            if sum(written) == 3 * SEGMENT_SIZE:
+                server.drop_after = SEGMENT_SIZE // 2
+
+        # one connection, so the segments are fetched in order and the fourth one is cut
+        remote = connect(server)
+        with pytest.raises((OSError, EOFError)):
+            ResumableVideoDownload(remote, dest_path, 1, SEGMENT_SIZE).download(cut_after_three_segments)
+        remote.close()
+        assert os.path.exists(dest_path + PART_SUFFIX)
+        done = journal_bytes(dest_path)
+        assert done == 3 * SEGMENT_SIZE
+
+        _, digest, written = download(server, dest_path)
+    assert written == VIDEO_SIZE - done
+    assert_complete(server, dest_path, digest)
+
+
+def test_resume_sequential_after_drop(tmp_path):
+    dest_path = str(tmp_path / 'video.mp4')
+    # the phone app can only send the whole video: resuming skips the part already on disk
+    with FakePhoneServer(video_size=VIDEO_SIZE, supports_ranges=False, drop_after=VIDEO_SIZE // 2) as server:
+        with pytest.raises((OSError, EOFError)):
+            download(server, dest_path)
+        done = journal_bytes(dest_path)
+        assert 0 < done <= VIDEO_SIZE // 2
+
+        _, digest, written = download(server, dest_path)
+    assert written == VIDEO_SIZE - done
+    # no checksum from the server, the digest is the file's
+    assert digest == server.video_sha256 == file_sha256(dest_path)
+    assert not os.path.exists(dest_path + JOURNAL_SUFFIX)
+
+
+def test_checksum_mismatch_restarts(tmp_path):
+    dest_path = str(tmp_path / 'video.mp4')
+    with FakePhoneServer(video_size=VIDEO_SIZE) as server:
+        expected = server.video_sha256
+        server._video_sha256 = '0' * 64
+        with pytest.raises(RuntimeError, match='Checksum mismatch'):
+            download(server, dest_path)
+        # the journal can't be trusted anymore, the video stays unpublished
+        assert not os.path.exists(dest_path + JOURNAL_SUFFIX)
+        assert not os.path.exists(dest_path)
+
+        server._video_sha256 = expected
+        _, digest, written = download(server, dest_path)
+    assert written == VIDEO_SIZE
+    assert_complete(server, dest_path, digest)
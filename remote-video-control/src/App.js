@@ -6,6 +6,7 @@ function App() {
   const [savePath, setSavePath] = useState("c:/Videos/Test Video Data");
   const [sessionId, setSessionId] = useState("project_name_and_date");
   const [host, setHost] = useState("localhost"); // Optional: make dynamic if needed
+  const [downloadStatus, setDownloadStatus] = useState("");
 
   // const [host, setHost] = useState(null);
 
@@ -63,6 +64,31 @@ function App() {
     }
   };
 
+  const followDownload = (jobId) => {
+    const events = new EventSource(`http://localhost:8000/jobs/${jobId}/events`);
+    events.onmessage = (event) => {
+      const job = JSON.parse(event.data);
+      if (job.state === "done") {
+        setDownloadStatus("Video saved to: " + job.result);
+        events.close();
+      } else if (job.state === "failed") {
+        setDownloadStatus("Download failed: " + job.error);
+        events.close();
+      } else if (job.bytes_total) {
+        const percent = (100 * job.bytes_done / job.bytes_total).toFixed(0);
+        const rate = job.rate_bytes_s ? (job.rate_bytes_s / 1e6).toFixed(1) + " MB/s" : "";
+        const eta = job.eta_s != null ? ", ETA " + job.eta_s.toFixed(0) + " s" : "";
+        setDownloadStatus(`Downloading: ${percent}% ${rate}${eta}`);
+      } else {
+        setDownloadStatus("Download " + job.state);
+      }
+    };
+    events.onerror = () => {
+      setDownloadStatus("Lost connection to download progress");
+      events.close();
+    };
+  };
+
   const stopRecording = async () => {
     try {
       if (!sessionId) {
@@ -74,7 +100,8 @@ function App() {
         name: filename,
         save_path: savePath
       });
-      alert("Video saved to: " + res.data.path);
+      // The video is downloaded in the background, follow its progress
+      followDownload(res.data.job_id);
 
       // Optionally extract the filename from the saved path if needed
       // const extractedFilename = res.data.path.split("\\").pop(); // for Windows paths
@@ -127,14 +154,40 @@ function VideoSelector({ sessionId, savePath }) {
     fetchVideos();
   }, [sessionId, savePath]);
 
-  const videoUrl =
+  const videoQuery =
     selectedVideo && selectedVideo !== "null"
-      ? `http://localhost:8000/videos?root_path=${encodeURIComponent(
+      ? `root_path=${encodeURIComponent(
           savePath
         )}&session_id=${encodeURIComponent(
           sessionId
         )}&video_name=${encodeURIComponent(selectedVideo)}`
       : null;
+  // the low-bitrate proxy if it is ready when the video is selected, the original otherwise.
+  // The choice is made once per selection, so the player's range requests stay on one file
+  const [source, setSource] = useState(null);
+  useEffect(() => {
+    setSource(null);
+    if (!videoQuery) return;
+    let cancelled = false;
+    axios
+      .get(`http://localhost:8000/media-info?${videoQuery}`)
+      .then((res) => res.data.state === "ready" ? "proxy" : "original")
+      .catch((err) => {
+        console.error("Failed to fetch media info", err);
+        return "original";
+      })
+      .then((variant) => {
+        if (!cancelled) setSource({ query: videoQuery, variant });
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [videoQuery]);
+  const videoUrl =
+    source && source.query === videoQuery
+      ? `http://localhost:8000/videos?${videoQuery}&variant=${source.variant}`
+      : null;
+  const posterUrl = videoQuery ? `http://localhost:8000/poster?${videoQuery}` : null;
 
   return (
     <div>
@@ -160,6 +213,7 @@ function VideoSelector({ sessionId, savePath }) {
         <video
           key={selectedVideo}
           src={videoUrl}
+          poster={posterUrl}
           controls
           style={{
             width: "640px",
@@ -233,6 +287,7 @@ function VideoSelector({ sessionId, savePath }) {
       <button onClick={endSession} style={{ marginLeft: "1rem" }}>
         End Session
       </button>
+      {downloadStatus && <div style={{ marginTop: "0.5rem" }}>{downloadStatus}</div>}
       <VideoSelector sessionId={sessionId} savePath={savePath} />
     </div>
   </div>